@@ -0,0 +1,37 @@
+import fastapi as fa
+
+import core.dependencies
+from core.enums import PermissionsNamesEnum
+from core.security import permissions
+from services.auth_manager.auth_manager import principals_in_flight, users_in_flight, \
+    verifications_in_flight
+from services.cache.circuit_breaker import redis_circuit_breaker
+from services.cache.local_cache import revoked_sessions_cache, verified_tokens_cache
+from services.cache.roles_catalog import roles_catalog
+from services.oauth import user_info_in_flight
+
+router = fa.APIRouter()
+
+
+@router.get('/cache')
+@permissions(required=[PermissionsNamesEnum.all_of_all])
+async def cache_metrics(
+):
+    """
+    per-process cache metrics, they don't depend on redis, only token verification does,
+    so while it is down they are available with AUTH_DEGRADED_POLICY=accept_signed
+    """
+    return {
+        'redis_circuit_breaker': redis_circuit_breaker.stats(),
+        'verified_tokens_cache': verified_tokens_cache.stats(),
+        'revoked_sessions_cache': revoked_sessions_cache.stats(),
+        'roles_catalog': roles_catalog.stats(),
+        'near_cache': None if core.dependencies.near_cache is None else core.dependencies.near_cache.stats(),
+        # lookups which shared in-flight lookup instead of making their own
+        'coalesced': {
+            'verifications': verifications_in_flight.coalesced,
+            'principals': principals_in_flight.coalesced,
+            'users': users_in_flight.coalesced,
+            'oauth_user_info': user_info_in_flight.coalesced,
+        },
+    }
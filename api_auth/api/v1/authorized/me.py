@@ -2,49 +2,66 @@ import fastapi as fa
 import sqlalchemy as sa
 
 from core.dependencies import (
+    auth_manager_dependency,
+    get_current_principal_dependency,
     get_current_user_dependency,
+    invalidation_bus_dependency,
+    redis_cache_dependency,
     sql_alchemy_repo_dependency,
     verified_token_schema_dependency,
     pagination_params_dependency
 )
 from core.enums import SessionOrderByEnum, OrderEnum
+from core.security import permissions
 from db.models.session import SessionModel
 from db.models.user import UserModel
 from db.repository import SqlAlchemyRepositoryAsync
 from db.serializers.permission import PermissionReadSerializer
 from db.serializers.session import SessionReadSerializer, PaginatedSessionsSerializer
-from db.serializers.token import TokenReadSchema
-from db.serializers.user import UserUpdateSerializer, UserUpdatePasswordSerializer, UserReadSerializer
+from db.serializers.token import TokenClaims
+from db.serializers.user import (
+    UserPrincipalSerializer,
+    UserReadSerializer,
+    UserUpdatePasswordSerializer,
+    UserUpdateSerializer,
+)
+from services.auth_manager.auth_manager import AuthManager
+from services.cache.cache import RedisCache
+from services.cache.invalidation_bus import InvalidationBus
+from services.cache.permissions_epochs import permissions_epochs
 
 router = fa.APIRouter()
 
 
 @router.get("/sessions-active",
             response_model=list[SessionReadSerializer])
+@permissions(required=[])
 async def me_login_history(
-        current_user: UserModel = fa.Depends(get_current_user_dependency),
+        current_principal: UserPrincipalSerializer = fa.Depends(get_current_principal_dependency),
 ):
-    return current_user.active_sessions
+    return current_principal.active_sessions
 
 
 @router.get("/",
             response_model=UserReadSerializer)
+@permissions(required=[])
 async def me(
-        current_user: UserModel = fa.Depends(get_current_user_dependency),
+        current_principal: UserPrincipalSerializer = fa.Depends(get_current_principal_dependency),
 ):
-    return current_user
+    return current_principal
 
 
 @router.get("/sessions",
             response_model=PaginatedSessionsSerializer)
+@permissions(required=[])
 async def me_sessions(
-        current_user: UserModel = fa.Depends(get_current_user_dependency),
+        current_principal: UserPrincipalSerializer = fa.Depends(get_current_principal_dependency),
         repo: SqlAlchemyRepositoryAsync = fa.Depends(sql_alchemy_repo_dependency),
         order_by: SessionOrderByEnum = SessionOrderByEnum.created_at,
         order: OrderEnum = OrderEnum.desc,
         pagination_params: dict = fa.Depends(pagination_params_dependency),
 ):
-    sessions_select = sa.select(SessionModel).where(SessionModel.user_uuid == current_user.uuid)
+    sessions_select = sa.select(SessionModel).where(SessionModel.user_uuid == current_principal.uuid)
     count_statement = sa.select(sa.func.count()).select_from(sessions_select.alias())
     total_sessions = (await repo.session.execute(count_statement)).scalar_one()
     paginated_sessions_select = await repo.get_paginated_select(SessionModel, sessions_select, order_by, order,
@@ -57,29 +74,38 @@ async def me_sessions(
 @router.get("/permissions",
             response_model=list[PermissionReadSerializer],
             )
+@permissions(required=[])
 async def me_permissions(
-        current_user: UserModel = fa.Depends(get_current_user_dependency)
+        current_principal: UserPrincipalSerializer = fa.Depends(get_current_principal_dependency)
 ):
-    return current_user.permissions
+    return current_principal.permissions
 
 
 @router.put("/update-credentials",
             response_model=UserReadSerializer)
+@permissions(required=[])
 async def me_update_credentials(
         user_ser: UserUpdateSerializer,
         repo: SqlAlchemyRepositoryAsync = fa.Depends(sql_alchemy_repo_dependency),
-        current_user: UserModel = fa.Depends(get_current_user_dependency)
+        current_user: UserModel = fa.Depends(get_current_user_dependency),
+        redis_cache: RedisCache = fa.Depends(redis_cache_dependency),
+        invalidation_bus: InvalidationBus = fa.Depends(invalidation_bus_dependency),
 ):
     user = await repo.update(current_user, user_ser)
+    # email is put to tokens, tokens of user are stale
+    await permissions_epochs.bump_user_epoch(redis_cache, invalidation_bus, user.uuid)
     return user
 
 
 @router.put("/update-password",
             response_model=UserReadSerializer)
+@permissions(required=[])
 async def me_update_password(
         user_ser: UserUpdatePasswordSerializer,
         repo: SqlAlchemyRepositoryAsync = fa.Depends(sql_alchemy_repo_dependency),
-        access_token_schema: TokenReadSchema = fa.Depends(verified_token_schema_dependency),
+        access_token_schema: TokenClaims = fa.Depends(verified_token_schema_dependency),
+        auth_manager: AuthManager = fa.Depends(auth_manager_dependency),
 ):
     user = await user_ser.update_password(repo, access_token_schema.sub)
+    await auth_manager.invalidate_principal(access_token_schema.sub)
     return user
@@ -1,11 +1,15 @@
 import fastapi as fa
 
-from core.dependencies import sql_alchemy_repo_dependency
-from core.enums import PermissionsNamesEnum, ResponseDetailEnum
+from core.dependencies import invalidation_bus_dependency, redis_cache_dependency, sql_alchemy_repo_dependency
+from core.enums import InvalidationEventsEnum, PermissionsNamesEnum, ResponseDetailEnum
 from core.security import permissions
 from db.models.role import RoleModel
 from db.repository import SqlAlchemyRepositoryAsync
 from db.serializers.role import RoleReadSerializer, RoleUpdateSerializer
+from services.cache.cache import RedisCache
+from services.cache.invalidation_bus import InvalidationBus
+from services.cache.permissions_epochs import permissions_epochs
+from services.cache.roles_catalog import roles_catalog
 
 router = fa.APIRouter()
 
@@ -14,9 +18,9 @@ router = fa.APIRouter()
             response_model=list[RoleReadSerializer])
 @permissions(required=[PermissionsNamesEnum.all_of_all])
 async def roles_list(
-        repo: SqlAlchemyRepositoryAsync = fa.Depends(sql_alchemy_repo_dependency),
 ):
-    return await repo.get_all(RoleModel)
+    await roles_catalog.ensure_fresh()
+    return list(roles_catalog.roles_by_uuid.values())
 
 
 @router.put("/{id}",
@@ -26,9 +30,13 @@ async def roles_update(
         id: str,
         role_ser: RoleUpdateSerializer,
         repo: SqlAlchemyRepositoryAsync = fa.Depends(sql_alchemy_repo_dependency),
+        redis_cache: RedisCache = fa.Depends(redis_cache_dependency),
+        invalidation_bus: InvalidationBus = fa.Depends(invalidation_bus_dependency),
 ):
     role = await repo.get(RoleModel, id=id)
     role = await repo.update(role, role_ser)
+    await invalidation_bus.publish(InvalidationEventsEnum.roles_updated, [id])
+    await permissions_epochs.bump_role_epoch(redis_cache, invalidation_bus, role.uuid)
     return role
 
 
@@ -37,6 +45,10 @@ async def roles_update(
 async def roles_delete(
         id: str,
         repo: SqlAlchemyRepositoryAsync = fa.Depends(sql_alchemy_repo_dependency),
+        redis_cache: RedisCache = fa.Depends(redis_cache_dependency),
+        invalidation_bus: InvalidationBus = fa.Depends(invalidation_bus_dependency),
 ):
-    await repo.remove(RoleModel, id)
+    role = await repo.remove(RoleModel, id)
+    await invalidation_bus.publish(InvalidationEventsEnum.roles_deleted, [id])
+    await permissions_epochs.bump_role_epoch(redis_cache, invalidation_bus, role.uuid)
     return {'detail': ResponseDetailEnum.ok}
@@ -1,20 +1,28 @@
 import secrets
+import time
 from copy import copy
+from email.utils import formatdate
 from typing import Annotated
 
 import fastapi as fa
 from fastapi.security import OAuth2PasswordRequestForm
 
+from core import config
 from core.dependencies import auth_manager_dependency, sql_alchemy_repo_dependency
-from core.enums import ResponseDetailEnum, OAuthTypesEnum
-from core.exceptions import UnauthorizedException
+from core.enums import ResponseDetailEnum, OAuthTypesEnum, TokenTypesEnum
+from core.exceptions import BadRequestException, UnauthorizedException
 from core.security import generate_password
 from db.models.social_account import SocialAccountModel
 from db.models.user import UserModel
 from db.repository import SqlAlchemyRepositoryAsync
-from db.serializers.session import SessionFromRequestSchema
+from db.serializers.session import SessionFingerprint, SessionFromRequestSchema
 from db.serializers.social_account import SocialAccountCreateSerializer
-from db.serializers.token import TokenPairEncodedSerializer, TokenReadSchema
+from db.serializers.token import (
+    TokenPairEncodedSerializer,
+    TokenReadSchema,
+    TokenVerifySchema,
+    TokenVerifiedSerializer
+)
 from db.serializers.user import UserLoginSchema, UserCreateSerializer, UserReadSerializer, UserLoginOAuthSchema
 from services.auth_manager.auth_manager import AuthManager
 from services.oauth import get_oauth_token, get_user_info_oauth, get_redirect_uri_with_state, get_user_data
@@ -65,14 +73,7 @@ async def auth_refresh_access_token(
         refresh_token: str = fa.Body(...),
         auth_manager: AuthManager = fa.Depends(auth_manager_dependency),
 ):
-    session_from_request = SessionFromRequestSchema(
-        useragent=request.headers.get("user-agent"),
-        ip=request.headers.get('X-Forwarded-For'),
-    )
-    token_schema = await auth_manager.get_verified_token_schema(refresh_token, session_from_request)
-    if token_schema is None:
-        raise UnauthorizedException
-    token_pair_encoded_ser = await auth_manager.refresh(refresh_token)
+    token_pair_encoded_ser = await auth_manager.refresh(refresh_token, SessionFingerprint.from_request(request))
     return token_pair_encoded_ser
 
 
@@ -88,14 +89,67 @@ async def auth_verify_access_token(
         access_token: str = fa.Body(...),
         auth_manager: AuthManager = fa.Depends(auth_manager_dependency),
 ):
-    session_from_request = SessionFromRequestSchema(
-        useragent=useragent,
-        ip=ip
-    )
-    token_schema = await auth_manager.get_verified_token_schema(access_token, session_from_request)
+    token_schema = await auth_manager.get_verified_token_schema(access_token, SessionFingerprint(useragent, ip))
     if token_schema is None:
         raise UnauthorizedException
-    return token_schema
+    return token_schema.to_schema()
+
+
+@router.get('/verify',
+            status_code=fa.status.HTTP_204_NO_CONTENT,
+            responses={
+                fa.status.HTTP_204_NO_CONTENT: {'detail': ResponseDetailEnum.ok},
+                fa.status.HTTP_401_UNAUTHORIZED: {'detail': ResponseDetailEnum.unauthorized},
+            })
+async def auth_verify(
+        request: fa.Request,
+        auth_manager: AuthManager = fa.Depends(auth_manager_dependency),
+):
+    """
+    header-only verification for nginx auth_request:
+    - access token is read from Authorization, session data from User-Agent and X-Forwarded-For headers
+    - 204 with user headers is cached by nginx until token exp, but no longer than AUTH_REQUEST_CACHE_MAX_AGE_SEC
+    - 401 is not cached, refresh token gets 401 as well
+    """
+    scheme, _, access_token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not access_token:
+        raise UnauthorizedException
+    token_schema = await auth_manager.get_verified_token_schema(access_token, SessionFingerprint.from_request(request))
+    if token_schema is None or token_schema.type != TokenTypesEnum.access:
+        raise UnauthorizedException
+    now = time.time()
+    max_age = max(0, min(int(token_schema.exp - now), config.AUTH_REQUEST_CACHE_MAX_AGE_SEC))
+    return fa.Response(status_code=fa.status.HTTP_204_NO_CONTENT, headers={
+        'X-User-Uuid': token_schema.sub,
+        'X-User-Email': token_schema.email,
+        'X-User-Permissions': ','.join(token_schema.permissions),
+        'X-User-Permissions-Mask': str(token_schema.permissions_mask),
+        'X-Session-Uuid': token_schema.session_uuid,
+        'Cache-Control': f'max-age={max_age}',
+        'Expires': formatdate(now + max_age, usegmt=True),
+    })
+
+
+@router.post('/verify-access-tokens',
+             response_model=list[TokenVerifiedSerializer],
+             responses={
+                 fa.status.HTTP_200_OK: {'detail': ResponseDetailEnum.ok},
+                 fa.status.HTTP_400_BAD_REQUEST: {'detail': 'too many tokens'},
+             })
+async def auth_verify_access_tokens(
+        tokens: list[TokenVerifySchema],
+        auth_manager: AuthManager = fa.Depends(auth_manager_dependency),
+):
+    if len(tokens) > config.VERIFY_ACCESS_TOKENS_BATCH_MAX_SIZE:
+        raise BadRequestException(f'cant verify more than {config.VERIFY_ACCESS_TOKENS_BATCH_MAX_SIZE} tokens at once')
+    tokens_with_sessions = [
+        (token.access_token, SessionFingerprint(token.useragent, token.ip))
+        for token in tokens
+    ]
+    token_schemas = await auth_manager.get_verified_token_schemas(tokens_with_sessions)
+    return [TokenVerifiedSerializer(is_valid=token_schema is not None,
+                                    token=None if token_schema is None else token_schema.to_schema())
+            for token_schema in token_schemas]
 
 
 # Store the state value in session memory
@@ -0,0 +1,19 @@
+import fastapi as fa
+
+from core import config
+from core.keyring import keyring
+
+router = fa.APIRouter()
+
+
+@router.get('/jwks.json')
+async def jwks(
+        request: fa.Request,
+):
+    headers = {
+        'Cache-Control': f'public, max-age={config.JWKS_CACHE_MAX_AGE_SEC}',
+        'ETag': keyring.jwks_etag,
+    }
+    if request.headers.get('if-none-match') == keyring.jwks_etag:
+        return fa.Response(status_code=fa.status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return fa.Response(content=keyring.jwks_encoded, media_type='application/json', headers=headers)
@@ -0,0 +1,8 @@
+"""
+client for services verifying api_auth access tokens locally,
+depends only on PyJWT[crypto], httpx and redis, doesn't import anything else of api_auth
+"""
+from auth_client.claims import TokenClaims  # noqa
+from auth_client.permissions import mask_to_permissions, permissions_to_mask  # noqa
+from auth_client.revocation import RevocationFeed  # noqa
+from auth_client.verifier import TokenVerifier  # noqa
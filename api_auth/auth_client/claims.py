@@ -0,0 +1,60 @@
+from auth_client.permissions import mask_to_permissions, permissions_to_mask
+
+
+class TokenClaims():
+    """
+    claims of verified token for hot path (dependencies, verification, local cache),
+    slotted and built without validation
+    """
+    __slots__ = ('type', 'sub', 'email', 'permissions_mask', 'session_uuid', 'ip', 'useragent', 'exp',
+                 'oauth_type', 'oauth_token', 'role_epochs', 'user_epoch')
+
+    def __init__(self,
+                 type: str,
+                 sub: str,
+                 email: str,
+                 permissions_mask: int,
+                 session_uuid: str | None,
+                 ip: str | None,
+                 useragent: str | None,
+                 exp: int,
+                 oauth_type: str = 'local',
+                 oauth_token: str | None = None,
+                 role_epochs: dict[str, int] | None = None,
+                 user_epoch: int = 0):
+        self.type = type
+        self.sub = sub
+        self.email = email
+        self.permissions_mask = permissions_mask
+        self.session_uuid = session_uuid
+        self.ip = ip
+        self.useragent = useragent
+        self.exp = exp  # timestamp
+        self.oauth_type = oauth_type
+        self.oauth_token = oauth_token
+        # permissions epochs of roles of user by role uuid, None for tokens issued before role epochs
+        self.role_epochs = role_epochs
+        self.user_epoch = user_epoch
+
+    def __repr__(self):
+        return f'TokenClaims(type={self.type}, sub={self.sub}, session_uuid={self.session_uuid}, exp={self.exp})'
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> 'TokenClaims':
+        permissions_mask = claims.get('pmask')
+        if permissions_mask is None:
+            # token issued before permissions mask, with list of permissions names
+            permissions_mask = permissions_to_mask(claims.get('permissions', []))
+        return cls(claims['type'], claims['sub'], claims['email'], permissions_mask, claims.get('session_uuid'),
+                   claims.get('ip'), claims.get('useragent'), claims['exp'],
+                   claims.get('oauth_type', 'local'), claims.get('oauth_token'),
+                   # token issued before permissions epochs
+                   claims.get('role_epochs'), claims.get('user_epoch', 0))
+
+    @property
+    def permissions(self) -> list[str]:
+        return mask_to_permissions(self.permissions_mask)
+
+    def has_permissions(self, required: list[str]) -> bool:
+        required_mask = permissions_to_mask(required)
+        return self.permissions_mask & required_mask == required_mask
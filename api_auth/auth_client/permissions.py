@@ -0,0 +1,47 @@
+"""
+permissions mask of tokens ('pmask' claim),
+names are the values of api_auth core.enums.PermissionsNamesEnum
+"""
+
+# stable bit order of permissions in tokens permissions mask, new permissions must only be appended
+PERMISSIONS_BITS_ORDER: tuple[str, ...] = (
+    'all_of_all',
+    'all_of_users',
+    'create_users',
+    'read_users',
+    'update_users',
+    'delete_users',
+    'all_of_content',
+    'create_content',
+    'read_content_all',
+    'read_content_free',
+    'read_content_premium',
+    'update_content',
+    'delete_content',
+    'all_of_ratings',
+    'create_ratings',
+    'read_ratings',
+    'update_ratings',
+    'delete_ratings',
+    'all_of_comments',
+    'create_comments',
+    'read_comments_all',
+    'read_comments_my',
+    'update_comments_all',
+    'update_comments_my',
+    'delete_comments',
+)
+
+PERMISSIONS_BITS: dict[str, int] = {permission: 1 << index for index, permission in enumerate(PERMISSIONS_BITS_ORDER)}
+
+
+def permissions_to_mask(permissions: list[str]) -> int:
+    """unknown permissions (removed from PermissionsNamesEnum) are skipped"""
+    mask = 0
+    for permission in permissions:
+        mask |= PERMISSIONS_BITS.get(getattr(permission, 'value', permission), 0)
+    return mask
+
+
+def mask_to_permissions(mask: int) -> list[str]:
+    return [permission for index, permission in enumerate(PERMISSIONS_BITS_ORDER) if mask >> index & 1]
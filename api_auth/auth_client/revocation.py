@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from auth_client.claims import TokenClaims
+from auth_client.ttl_cache import LocalTTLCache
+
+logger = logging.getLogger(__name__)
+
+# redis stream api_auth appends revocation events to
+REVOCATION_STREAM = 'api_auth:revocations'
+# event types put to stream, values of api_auth core.enums.InvalidationEventsEnum
+SESSIONS_ENDED = 'sessions_ended'
+ROLE_EPOCH_BUMPED = 'role_epoch_bumped'
+USER_EPOCH_BUMPED = 'user_epoch_bumped'
+REVOCATION_EVENTS = (SESSIONS_ENDED, ROLE_EPOCH_BUMPED, USER_EPOCH_BUMPED)
+
+ACCESS_TOKEN_TTL_SEC = 15 * 60
+REVOKED_SESSIONS_MAX_SIZE = 1_000_000
+USERS_EPOCHS_MAX_SIZE = 1_000_000
+READ_BLOCK_MS = 5_000
+READ_COUNT = 1_000
+
+
+class RevocationFeed():
+    """
+    follows api_auth revocation stream:
+    - sessions ended by logout / logout_all are kept as revoked until their access tokens expire
+    - the highest permissions epoch of every role is kept, access tokens with lower epoch of some of their roles
+      are stale
+    - the highest permissions epoch of every user updated within access_token_ttl_sec is kept,
+      access tokens of user with lower epoch are stale (older tokens are expired anyway)
+    - on start events of the last access_token_ttl_sec are replayed, so nothing is missed after restart
+    - on redis errors stream is read again from the last received event, malformed events are logged and skipped
+    """
+
+    def __init__(self,
+                 redis: Redis,
+                 stream: str = REVOCATION_STREAM,
+                 access_token_ttl_sec: int = ACCESS_TOKEN_TTL_SEC,
+                 revoked_sessions_max_size: int = REVOKED_SESSIONS_MAX_SIZE,
+                 users_epochs_max_size: int = USERS_EPOCHS_MAX_SIZE):
+        self.redis = redis
+        self.stream = stream
+        self.access_token_ttl_sec = access_token_ttl_sec
+        self.revoked_sessions = LocalTTLCache(revoked_sessions_max_size, access_token_ttl_sec)
+        self.role_epochs: dict[str, int] = {}
+        self.users_epochs = LocalTTLCache(users_epochs_max_size, access_token_ttl_sec)
+        self._last_id: str | bytes = '0-0'
+        self._follow_task: asyncio.Task | None = None
+
+    def is_revoked(self, session_uuid: str) -> bool:
+        return self.revoked_sessions.get(session_uuid) is not None
+
+    def is_stale(self, token_claims: TokenClaims) -> bool:
+        if token_claims.user_epoch < (self.users_epochs.get(token_claims.sub) or 0):
+            return True
+        return any(epoch < self.role_epochs.get(role_uuid, 0)
+                   for role_uuid, epoch in (token_claims.role_epochs or {}).items())
+
+    def apply(self, fields: dict[bytes, bytes]) -> None:
+        event_type = fields[b'type'].decode('utf-8')
+        keys = fields[b'keys'].decode('utf-8').split(',') if fields[b'keys'] else []
+        if event_type == SESSIONS_ENDED:
+            for session_uuid in keys:
+                self.revoked_sessions.set(session_uuid, True)
+        elif event_type == ROLE_EPOCH_BUMPED:
+            role_uuid, epoch = keys
+            self.role_epochs[role_uuid] = max(self.role_epochs.get(role_uuid, 0), int(epoch))
+        elif event_type == USER_EPOCH_BUMPED:
+            user_uuid, epoch = keys
+            self.users_epochs.set(user_uuid, max(self.users_epochs.get(user_uuid) or 0, int(epoch)))
+
+    async def start(self) -> None:
+        # stream entry ids start with ms timestamp, older events don't matter, their tokens are expired
+        self._last_id = f'{int((time.time() - self.access_token_ttl_sec) * 1000)}-0'
+        self._follow_task = asyncio.create_task(self._follow())
+
+    async def stop(self) -> None:
+        if self._follow_task is not None:
+            self._follow_task.cancel()
+            try:
+                await self._follow_task
+            except asyncio.CancelledError:
+                pass
+            self._follow_task = None
+
+    async def _follow(self) -> None:
+        while True:
+            try:
+                entries = await self.redis.xread({self.stream: self._last_id}, count=READ_COUNT, block=READ_BLOCK_MS)
+                for _, messages in entries:
+                    for entry_id, fields in messages:
+                        try:
+                            self.apply(fields)
+                        except Exception as e:
+                            # malformed entry is skipped, following the stream goes on
+                            logger.error(f'_follow: {self.stream=:} failed to apply {entry_id=:} {fields=:}: {e}')
+                        self._last_id = entry_id
+            except RedisError as e:
+                logger.error(f'_follow: {self.stream=:} read failed: {e}, reading again from {self._last_id=:}')
+                await asyncio.sleep(1)
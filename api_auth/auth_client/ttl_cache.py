@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LocalTTLCache():
+    """
+    bounded in-process LRU cache:
+    - every entry lives no longer than min(ttl_sec passed to set, max_ttl_sec)
+    - least recently used entry is evicted when max_size is exceeded
+    - hits, misses, evictions, expirations are counted
+    """
+
+    def __init__(self, max_size: int, max_ttl_sec: float):
+        self.max_size = max_size
+        self.max_ttl_sec = max_ttl_sec
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def _on_remove(self, key: Hashable, value: Any) -> None:
+        """hook for subclasses keeping secondary indexes"""
+
+    def _pop(self, key: Hashable) -> bool:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        self._on_remove(key, entry[1])
+        return True
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._pop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_sec: float | None = None) -> bool:
+        ttl_sec = self.max_ttl_sec if ttl_sec is None else min(ttl_sec, self.max_ttl_sec)
+        if ttl_sec <= 0 or self.max_size <= 0:
+            return False
+        if key in self._data:
+            self._pop(key)
+        self._data[key] = (time.monotonic() + ttl_sec, value)
+        while len(self._data) > self.max_size:
+            evicted_key, (_, evicted_value) = self._data.popitem(last=False)
+            self._on_remove(evicted_key, evicted_value)
+            self.evictions += 1
+        return True
+
+    def delete(self, key: Hashable) -> bool:
+        return self._pop(key)
+
+    def clear(self) -> None:
+        for key in list(self._data):
+            self._pop(key)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -0,0 +1,91 @@
+import hashlib
+import logging
+import time
+from typing import Any
+
+import httpx
+import jwt
+
+from auth_client.claims import TokenClaims
+from auth_client.revocation import RevocationFeed
+from auth_client.ttl_cache import LocalTTLCache
+
+logger = logging.getLogger(__name__)
+
+VERIFIED_TOKENS_CACHE_MAX_SIZE = 10_000
+VERIFIED_TOKENS_CACHE_TTL_SEC = 60
+JWKS_MIN_RELOAD_INTERVAL_SEC = 60
+
+
+class TokenVerifier():
+    """
+    verifies api_auth access tokens locally, without request to api_auth:
+    - signature is verified with api_auth public keys from /.well-known/jwks.json,
+      keys are loaded again if token is signed with unknown kid (key rotation)
+    - verified claims are cached by token digest, no longer than token exp
+    - token is rejected if its session data doesn't match request,
+      its session is revoked or its permissions epoch is stale (see RevocationFeed)
+    - opaque tokens and tokens signed with AUTH_SECRET can't be verified locally
+    """
+
+    def __init__(self,
+                 jwks_url: str,
+                 revocation_feed: RevocationFeed | None = None,
+                 cache_max_size: int = VERIFIED_TOKENS_CACHE_MAX_SIZE,
+                 cache_max_ttl_sec: float = VERIFIED_TOKENS_CACHE_TTL_SEC):
+        self.jwks_url = jwks_url
+        self.revocation_feed = revocation_feed
+        self.tokens_cache = LocalTTLCache(cache_max_size, cache_max_ttl_sec)
+        self.keys: dict[str, tuple[str, Any]] = {}
+        self._keys_loaded_at: float | None = None
+
+    async def load_keys(self) -> None:
+        self._keys_loaded_at = time.monotonic()
+        async with httpx.AsyncClient() as client:
+            response = await client.get(self.jwks_url)
+            response.raise_for_status()
+        self.keys = {jwk['kid']: (jwk['alg'], jwt.PyJWK(jwk).key) for jwk in response.json()['keys']}
+        logger.info(f'load_keys: loaded {list(self.keys)=:}')
+
+    async def _get_key(self, kid: str | None) -> tuple[str, Any] | None:
+        if kid is None:
+            return None
+        reload_allowed = self._keys_loaded_at is None \
+            or time.monotonic() - self._keys_loaded_at >= JWKS_MIN_RELOAD_INTERVAL_SEC
+        if kid not in self.keys and reload_allowed:
+            try:
+                await self.load_keys()
+            except httpx.HTTPError as e:
+                logger.error(f'_get_key: failed to load keys from {self.jwks_url=:}: {e}')
+        return self.keys.get(kid)
+
+    async def _decode(self, token: str) -> TokenClaims | None:
+        try:
+            key = await self._get_key(jwt.get_unverified_header(token).get('kid'))
+            if key is None:
+                return None
+            algorithm, public_key = key
+            claims = jwt.decode(token, public_key, algorithms=[algorithm], options={'require': ['exp']})
+        except jwt.InvalidTokenError:
+            return None
+        if claims.get('type') != 'access':
+            return None
+        return TokenClaims.from_claims(claims)
+
+    async def verify(self, token: str, ip: str | None, useragent: str | None) -> TokenClaims | None:
+        """return claims of access token, or None if it isn't valid for request with ip and useragent"""
+        token_digest = hashlib.sha256(token.encode('utf-8')).digest()
+        token_claims = self.tokens_cache.get(token_digest)
+        if token_claims is None:
+            token_claims = await self._decode(token)
+            if token_claims is None:
+                return None
+            self.tokens_cache.set(token_digest, token_claims, token_claims.exp - time.time())
+
+        if token_claims.ip != ip or token_claims.useragent != useragent:
+            return None
+        if self.revocation_feed is not None:
+            if self.revocation_feed.is_revoked(token_claims.session_uuid) \
+                    or self.revocation_feed.is_stale(token_claims):
+                return None
+        return token_claims
@@ -0,0 +1,55 @@
+import logging
+import time
+import tracemalloc
+
+from benchmarks.token_codec import PAIR_KWARGS
+from core.enums import OAuthTypesEnum, TokenTypesEnum
+from db.serializers.session import SessionFingerprint, SessionFromRequestSchema
+from db.serializers.token import TokenClaims, TokenReadSchema
+from services.jwt_manager.jwt_manager import get_base_claims, encode_token
+
+ROUNDS = 50_000
+
+
+def schema_path(access_token: str) -> bool:
+    # before: validated session schema and pydantic token schema per request
+    session_from_request = SessionFromRequestSchema(useragent=PAIR_KWARGS['useragent'], ip=PAIR_KWARGS['ip'])
+    token_schema = TokenReadSchema.from_jwt(access_token)
+    return session_from_request.ip == token_schema.ip and session_from_request.useragent == token_schema.useragent
+
+
+def slotted_path(access_token: str) -> bool:
+    session_from_request = SessionFingerprint(PAIR_KWARGS['useragent'], PAIR_KWARGS['ip'])
+    token_schema = TokenClaims.from_jwt(access_token)
+    return session_from_request.ip == token_schema.ip and session_from_request.useragent == token_schema.useragent
+
+
+def measure(name: str, path, access_token: str) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        path(access_token)
+    per_call_us = (time.perf_counter() - started) / ROUNDS * 1_000_000
+
+    tracemalloc.start()
+    path(access_token)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<28} {per_call_us:>10.1f} us/op {peak:>10} peak bytes/op')
+    return per_call_us
+
+
+def benchmark():
+    """compares per-request work of verified_token_schema_dependency before and after slotted hot path types"""
+    logging.disable(logging.CRITICAL)
+    base_claims = get_base_claims(PAIR_KWARGS['user_uuid'], PAIR_KWARGS['email'], PAIR_KWARGS['permissions'],
+                                  PAIR_KWARGS['session_uuid'], PAIR_KWARGS['ip'], PAIR_KWARGS['useragent'],
+                                  OAuthTypesEnum.local, '')
+    access_token = encode_token(TokenTypesEnum.access, base_claims, int(time.time()))
+
+    schemas = measure('pydantic schemas', schema_path, access_token)
+    slotted = measure('slotted types', slotted_path, access_token)
+    print(f'speedup: {schemas / slotted:.2f}x')
+
+
+if __name__ == '__main__':
+    benchmark()
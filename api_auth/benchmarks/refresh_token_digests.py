@@ -0,0 +1,68 @@
+import asyncio
+import datetime as dt
+import logging
+import uuid
+
+from redis.asyncio import Redis
+
+from benchmarks.token_codec import PAIR_KWARGS
+from core import config
+from core.config import settings
+from core.enums import OAuthTypesEnum
+from services.jwt_manager.jwt_manager import create_token_pair, get_token_digest
+
+SESSIONS = 100_000
+BATCH_SIZE = 1_000
+KEY_PREFIX = 'benchmark:'
+
+
+async def delete_population(redis: Redis) -> None:
+    keys = [key async for key in redis.scan_iter(match=f'{KEY_PREFIX}*')]
+    for start in range(0, len(keys), BATCH_SIZE):
+        await redis.delete(*keys[start:start + BATCH_SIZE])
+
+
+async def populate(redis: Redis, refresh_tokens: list[str], to_value) -> int:
+    """set synthetic sessions, return used memory delta in bytes"""
+    await delete_population(redis)
+    used_memory_before = (await redis.info('memory'))['used_memory']
+    ex = dt.timedelta(minutes=config.REFRESH_TOKEN_EXP_MIN)
+    for start in range(0, len(refresh_tokens), BATCH_SIZE):
+        async with redis.pipeline(transaction=False) as pipe:
+            for refresh_token in refresh_tokens[start:start + BATCH_SIZE]:
+                pipe.set(f'{KEY_PREFIX}{uuid.uuid4()}', to_value(refresh_token), ex=ex)
+            await pipe.execute()
+    used_memory_after = (await redis.info('memory'))['used_memory']
+    sample_key = await redis.randomkey()
+    print(f'  MEMORY USAGE of one session key: {await redis.memory_usage(sample_key)} bytes')
+    return used_memory_after - used_memory_before
+
+
+async def benchmark():
+    """
+    compares redis memory of sessions cached with full refresh tokens and with their digests
+    - synthetic population of SESSIONS sessions with refresh tokens of different users, keys are deleted afterwards
+    """
+    logging.disable(logging.CRITICAL)
+    redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    token_pair = await create_token_pair(**{**PAIR_KWARGS, 'session_uuid': str(uuid.uuid4())},
+                                         oauth_type=OAuthTypesEnum.local, oauth_token='')
+    # tokens differ by claims, their length is the same
+    refresh_tokens = [token_pair.refresh_token[:-8] + f'{index:08d}' for index in range(SESSIONS)]
+    print(f'refresh token length: {len(token_pair.refresh_token)} bytes')
+
+    try:
+        print('full refresh tokens')
+        tokens_memory = await populate(redis, refresh_tokens, lambda refresh_token: refresh_token)
+        print(f'  {tokens_memory / SESSIONS:>10.1f} bytes/session {tokens_memory / 2 ** 20:>10.1f} MiB total')
+        print('refresh tokens digests')
+        digests_memory = await populate(redis, refresh_tokens, get_token_digest)
+        print(f'  {digests_memory / SESSIONS:>10.1f} bytes/session {digests_memory / 2 ** 20:>10.1f} MiB total')
+        print(f'memory saved: {1 - digests_memory / tokens_memory:.0%}')
+    finally:
+        await delete_population(redis)
+        await redis.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
@@ -0,0 +1,104 @@
+import asyncio
+import datetime as dt
+import logging
+import time
+import uuid
+
+import jwt
+
+from core import config
+from core.config import settings
+from core.enums import OAuthTypesEnum, PermissionsNamesEnum, TokenTypesEnum
+from db.serializers.token import TokenCreateSchema, TokenPairEncodedSerializer, TokenReadSchema
+from services.jwt_manager.jwt_manager import create_token_pair
+
+ROUNDS = 5_000
+
+PAIR_KWARGS = dict(
+    user_uuid=str(uuid.uuid4()),
+    email='benchmark@mail.ru',
+    permissions=[PermissionsNamesEnum.read_users, PermissionsNamesEnum.read_content_free,
+                 PermissionsNamesEnum.read_ratings, PermissionsNamesEnum.create_ratings,
+                 PermissionsNamesEnum.create_comments, PermissionsNamesEnum.read_comments_all,
+                 PermissionsNamesEnum.update_comments_my],
+    session_uuid=str(uuid.uuid4()),
+    ip='127.0.0.1',
+    useragent='Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0 Safari/537.36',
+)
+
+
+async def legacy_create_token(token_type: TokenTypesEnum, oauth_type=OAuthTypesEnum.local, oauth_token='',
+                              **kwargs) -> str:
+    # token minting before token codec: schema per token, .dict(), PyJWT encode with stdlib json
+    if token_type == TokenTypesEnum.access:
+        exp = dt.datetime.utcnow() + dt.timedelta(minutes=config.ACCESS_TOKEN_EXP_MIN)
+    else:
+        exp = dt.datetime.utcnow() + dt.timedelta(minutes=config.REFRESH_TOKEN_EXP_MIN)
+    token_schema = TokenCreateSchema(type=token_type, sub=kwargs['user_uuid'], email=kwargs['email'],
+                                     permissions=kwargs['permissions'], session_uuid=kwargs['session_uuid'],
+                                     ip=kwargs['ip'], useragent=kwargs['useragent'], oauth_type=oauth_type,
+                                     oauth_token=oauth_token, exp=exp)
+    return jwt.encode(token_schema.dict(), settings.AUTH_SECRET, algorithm=config.TOKEN_ENCODE_ALGORITHM)
+
+
+async def legacy_create_token_pair(**kwargs) -> TokenPairEncodedSerializer:
+    access_token = await legacy_create_token(TokenTypesEnum.access, **kwargs)
+    refresh_token = await legacy_create_token(TokenTypesEnum.refresh, **kwargs)
+    return TokenPairEncodedSerializer(access_token=access_token, refresh_token=refresh_token)
+
+
+def legacy_from_jwt(encoded_jwt: str) -> TokenReadSchema | None:
+    try:
+        decoded_jwt = jwt.decode(encoded_jwt, settings.AUTH_SECRET, algorithms=config.TOKEN_ENCODE_ALGORITHM)
+    except jwt.InvalidTokenError:
+        return None
+    decoded_jwt['exp'] = dt.datetime.fromtimestamp(decoded_jwt['exp'])
+    return TokenReadSchema.construct(**decoded_jwt)
+
+
+async def login_path(create_pair) -> None:
+    await create_pair(**PAIR_KWARGS)
+
+
+async def refresh_path(create_pair, from_jwt, refresh_token: str) -> None:
+    refresh_token_schema = from_jwt(refresh_token)
+    await create_pair(user_uuid=refresh_token_schema.sub,
+                      email=refresh_token_schema.email,
+                      permissions=refresh_token_schema.permissions,
+                      session_uuid=refresh_token_schema.session_uuid,
+                      ip=refresh_token_schema.ip,
+                      useragent=refresh_token_schema.useragent)
+
+
+async def measure(name: str, make_coro) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        await make_coro()
+    per_call_us = (time.perf_counter() - started) / ROUNDS * 1_000_000
+    print(f'{name:<28} {per_call_us:>10.1f} us/op')
+    return per_call_us
+
+
+async def benchmark():
+    """
+    compares login (mint token pair) and refresh (decode refresh token + mint token pair) paths
+    before and after token codec
+    """
+    logging.disable(logging.CRITICAL)
+    if config.TOKEN_ENCODE_ALGORITHM != 'HS256' or settings.AUTH_SIGNING_KEYS_DIR is not None:
+        print('legacy path signs with AUTH_SECRET (HS256), unset AUTH_SIGNING_KEYS_DIR to compare the same algorithm')
+
+    refresh_token = (await create_token_pair(**PAIR_KWARGS)).refresh_token
+    legacy_refresh_token = (await legacy_create_token_pair(**PAIR_KWARGS)).refresh_token
+
+    legacy_login = await measure('login legacy', lambda: login_path(legacy_create_token_pair))
+    codec_login = await measure('login codec', lambda: login_path(create_token_pair))
+    legacy_refresh = await measure('refresh legacy',
+                                   lambda: refresh_path(legacy_create_token_pair, legacy_from_jwt, legacy_refresh_token))
+    codec_refresh = await measure('refresh codec',
+                                  lambda: refresh_path(create_token_pair, TokenReadSchema.from_jwt, refresh_token))
+    print(f'login speedup: {legacy_login / codec_login:.2f}x, refresh speedup: {legacy_refresh / codec_refresh:.2f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
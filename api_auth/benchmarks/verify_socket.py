@@ -0,0 +1,95 @@
+import asyncio
+import datetime as dt
+import logging
+import time
+import uuid
+
+import httpx
+import msgpack
+from redis.asyncio import Redis
+
+from benchmarks.token_codec import PAIR_KWARGS
+from core import config
+from core.config import settings
+from core.enums import OAuthTypesEnum
+from services.auth_manager.auth_manager import AuthManager
+from services.cache.cache import RedisCache
+from services.cache.keys import session_key
+from services.jwt_manager.jwt_manager import get_token_digest
+from services.verify_server.verify_server import FRAME_HEADER, encode_frame
+
+ROUNDS = 20_000
+CONCURRENCY = 64
+VERIFY_URL = f'http://{settings.API_AUTH_HOST}:{settings.API_AUTH_PORT}/api/v1/auth/verify-access-token'
+
+
+async def create_session(cache: RedisCache) -> str:
+    # session is set up in redis directly, verification doesn't read db
+    auth_manager = AuthManager(None, cache)
+    session_uuid = str(uuid.uuid4())
+    role_epochs, user_epoch = await auth_manager._get_permissions_epochs(PAIR_KWARGS['user_uuid'], [])
+    token_pair = await auth_manager._create_token_pair(**{**PAIR_KWARGS, 'session_uuid': session_uuid},
+                                                       oauth_type=OAuthTypesEnum.local, oauth_token='',
+                                                       role_epochs=role_epochs, user_epoch=user_epoch)
+    await cache.set(session_key(session_uuid), get_token_digest(token_pair.refresh_token),
+                    ex=dt.timedelta(minutes=config.REFRESH_TOKEN_EXP_MIN))
+    return token_pair.access_token
+
+
+async def http_path(access_token: str) -> float:
+    body = {'access_token': access_token, 'ip': PAIR_KWARGS['ip'], 'useragent': PAIR_KWARGS['useragent']}
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=CONCURRENCY)) as client:
+
+        async def worker(rounds: int):
+            for _ in range(rounds):
+                response = await client.post(VERIFY_URL, json=body)
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(ROUNDS // CONCURRENCY) for _ in range(CONCURRENCY)])
+        return (ROUNDS // CONCURRENCY * CONCURRENCY) / (time.perf_counter() - started)
+
+
+async def socket_path(access_token: str) -> float:
+    reader, writer = await asyncio.open_unix_connection(settings.AUTH_VERIFY_SOCKET_PATH)
+    started = time.perf_counter()
+    # requests are pipelined, at most CONCURRENCY of them are unanswered
+    for request_id in range(ROUNDS):
+        writer.write(encode_frame([request_id, access_token, PAIR_KWARGS['ip'], PAIR_KWARGS['useragent']]))
+        if request_id >= CONCURRENCY:
+            await writer.drain()
+            await read_response(reader)
+    await writer.drain()
+    for _ in range(min(ROUNDS, CONCURRENCY)):
+        await read_response(reader)
+    rps = ROUNDS / (time.perf_counter() - started)
+    writer.close()
+    await writer.wait_closed()
+    return rps
+
+
+async def read_response(reader: asyncio.StreamReader) -> None:
+    length, = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    _, claims = msgpack.unpackb(await reader.readexactly(length))
+    assert claims is not None
+
+
+async def benchmark():
+    """
+    compares verification throughput of running service over http and over unix socket
+    - service is started with AUTH_VERIFY_SOCKET_PATH set, benchmark runs on the same host
+    """
+    logging.disable(logging.CRITICAL)
+    redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    access_token = await create_session(RedisCache(redis))
+    await redis.close()
+
+    http_rps = await http_path(access_token)
+    print(f'{"http verify-access-token":<28} {http_rps:>10.0f} req/s')
+    socket_rps = await socket_path(access_token)
+    print(f'{"unix socket msgpack":<28} {socket_rps:>10.0f} req/s')
+    print(f'speedup: {socket_rps / http_rps:.2f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
@@ -1,8 +1,11 @@
+import datetime as dt
 import os
 from pathlib import Path
 
 import pydantic as pd
 
+from core.enums import DegradedPoliciesEnum, RedisModesEnum, TokenModesEnum
+
 
 class Settings(pd.BaseSettings):
     PROJECT_NAME: str
@@ -20,6 +23,18 @@ class Settings(pd.BaseSettings):
 
     REDIS_HOST: str
     REDIS_PORT: int
+    REDIS_MODE: RedisModesEnum = RedisModesEnum.standalone
+    # 'host:port,host:port' of sentinels, required in sentinel mode
+    REDIS_SENTINELS: str | None = None
+    REDIS_SENTINEL_MASTER: str = 'mymaster'
+    # per worker (per node in cluster mode)
+    REDIS_MAX_CONNECTIONS: int = 100
+    REDIS_SOCKET_TIMEOUT_SEC: float = 2.0
+    REDIS_SOCKET_CONNECT_TIMEOUT_SEC: float = 2.0
+    # idle connections are pinged before use after it
+    REDIS_HEALTH_CHECK_INTERVAL_SEC: int = 30
+    # retries of commands failed with connection errors / timeouts, with exponential backoff
+    REDIS_RETRIES: int = 3
 
     POSTGRES_HOST: str
     POSTGRES_PORT: int
@@ -28,6 +43,21 @@ class Settings(pd.BaseSettings):
     POSTGRES_PASSWORD: str
 
     AUTH_SECRET: str
+    # directory with '<kid>.pem' keys for RS256/EdDSA signing, tokens are signed with AUTH_SECRET if not set
+    AUTH_SIGNING_KEYS_DIR: str | None = None
+    # kid of the active signing key, the latest private key in AUTH_SIGNING_KEYS_DIR if not set
+    AUTH_SIGNING_KEY_ID: str | None = None
+    # tokens signed with AUTH_SECRET (without kid) are accepted until it while AUTH_SIGNING_KEYS_DIR is set,
+    # for migration to signing keys, never if not set
+    AUTH_SECRET_ACCEPTED_UNTIL: dt.datetime | None = None
+    # tokens issued by login / refresh, tokens of both modes are verified regardless of it
+    AUTH_TOKEN_MODE: TokenModesEnum = TokenModesEnum.jwt
+    # unix socket of msgpack verification server for sidecars on the same host, server is not started if not set
+    AUTH_VERIFY_SOCKET_PATH: str | None = None
+    # in-process tier of RedisCache kept fresh with redis CLIENT TRACKING (redis >= 6), see NEAR_CACHE_POLICIES
+    AUTH_NEAR_CACHE: bool = False
+    # verification of tokens while redis circuit breaker is open
+    AUTH_DEGRADED_POLICY: DegradedPoliciesEnum = DegradedPoliciesEnum.reject
 
     DOCS_URL: str
 
@@ -61,6 +91,48 @@ settings = Settings(DOCKER, DEBUG, BASE_DIR)
 
 ACCESS_TOKEN_EXP_MIN: int = 15
 REFRESH_TOKEN_EXP_MIN: int = 60 * 24 * 30
+# concurrent refreshes with the same refresh token within it get the same token pair
+REFRESH_TOKEN_ROTATION_GRACE_SEC: int = 10
 TEMPORARY_REGISTER_TOKEN_EXP_MIN: int = 60 * 3
 TOKEN_ENCODE_ALGORITHM: str = 'HS256'
-API_NOTIFICATIONS_HTTP_PREFIX: str = f'http://{settings.API_NOTIFICATIONS_HOST}:{settings.API_NOTIFICATIONS_PORT}'
\ No newline at end of file
+API_NOTIFICATIONS_HTTP_PREFIX: str = f'http://{settings.API_NOTIFICATIONS_HOST}:{settings.API_NOTIFICATIONS_PORT}'
+VERIFIED_TOKENS_CACHE_MAX_SIZE: int = 10_000
+VERIFIED_TOKENS_CACHE_TTL_SEC: int = 60
+VERIFY_ACCESS_TOKENS_BATCH_MAX_SIZE: int = 500
+JWKS_CACHE_MAX_AGE_SEC: int = 60 * 10
+INVALIDATION_BUS_CHANNEL: str = 'api_auth:invalidation'
+# keep oauth-provider tokens in cache by session_uuid instead of putting them to jwt
+OAUTH_TOKEN_SERVER_SIDE: bool = True
+OPAQUE_TOKEN_BYTES: int = 32
+REVOCATION_STREAM_MAX_LEN: int = 100_000
+# auth_request decisions are cached by nginx no longer than it, so logout takes effect within it
+AUTH_REQUEST_CACHE_MAX_AGE_SEC: int = 10
+VERIFY_SERVER_MAX_FRAME_BYTES: int = 64 * 1024
+VERIFY_SERVER_MAX_BATCHES_IN_FLIGHT: int = 64
+# cached values (tokens) are logged by RedisCache only if it is set, otherwise only their size
+CACHE_LOG_VALUES: bool = False
+# near cache tiers by key prefix: (max entries, max bytes of keys and values, max ttl sec), other keys are not near cached
+NEAR_CACHE_POLICIES: dict[str, tuple[int, int, float]] = {
+    'session:': (100_000, 32 * 2 ** 20, 60),
+    'permissions_epoch': (100_000, 8 * 2 ** 20, 60),
+}
+NEAR_CACHE_PING_INTERVAL_SEC: int = 10
+# backoff between retries of redis commands: min(cap, base * 2 ** retry)
+REDIS_RETRY_BACKOFF_BASE_SEC: float = 0.05
+REDIS_RETRY_BACKOFF_CAP_SEC: float = 1
+# redis calls of RedisCache fail after it, successful calls take milliseconds
+REDIS_CIRCUIT_BREAKER_CALL_TIMEOUT_SEC: float = 1
+# consecutive failed calls opening breaker
+REDIS_CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5
+# open breaker fails calls right away during it, then it is half-open
+REDIS_CIRCUIT_BREAKER_OPEN_SEC: float = 5
+# half-open breaker lets through growing share of calls during it, then it is closed
+REDIS_CIRCUIT_BREAKER_RECOVERY_SEC: float = 10
+# user principal snapshots are rebuilt from db no later than after it, they are invalidated on changes before
+PRINCIPAL_CACHE_TTL_SEC: int = 60 * 10
+# sessions ended are kept locally as long as their access tokens live, for AUTH_DEGRADED_POLICY
+REVOKED_SESSIONS_CACHE_MAX_SIZE: int = 100_000
+# pub/sub connection is read with it, so idle channel doesn't hit socket timeout
+INVALIDATION_BUS_READ_TIMEOUT_SEC: float = 1
+# roles / permissions catalog is reloaded from db no later than after it, it is invalidated on role changes before
+ROLES_CATALOG_MAX_AGE_SEC: int = 60
@@ -1,23 +1,32 @@
 import fastapi as fa
 from fastapi.security import OAuth2PasswordBearer, OAuth2
-from redis.asyncio import Redis
+from redis.asyncio import Redis, RedisCluster
 
-from core.exceptions import UnauthorizedException
+from core.exceptions import ForbiddenException, UnauthorizedException
+from core.security import permissions_policies
 from db import SessionLocalAsync
-from db.models.user import UserModel
 from db.repository import SqlAlchemyRepositoryAsync
-from db.serializers.session import SessionFromRequestSchema
-from db.serializers.token import TokenReadSchema
+from db.serializers.session import SessionFingerprint
+from db.serializers.token import TokenClaims
+from db.serializers.user import UserPrincipalSerializer
 from services.auth_manager.auth_manager import AuthManager
 from services.cache.cache import RedisCache
+from services.cache.invalidation_bus import InvalidationBus
+from services.cache.near_cache import NearCache
 
-redis: Redis | None = None
+redis: Redis | RedisCluster | None = None
+invalidation_bus: InvalidationBus | None = None
+near_cache: NearCache | None = None
 
 
-async def redis_dependency() -> Redis:
+async def redis_dependency() -> Redis | RedisCluster:
     return redis
 
 
+async def invalidation_bus_dependency() -> InvalidationBus:
+    return invalidation_bus
+
+
 async def sql_alchemy_repo_dependency(
 ) -> SqlAlchemyRepositoryAsync:
     async with SessionLocalAsync() as session:
@@ -26,16 +35,19 @@ async def sql_alchemy_repo_dependency(
 
 
 async def redis_cache_dependency(
-        redis: Redis = fa.Depends(redis_dependency),
+        redis: Redis | RedisCluster = fa.Depends(redis_dependency),
 ) -> RedisCache:
+    if near_cache is not None:
+        return near_cache
     return RedisCache(redis)
 
 
 async def auth_manager_dependency(
         repo: SqlAlchemyRepositoryAsync = fa.Depends(sql_alchemy_repo_dependency),
-        redis_cache: RedisCache = fa.Depends(redis_cache_dependency)
+        redis_cache: RedisCache = fa.Depends(redis_cache_dependency),
+        invalidation_bus: InvalidationBus = fa.Depends(invalidation_bus_dependency),
 ) -> AuthManager:
-    return AuthManager(repo, redis_cache)
+    return AuthManager(repo, redis_cache, invalidation_bus=invalidation_bus)
 
 
 async def pagination_params_dependency(
@@ -69,27 +81,37 @@ oauth2_scheme_providers = OAuth2(
 )
 
 
-async def get_current_user_dependency(access_token: str = fa.Depends(oauth2_scheme_local),
-                                      repo: SqlAlchemyRepositoryAsync = fa.Depends(sql_alchemy_repo_dependency)):
-    access_token_schema = TokenReadSchema.from_jwt(access_token)
-    if access_token_schema is None:
-        raise UnauthorizedException
-    current_user = await repo.get(UserModel, uuid=access_token_schema.sub)
-    if current_user is None:
-        raise UnauthorizedException
-    return current_user
-
-
 async def verified_token_schema_dependency(request: fa.Request,
                                            access_token: str = fa.Depends(oauth2_scheme_local),
                                            _: str = fa.Depends(oauth2_scheme_providers),
                                            auth_manager: AuthManager = fa.Depends(auth_manager_dependency),
                                            ):
-    session_from_request = SessionFromRequestSchema(
-        useragent=request.headers.get("user-agent"),
-        ip=request.headers.get('X-Forwarded-For'),
-    )
-    token_schema = await auth_manager.get_verified_token_schema(access_token, session_from_request)
+    token_schema = await auth_manager.get_verified_token_schema(access_token, SessionFingerprint.from_request(request))
     if token_schema is None:
         raise UnauthorizedException
     return token_schema
+
+
+async def get_current_user_dependency(access_token_schema: TokenClaims = fa.Depends(verified_token_schema_dependency),
+                                      auth_manager: AuthManager = fa.Depends(auth_manager_dependency)):
+    current_user = await auth_manager.get_user(access_token_schema.sub)
+    if current_user is None:
+        raise UnauthorizedException
+    return current_user
+
+
+async def get_current_principal_dependency(
+        access_token_schema: TokenClaims = fa.Depends(verified_token_schema_dependency),
+        auth_manager: AuthManager = fa.Depends(auth_manager_dependency),
+) -> UserPrincipalSerializer:
+    current_principal = await auth_manager.get_principal(access_token_schema.sub)
+    if current_principal is None:
+        raise UnauthorizedException
+    return current_principal
+
+
+async def permissions_policy_dependency(request: fa.Request,
+                                        token_schema: TokenClaims = fa.Depends(verified_token_schema_dependency),
+                                        ):
+    if not permissions_policies.is_allowed(request.scope.get('endpoint'), token_schema.permissions_mask):
+        raise ForbiddenException
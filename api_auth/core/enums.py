@@ -21,9 +21,12 @@ class EnvEnum(str, Enum):
 class ResponseDetailEnum(str, Enum):
     ok = 'ok'
     unauthorized = 'Unauthorized for this action.'
+    forbidden = 'Token has not all permissions required for this action.'
     invalid_credentials = 'Invalid credentials were provided.'
     user_already_exists = 'User with these credentials already exists.'
     user_was_not_registered = 'User was not registered.'
+    cache_unavailable = 'Cache is unavailable, try again later.'
+    role_was_not_found = 'Role was not found, roles are created with scripts.create_permissions_roles.'
 
 
 class RolesNamesEnum(str, Enum):
@@ -52,6 +55,34 @@ class TokenTypesEnum(str, Enum):
         return self.value
 
 
+class RedisModesEnum(str, Enum):
+    # one node at REDIS_HOST:REDIS_PORT
+    standalone = 'standalone'
+    # master of REDIS_SENTINEL_MASTER discovered with REDIS_SENTINELS
+    sentinel = 'sentinel'
+    # cluster discovered from node at REDIS_HOST:REDIS_PORT
+    cluster = 'cluster'
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return self.value
+
+
+class TokenModesEnum(str, Enum):
+    # self-contained signed tokens
+    jwt = 'jwt'
+    # random reference tokens, claims are kept in cache
+    opaque = 'opaque'
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return self.value
+
+
 class PermissionsNamesEnum(str, Enum):
     # permission for superuser
     all_of_all = 'all_of_all'
@@ -120,3 +151,51 @@ class OAuthTypesEnum(str, Enum):
     google = 'google'
     yandex = 'yandex'
     vk = 'vk'
+
+
+class InvalidationEventsEnum(str, Enum):
+    # keys: sessions uuids
+    sessions_ended = 'sessions_ended'
+    # keys: [user uuid, new permissions epoch of user]
+    user_epoch_bumped = 'user_epoch_bumped'
+    # keys: roles ids
+    roles_updated = 'roles_updated'
+    roles_deleted = 'roles_deleted'
+    # keys: [role uuid, new permissions epoch of role]
+    role_epoch_bumped = 'role_epoch_bumped'
+    # keys: [], events could be missed, every local cache should be cleared
+    reset = 'reset'
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return self.value
+
+
+class CircuitBreakerStatesEnum(str, Enum):
+    # calls go through
+    closed = 'closed'
+    # calls fail right away
+    open = 'open'
+    # growing share of calls goes through
+    half_open = 'half_open'
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return self.value
+
+
+class DegradedPoliciesEnum(str, Enum):
+    # tokens which sessions can't be checked are rejected
+    reject = 'reject'
+    # jwt access tokens are accepted by signature until exp, unless their sessions were ended before cache went down
+    accept_signed = 'accept_signed'
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return self.value
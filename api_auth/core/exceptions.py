@@ -21,6 +21,14 @@ class UnauthorizedException(fa.HTTPException):
         )
 
 
+class ForbiddenException(fa.HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=fa.status.HTTP_403_FORBIDDEN,
+            detail=ResponseDetailEnum.forbidden,
+        )
+
+
 class InvalidCredentialsException(fa.HTTPException):
     def __init__(self):
         super().__init__(
@@ -46,3 +54,20 @@ class UserWasNotRegisteredException(fa.HTTPException):
             detail=ResponseDetailEnum.user_was_not_registered,
             headers={'WWW-Authenticate': 'Bearer'},
         )
+
+
+class RoleWasNotFoundException(fa.HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=fa.status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=ResponseDetailEnum.role_was_not_found,
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+
+
+class CacheUnavailableException(fa.HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=fa.status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=ResponseDetailEnum.cache_unavailable,
+        )
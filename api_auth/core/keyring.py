@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Any
+
+import orjson
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey, RSAPublicKey
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+from core import config
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class KeyRing():
+    """
+    keys for signing and verifying tokens
+    - tokens are signed with the active key, its kid is put to token header
+    - tokens are verified with the key found by kid from token header,
+      so tokens signed before rotation are verified with retired keys until they expire
+    - keys are parsed once, verification never reloads pem material
+    - without signing keys tokens are signed and verified with AUTH_SECRET (HS256), with signing keys
+      tokens without kid are verified with AUTH_SECRET only until secret_accepted_until (legacy tokens),
+      otherwise the shared secret would stay a valid key to forge tokens with
+    """
+
+    def __init__(self,
+                 secret: str,
+                 signing_kid: str | None = None,
+                 signing_key: RSAPrivateKey | Ed25519PrivateKey | None = None,
+                 verification_keys: dict[str, RSAPublicKey | Ed25519PublicKey] | None = None,
+                 secret_accepted_until: float | None = None):
+        self.secret = secret
+        self.secret_accepted_until = secret_accepted_until
+        self.signing_kid = signing_kid
+        self.signing_key = signing_key
+        self.verification_keys: dict[str, tuple[str, Any]] = {
+            kid: (self.get_algorithm(public_key), public_key)
+            for kid, public_key in (verification_keys or {}).items()
+        }
+        self._jwks = {'keys': [self._get_jwk(kid, public_key) for kid, (_, public_key) in
+                               self.verification_keys.items()]}
+        self.jwks_encoded = orjson.dumps(self._jwks)
+        self.jwks_etag = f'"{hashlib.sha256(self.jwks_encoded).hexdigest()[:32]}"'
+
+    @classmethod
+    def from_dir(cls, secret: str, keys_dir: str | Path | None, signing_kid: str | None,
+                 secret_accepted_until: float | None = None) -> 'KeyRing':
+        """
+        load every '<kid>.pem' file from keys_dir,
+        private keys can sign and verify, public keys (retired ones) can only verify
+        """
+        if keys_dir is None:
+            return cls(secret)
+
+        signing_keys: dict[str, RSAPrivateKey | Ed25519PrivateKey] = {}
+        verification_keys: dict[str, RSAPublicKey | Ed25519PublicKey] = {}
+        for pem_path in sorted(Path(keys_dir).glob('*.pem')):
+            kid = pem_path.stem
+            pem = pem_path.read_bytes()
+            try:
+                private_key = serialization.load_pem_private_key(pem, password=None)
+                signing_keys[kid] = private_key
+                verification_keys[kid] = private_key.public_key()
+            except ValueError:
+                verification_keys[kid] = serialization.load_pem_public_key(pem)
+
+        if signing_kid is None and signing_keys:
+            signing_kid = max(signing_keys)
+        if signing_kid is not None and signing_kid not in signing_keys:
+            raise ValueError(f'there is no private key for {signing_kid=:} in {keys_dir=:}')
+
+        logger.info(f'keyring: loaded {list(verification_keys)=:}, {signing_kid=:}')
+        return cls(secret,
+                   signing_kid=signing_kid,
+                   signing_key=signing_keys.get(signing_kid),
+                   verification_keys=verification_keys,
+                   secret_accepted_until=secret_accepted_until)
+
+    @staticmethod
+    def get_algorithm(key: Any) -> str:
+        if isinstance(key, (RSAPrivateKey, RSAPublicKey)):
+            return 'RS256'
+        if isinstance(key, (Ed25519PrivateKey, Ed25519PublicKey)):
+            return 'EdDSA'
+        raise ValueError(f'unsupported key type {type(key)=:}')
+
+    def _get_jwk(self, kid: str, public_key: RSAPublicKey | Ed25519PublicKey) -> dict:
+        algorithm = self.get_algorithm(public_key)
+        if algorithm == 'RS256':
+            jwk = RSAAlgorithm.to_jwk(public_key, as_dict=True)
+        else:
+            jwk = OKPAlgorithm.to_jwk(public_key, as_dict=True)
+        jwk.update({'kid': kid, 'alg': algorithm, 'use': 'sig'})
+        return jwk
+
+    @property
+    def signing_algorithm(self) -> str:
+        if self.signing_key is None:
+            return config.TOKEN_ENCODE_ALGORITHM
+        return self.get_algorithm(self.signing_key)
+
+    def get_signing_key(self) -> tuple[str, Any, dict]:
+        """return (algorithm, key, headers) to sign new tokens with"""
+        if self.signing_key is None:
+            return config.TOKEN_ENCODE_ALGORITHM, self.secret, {}
+        return self.signing_algorithm, self.signing_key, {'kid': self.signing_kid}
+
+    def is_secret_accepted(self) -> bool:
+        """whether tokens without kid are verified with AUTH_SECRET"""
+        if not self.verification_keys:
+            return True
+        return self.secret_accepted_until is not None and time.time() < self.secret_accepted_until
+
+    def get_verification_key(self, kid: str | None) -> tuple[str, Any] | None:
+        """return (algorithm, key) to verify token with kid from its header"""
+        if kid is None:
+            if not self.is_secret_accepted():
+                return None
+            return config.TOKEN_ENCODE_ALGORITHM, self.secret
+        return self.verification_keys.get(kid)
+
+    @property
+    def jwks(self) -> dict:
+        return self._jwks
+
+
+keyring = KeyRing.from_dir(settings.AUTH_SECRET, settings.AUTH_SIGNING_KEYS_DIR, settings.AUTH_SIGNING_KEY_ID,
+                           secret_accepted_until=None if settings.AUTH_SECRET_ACCEPTED_UNTIL is None
+                           else settings.AUTH_SECRET_ACCEPTED_UNTIL.timestamp())
@@ -10,6 +10,9 @@ from pathlib import Path
 
 def setup_logger(service_name: str, service_dir: Path):
     logger = logging.getLogger(name=service_name)
+    if logger.handlers:
+        # modules of the same service dir share logger
+        return logger
     logger.setLevel(logging.DEBUG)
 
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s ')
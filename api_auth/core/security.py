@@ -1,17 +1,21 @@
 import logging
 import secrets
 import string
-from functools import wraps
+from typing import Callable
 
-import jwt
+from fastapi.routing import APIRoute
+from starlette.routing import BaseRoute
 
-from core import config
-from core.config import settings
+# permissions mask is defined in auth_client, so downstream services decode tokens the same way
+from auth_client.permissions import PERMISSIONS_BITS_ORDER, mask_to_permissions, permissions_to_mask  # noqa
 from core.enums import PermissionsNamesEnum
-from core.exceptions import UnauthorizedException
+from services.jwt_manager.codec import token_codec
 
 logger = logging.getLogger(__name__)
 
+assert set(PERMISSIONS_BITS_ORDER) == {permission.value for permission in PermissionsNamesEnum}, \
+    'every permission should have its bit'
+
 
 def generate_password(length=12):
     characters = string.ascii_letters + string.digits + string.punctuation
@@ -20,29 +24,59 @@ def generate_password(length=12):
 
 
 def get_token_data(encoded_jwt_local: str) -> dict | None:
-    try:
-        return jwt.decode(encoded_jwt_local, settings.AUTH_SECRET, algorithms=config.TOKEN_ENCODE_ALGORITHM)
-    except jwt.ExpiredSignatureError:  # Token has expired
-        return None
-    except jwt.InvalidTokenError:  # Invalid token
-        return None
+    return token_codec.decode(encoded_jwt_local)
+
+
+PERMISSIONS_MASK_ATTR = '__required_permissions_mask__'
 
 
 def permissions(required: list[PermissionsNamesEnum]):
-    # decorator for route, that denies access if token has not all specified permissions
+    """
+    decorator for route, declares permissions that token should have all of to access route,
+    (required=[]) for routes available for any authorized user,
+    declarations are compiled to PermissionsPolicies at app startup
+    """
+    required_mask = permissions_to_mask(required)
+
     def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            access_token_schema = kwargs.get('access_token_schema')
-            if access_token_schema:
-                token_permissions = access_token_schema.permissions
-                for permission in required:
-                    if permission not in token_permissions:
-                        logger.error(f'required {permission=:} not in {token_permissions=:}')
-                        raise UnauthorizedException
+        setattr(func, PERMISSIONS_MASK_ATTR, required_mask)
+        return func
 
-            return await func(*args, **kwargs)
+    return decorator
 
-        return wrapper
 
-    return decorator
+class PermissionsPolicies():
+    """
+    required permissions masks of authorized routes by route endpoints,
+    compiled once at app startup, so every request is checked with one dict lookup and one bit test
+    """
+
+    def __init__(self):
+        self.masks: dict[Callable, int] = {}
+
+    def compile(self, routes: list[BaseRoute]) -> None:
+        """raise RuntimeError if some route has no @permissions declaration"""
+        masks = {}
+        undeclared = []
+        for route in routes:
+            if not isinstance(route, APIRoute):
+                continue
+            required_mask = getattr(route.endpoint, PERMISSIONS_MASK_ATTR, None)
+            if required_mask is None:
+                undeclared.append(f'{sorted(route.methods)} {route.path}')
+                continue
+            masks[route.endpoint] = required_mask
+        if undeclared:
+            raise RuntimeError(f'routes without @permissions declaration: {undeclared}')
+        self.masks = masks
+        logger.info(f'compiled permissions policies for {len(masks)} routes')
+
+    def is_allowed(self, endpoint: Callable, permissions_mask: int) -> bool:
+        required_mask = self.masks.get(endpoint)
+        if required_mask is None:
+            logger.error(f'there is no compiled permissions policy for {endpoint=:}')
+            return False
+        return permissions_mask & required_mask == required_mask
+
+
+permissions_policies = PermissionsPolicies()
@@ -73,8 +73,8 @@ class SqlAlchemyRepositoryAsync(DBRepository):
         obj = result.scalars().first()
         return obj
 
-    async def get_all(self, Model: type[sa_BaseModel]) -> list[sa_BaseModel]:
-        stmt = select(Model)
+    async def get_all(self, Model: type[sa_BaseModel], *options) -> list[sa_BaseModel]:
+        stmt = select(Model).options(*options)
         result = await self.session.execute(stmt)
         objs = result.scalars().all()
         return objs
@@ -138,7 +138,18 @@ class SqlAlchemyRepositoryAsync(DBRepository):
         await self.session.refresh(obj)
         return obj
 
-    async def remove(self, Model: type[sa_BaseModel], id) -> None:
+    async def update_all(self, Model: type[sa_BaseModel], values: dict, **kwargs) -> list[str]:
+        """update every obj filtered by kwargs with one statement, return uuids of updated objs"""
+        stmt = sa.update(Model).filter_by(**kwargs).values(**values).returning(Model.uuid)
+        try:
+            uuids = (await self.session.execute(stmt)).scalars().all()
+            await self.session.commit()
+        except IntegrityError as e:
+            await self.session.rollback()
+            raise ValueError(f'Error while updating {Model=:} by {kwargs=:}: {str(e)}')
+        return list(uuids)
+
+    async def remove(self, Model: type[sa_BaseModel], id) -> sa_BaseModel:
         obj = await self.get(Model, id=id)
         if obj is None:
             raise BadRequestException(f'Cant remove, {Model=:} {id=:} not found')
@@ -148,6 +159,7 @@ class SqlAlchemyRepositoryAsync(DBRepository):
         except IntegrityError as e:
             await self.session.rollback()
             raise ValueError(f'Error while removing {Model=:} {id=:}: {str(e)}')
+        return obj
 
     async def get_paginated_select(self, Model: type[sa_BaseModel], select, order_by: str, order: OrderEnum,
                                    pagination_params):
@@ -0,0 +1,9 @@
+import pydantic as pd
+
+from core.enums import InvalidationEventsEnum
+
+
+class InvalidationEventSchema(pd.BaseModel):
+    type: InvalidationEventsEnum
+    keys: list[str] = []
+    origin: str | None = None  # id of publishing worker
@@ -1,5 +1,6 @@
 import datetime as dt
 
+import fastapi as fa
 import pydantic as pd
 
 
@@ -43,6 +44,23 @@ class SessionFromRequestSchema(pd.BaseModel):
     ip: str
 
 
+class SessionFingerprint():
+    """request session data compared with token session data on hot path, built without validation"""
+    __slots__ = ('useragent', 'ip')
+
+    def __init__(self, useragent: str | None, ip: str | None):
+        self.useragent = useragent
+        self.ip = ip
+
+    def __repr__(self):
+        return f'SessionFingerprint(useragent={self.useragent}, ip={self.ip})'
+
+    @classmethod
+    def from_request(cls, request: fa.Request) -> 'SessionFingerprint':
+        headers = request.headers
+        return cls(headers.get('user-agent'), headers.get('X-Forwarded-For'))
+
+
 class SessionCachedSchema(pd.BaseModel):
     uuid: str
     user_uuid: str
@@ -2,8 +2,8 @@ import datetime as dt
 import typing
 
 import pydantic as pd
-from pydantic.main import object_setattr
 
+from auth_client import claims
 from core.enums import TokenTypesEnum, PermissionsNamesEnum, OAuthTypesEnum
 from core.security import get_token_data
 
@@ -26,18 +26,55 @@ class TokenCreateSchema(pd.BaseModel):
 
 
 class TokenReadSchema(TokenCreateSchema):
+    permissions_mask: int = 0  # bitmask of permissions, bits order is auth_client.permissions.PERMISSIONS_BITS_ORDER
 
     @classmethod
     def from_jwt(cls, encoded_jwt: str) -> typing.Union['TokenReadSchema', None]:
-        m = cls.__new__(cls)
         decoded_jwt: dict | None = get_token_data(encoded_jwt)
         if decoded_jwt is None:
             return None
-        decoded_jwt['exp'] = dt.datetime.fromtimestamp(decoded_jwt['exp'])
-        object_setattr(m, '__dict__', decoded_jwt)
-        object_setattr(m, '__fields_set__', cls.__fields_set__)
-        m._init_private_attributes()
-        return m
+        return cls.from_claims(decoded_jwt)
+
+    @classmethod
+    def from_claims(cls, decoded_claims: dict) -> 'TokenReadSchema':
+        """construct schema from claims of jwt or of opaque token, without validation, claims are parsed by TokenClaims"""
+        return TokenClaims.from_claims(decoded_claims).to_schema()
+
+
+class TokenClaims(claims.TokenClaims):
+    """auth_client TokenClaims decoded with own token codec, converted to TokenReadSchema only for responses"""
+    __slots__ = ()
+
+    @classmethod
+    def from_jwt(cls, encoded_jwt: str) -> typing.Union['TokenClaims', None]:
+        decoded_jwt: dict | None = get_token_data(encoded_jwt)
+        if decoded_jwt is None:
+            return None
+        return cls.from_claims(decoded_jwt)
+
+    def to_schema(self) -> TokenReadSchema:
+        return TokenReadSchema.construct(type=self.type,
+                                         sub=self.sub,
+                                         email=self.email,
+                                         permissions=self.permissions,
+                                         session_uuid=self.session_uuid,
+                                         ip=self.ip,
+                                         useragent=self.useragent,
+                                         exp=dt.datetime.fromtimestamp(self.exp),
+                                         oauth_type=self.oauth_type,
+                                         oauth_token=self.oauth_token,
+                                         permissions_mask=self.permissions_mask)
+
+
+class TokenVerifySchema(pd.BaseModel):
+    access_token: str
+    ip: str
+    useragent: str
+
+
+class TokenVerifiedSerializer(pd.BaseModel):
+    is_valid: bool
+    token: TokenReadSchema | None = None
 
 
 class TokenPairEncodedSerializer(pd.BaseModel):
@@ -11,7 +11,7 @@ class UserUpdatePasswordSerializer(pd.BaseModel):
     password: str
 
     async def update_password(self, repo, user_id):
-        user = await repo.get(UserModel, id=user_id)
+        user = await repo.get(UserModel, uuid=user_id)
 
         hashed_password = get_password_hash(self.password)
         self.password = hashed_password
@@ -65,6 +65,23 @@ class UserReadSessionsSerializer(UserReadSerializer):
         orm_mode = True
 
 
+class UserPrincipalSerializer(UserReadSerializer):
+    """
+    snapshot of user read by /me endpoints, cached by user uuid,
+    valid while permissions epochs and principal version it was built at are current
+    """
+    permissions: list['PermissionReadSerializer'] = []
+    active_sessions: list['SessionReadSerializer'] = []
+    # epochs of roles of user
+    role_epochs: dict[str, int] = {}
+    user_epoch: int = 0
+    # principal version of user read before snapshot was built
+    principal_version: int = 0
+
+    class Config:
+        orm_mode = True
+
+
 class UserLoginSchema(pd.BaseModel):
     email: pd.EmailStr
     password: str
@@ -74,8 +91,10 @@ class UserLoginOAuthSchema(UserLoginSchema):
     password: str | None = None
 
 
+from db.serializers.permission import PermissionReadSerializer
 from db.serializers.role import RoleReadSerializer
 from db.serializers.session import SessionReadSerializer
 
 RoleReadSerializer.update_forward_refs()
 SessionReadSerializer.update_forward_refs()
+UserPrincipalSerializer.update_forward_refs()
@@ -8,20 +8,32 @@ from fastapi.responses import ORJSONResponse
 from opentelemetry import trace
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 from opentelemetry.sdk.trace import TracerProvider
-from redis.asyncio import Redis
-
 import core.dependencies
+from api import metrics, well_known
 from api.v1.authorized import auth as v1_auth_authorized
 from api.v1.authorized import me as v1_me
 from api.v1.authorized import postgres as v1_postgres
 from api.v1.authorized import roles as v1_roles
 from api.v1.public import auth as v1_auth_public
+from core import config
 from core.config import settings
-from core.dependencies import verified_token_schema_dependency
+from core.dependencies import permissions_policy_dependency, verified_token_schema_dependency
+from core.enums import InvalidationEventsEnum, RedisModesEnum
 from core.logger_config import setup_logger
+from core.security import permissions_policies
 from db import init_models
+from services.auth_manager.auth_manager import AuthManager
+from services.cache.cache import RedisCache
+from services.cache.invalidation_bus import InvalidationBus
+from services.cache.local_cache import revoked_sessions_cache, verified_tokens_cache
+from services.cache.near_cache import NearCache, NearCachePolicy
+from services.cache.permissions_epochs import permissions_epochs
+from services.cache.roles_catalog import roles_catalog
+from services.cache.redis_factory import create_pubsub_redis, create_redis
+from services.verify_server.verify_server import VerifyServer
 
 logger: Logger | None = None
+verify_server: VerifyServer | None = None
 
 
 def configure_tracer() -> None:
@@ -32,6 +44,20 @@ def configure_tracer() -> None:
     #     BatchSpanProcessor(ConsoleSpanExporter()))
 
 
+def subscribe_local_caches(invalidation_bus: InvalidationBus) -> None:
+    invalidation_bus.subscribe(InvalidationEventsEnum.sessions_ended, verified_tokens_cache.invalidate_sessions)
+    invalidation_bus.subscribe(InvalidationEventsEnum.sessions_ended, revoked_sessions_cache.revoke_sessions)
+    invalidation_bus.subscribe(InvalidationEventsEnum.reset, lambda _: verified_tokens_cache.clear())
+    # access tokens verified before permissions epochs were bumped are verified again
+    invalidation_bus.subscribe(InvalidationEventsEnum.role_epoch_bumped, permissions_epochs.set_role_epoch)
+    # role changes are rare, cached tokens aren't indexed by roles
+    invalidation_bus.subscribe(InvalidationEventsEnum.role_epoch_bumped, lambda _: verified_tokens_cache.clear())
+    invalidation_bus.subscribe(InvalidationEventsEnum.user_epoch_bumped,
+                               lambda keys: verified_tokens_cache.invalidate_users(keys[:1]))
+    invalidation_bus.subscribe(InvalidationEventsEnum.reset, lambda _: permissions_epochs.reset())
+    roles_catalog.subscribe(invalidation_bus)
+
+
 @asynccontextmanager
 async def lifespan(app: fa.FastAPI):
     # startup
@@ -40,10 +66,42 @@ async def lifespan(app: fa.FastAPI):
     SERVICE_DIR = Path(__file__).resolve().parent
     SERVICE_NAME = SERVICE_DIR.stem
     logger = setup_logger(SERVICE_NAME, SERVICE_DIR)
-    core.dependencies.redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    permissions_policies.compile(v1_router_auth.routes)
+    core.dependencies.redis = create_redis()
+    pubsub_redis = create_pubsub_redis(core.dependencies.redis)
+    core.dependencies.invalidation_bus = InvalidationBus(core.dependencies.redis, pubsub_redis=pubsub_redis)
+    subscribe_local_caches(core.dependencies.invalidation_bus)
+    await core.dependencies.invalidation_bus.start()
+    try:
+        await roles_catalog.load()
+    except Exception as e:
+        # db isn't required to start, catalog is loaded on first use then
+        logger.error(f'lifespan: roles catalog was not loaded: {e}')
+    if settings.AUTH_NEAR_CACHE and settings.REDIS_MODE == RedisModesEnum.cluster:
+        # tracking connection would get invalidations of one node only
+        logger.error('lifespan: near cache is not supported in cluster mode, AUTH_NEAR_CACHE is ignored')
+    elif settings.AUTH_NEAR_CACHE:
+        core.dependencies.near_cache = NearCache(
+            core.dependencies.redis,
+            [NearCachePolicy(prefix, *policy) for prefix, policy in config.NEAR_CACHE_POLICIES.items()])
+        await core.dependencies.near_cache.start()
+    if settings.AUTH_VERIFY_SOCKET_PATH is not None:
+        global verify_server
+        # verification doesn't use repo
+        auth_manager = AuthManager(None, core.dependencies.near_cache or RedisCache(core.dependencies.redis),
+                                   invalidation_bus=core.dependencies.invalidation_bus)
+        verify_server = VerifyServer(auth_manager, settings.AUTH_VERIFY_SOCKET_PATH)
+        await verify_server.start()
     configure_tracer()
     yield
     # shutdown
+    if verify_server is not None:
+        await verify_server.stop()
+    if core.dependencies.near_cache is not None:
+        await core.dependencies.near_cache.stop()
+    await core.dependencies.invalidation_bus.stop()
+    if pubsub_redis is not core.dependencies.redis:
+        await pubsub_redis.close()
     await core.dependencies.redis.close()
 
 
@@ -68,17 +126,20 @@ async def log_request_id(request: fa.Request, call_next):
     return await call_next(request)
 
 
-v1_router_auth = fa.APIRouter(dependencies=[fa.Depends(verified_token_schema_dependency)])
+v1_router_auth = fa.APIRouter(dependencies=[fa.Depends(verified_token_schema_dependency),
+                                            fa.Depends(permissions_policy_dependency)])
 v1_router_auth.include_router(v1_postgres.router, prefix='/postgres', tags=['postgres'])
 v1_router_auth.include_router(v1_auth_authorized.router, prefix='/auth', tags=['auth'])
 v1_router_auth.include_router(v1_roles.router, prefix='/roles', tags=['roles'])
 v1_router_auth.include_router(v1_me.router, prefix='/me', tags=['me'])
+v1_router_auth.include_router(metrics.router, prefix='/metrics', tags=['metrics'])
 
 v1_router_public = fa.APIRouter()
 v1_router_public.include_router(v1_auth_public.router, prefix='/auth', tags=['auth'])
 
 app.include_router(v1_router_auth, prefix='/api/v1')
 app.include_router(v1_router_public, prefix='/api/v1')
+app.include_router(well_known.router, prefix='/.well-known', tags=['well-known'])
 
 if __name__ == '__main__':
     uvicorn.run('main:app', host=settings.API_AUTH_HOST, port=settings.API_AUTH_PORT, reload=True)
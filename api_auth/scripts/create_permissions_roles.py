@@ -18,12 +18,12 @@ async def create_permissions_all():
 
 async def create_roles_all():
     async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
+        # permissions are read once, they are created by create_permissions_all
+        permissions = {permission.name: permission for permission in await repo.get_all(PermissionModel)}
         for role_name in RolesNamesEnum:
             if role_name == RolesNamesEnum.superuser:
                 is_created, superuser_role = await repo.get_or_create_by_name(RoleModel, role_name)
-                is_created, all_of_all_perm = await repo.get_or_create_by_name(PermissionModel,
-                                                                               PermissionsNamesEnum.all_of_all)
-                superuser_role.permissions.append(all_of_all_perm)
+                superuser_role.permissions.append(permissions[PermissionsNamesEnum.all_of_all])
 
             if role_name == RolesNamesEnum.staff:
                 pass
@@ -31,15 +31,15 @@ async def create_roles_all():
                 pass
             if role_name == RolesNamesEnum.registered:
                 is_created, registered_role = await repo.get_or_create_by_name(RoleModel, role_name)
-                read_users = await repo.get(PermissionModel, name=PermissionsNamesEnum.read_users)
-                read_content_free = await repo.get(PermissionModel, name=PermissionsNamesEnum.read_content_free)
-                read_ratings = await repo.get(PermissionModel, name=PermissionsNamesEnum.read_ratings)
-                create_ratings = await repo.get(PermissionModel, name=PermissionsNamesEnum.create_ratings)
-                create_comments = await repo.get(PermissionModel, name=PermissionsNamesEnum.create_comments)
-                read_comments_all = await repo.get(PermissionModel, name=PermissionsNamesEnum.read_comments_all)
-                update_comments_my = await repo.get(PermissionModel, name=PermissionsNamesEnum.update_comments_my)
-                registered_role.permissions.extend([read_users, read_content_free, read_ratings, create_ratings,
-                                                    create_comments, read_comments_all, update_comments_my])
+                registered_role.permissions.extend([permissions[permission_name] for permission_name in (
+                    PermissionsNamesEnum.read_users,
+                    PermissionsNamesEnum.read_content_free,
+                    PermissionsNamesEnum.read_ratings,
+                    PermissionsNamesEnum.create_ratings,
+                    PermissionsNamesEnum.create_comments,
+                    PermissionsNamesEnum.read_comments_all,
+                    PermissionsNamesEnum.update_comments_my,
+                )])
             if role_name == RolesNamesEnum.premium:
                 pass
 
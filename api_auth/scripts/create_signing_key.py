@@ -0,0 +1,44 @@
+import argparse
+import datetime as dt
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+from core.config import settings
+
+
+def create_signing_key(keys_dir: Path, algorithm: str) -> Path:
+    """
+    create new private key '<kid>.pem' in keys_dir, kid is utc timestamp, so the new key is the latest one
+
+    rotation:
+    - create new key, set AUTH_SIGNING_KEY_ID to its kid (or unset it to use the latest one), restart workers
+    - keep previous key in keys_dir until tokens signed with it expire (REFRESH_TOKEN_EXP_MIN),
+      it can be replaced with its public key to only verify tokens
+    """
+    if algorithm == 'RS256':
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == 'EdDSA':
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        raise ValueError(f'unsupported {algorithm=:}')
+
+    kid = dt.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    keys_dir.mkdir(parents=True, exist_ok=True)
+    pem_path = keys_dir / f'{kid}.pem'
+    pem_path.write_bytes(private_key.private_bytes(encoding=serialization.Encoding.PEM,
+                                                   format=serialization.PrivateFormat.PKCS8,
+                                                   encryption_algorithm=serialization.NoEncryption()))
+    pem_path.chmod(0o600)
+    return pem_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-a', '--algorithm', type=str, default='EdDSA', choices=['RS256', 'EdDSA'])
+    parser.add_argument('-d', '--keys-dir', type=str, default=settings.AUTH_SIGNING_KEYS_DIR)
+    args = parser.parse_args()
+    if args.keys_dir is None:
+        raise ValueError('set AUTH_SIGNING_KEYS_DIR or use (-d keys_dir)')
+    print(f'Successfully created {create_signing_key(Path(args.keys_dir), args.algorithm)}')
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+
+from redis.asyncio import Redis
+
+from core.config import settings
+from services.cache.keys import session_key
+from services.cache.scripts import RedisScript
+from services.jwt_manager.jwt_manager import get_token_digest
+
+# session keys were session uuids without prefix
+OLD_SESSION_KEYS_PATTERN = '????????-????-????-????-????????????'
+SESSION_KEYS_PATTERN = session_key(OLD_SESSION_KEYS_PATTERN)
+DIGEST_BYTES = 32
+
+# KEYS[1]: session key, ARGV[1]: cached refresh token, ARGV[2]: its digest
+# replaced only if it wasn't rotated / revoked since it was read, ttl is kept
+REPLACE_REFRESH_TOKEN = RedisScript("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'KEEPTTL')
+    return 1
+end
+return 0
+""")
+
+
+async def migrate_sessions_cache(redis: Redis, batch_size: int) -> tuple[int, int]:
+    """
+    run once right after deploy, until then tokens of not migrated sessions are rejected,
+    steps are made in this order, the second one finds sessions by keys made by the first one:
+    - rename sessions cached by session uuids to session_key, ttl is kept
+    - replace refresh tokens cached by sessions with their digests
+    """
+    renamed = await migrate_by_pattern(redis, OLD_SESSION_KEYS_PATTERN, batch_size, rename_session_keys)
+    await redis.script_load(REPLACE_REFRESH_TOKEN.script)
+    digested = await migrate_by_pattern(redis, SESSION_KEYS_PATTERN, batch_size, replace_refresh_tokens)
+    return renamed, digested
+
+
+async def migrate_by_pattern(redis: Redis, pattern: str, batch_size: int, migrate_keys) -> int:
+    migrated = 0
+    keys = []
+    async for key in redis.scan_iter(match=pattern, count=batch_size, _type='string'):
+        keys.append(key)
+        if len(keys) == batch_size:
+            migrated += await migrate_keys(redis, keys)
+            keys = []
+    if keys:
+        migrated += await migrate_keys(redis, keys)
+    return migrated
+
+
+async def rename_session_keys(redis: Redis, keys: list[bytes]) -> int:
+    async with redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.renamenx(key, session_key(key.decode('utf-8')))
+        # key expired since it was scanned can't be renamed
+        results = await pipe.execute(raise_on_error=False)
+    return sum(result is True or result == 1 for result in results)
+
+
+async def replace_refresh_tokens(redis: Redis, keys: list[bytes]) -> int:
+    refresh_tokens = await redis.mget(keys)
+    async with redis.pipeline(transaction=False) as pipe:
+        for key, refresh_token in zip(keys, refresh_tokens):
+            if refresh_token is not None and len(refresh_token) != DIGEST_BYTES:
+                pipe.evalsha(REPLACE_REFRESH_TOKEN.sha, 1, key, refresh_token,
+                             get_token_digest(refresh_token.decode('utf-8')))
+        return sum(await pipe.execute())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    renamed, digested = asyncio.run(migrate_sessions_cache(redis, args.batch_size))
+    print(f'Successfully migrated {renamed} session keys, {digested} refresh tokens')
@@ -1,36 +1,76 @@
+import asyncio
 import datetime as dt
 from pathlib import Path
 
 import fastapi as fa
 import httpx
+from redis.exceptions import RedisError
 
 from core import config
 from core.config import settings
-from core.enums import TokenTypesEnum, RolesNamesEnum, OAuthTypesEnum
-from core.exceptions import InvalidCredentialsException, UnauthorizedException, UserWasNotRegisteredException
+from core.enums import TokenTypesEnum, RolesNamesEnum, OAuthTypesEnum, InvalidationEventsEnum, TokenModesEnum, \
+    DegradedPoliciesEnum
+from core.exceptions import InvalidCredentialsException, UnauthorizedException, UserWasNotRegisteredException, \
+    RoleWasNotFoundException, CacheUnavailableException
 from core.logger_config import setup_logger
-from db.models.role import RoleModel
+from db import SessionLocalAsync
+from db.models._association import UserRoleAssociation
 from db.models.session import SessionModel
 from db.models.user import UserModel
 from db.repository import SqlAlchemyRepositoryAsync
 from db.serializers.session import (
     SessionReadUserSerializer,
     SessionCreateSerializer,
+    SessionFingerprint,
     SessionFromRequestSchema,
     SessionUpdateSerializer
 )
-from db.serializers.token import TokenPairEncodedSerializer, TokenReadSchema
-from db.serializers.user import UserLoginSchema, UserCreateSerializer
+from db.serializers.token import TokenClaims, TokenPairEncodedSerializer, TokenReadSchema
+from db.serializers.user import UserLoginSchema, UserCreateSerializer, UserPrincipalSerializer
 from services.cache.cache import RedisCache
+from services.cache.invalidation_bus import InvalidationBus
+from services.cache.keys import (
+    oauth_token_key,
+    opaque_token_key,
+    principal_key,
+    principal_version_key,
+    role_epoch_key,
+    rotated_refresh_token_key,
+    session_key,
+    user_epoch_key,
+    user_sessions_key,
+)
+from services.cache.local_cache import (
+    RevokedSessionsCache,
+    VerifiedTokensCache,
+    revoked_sessions_cache,
+    verified_tokens_cache,
+)
+from services.cache.permissions_epochs import PermissionsEpochs, decode_epoch, permissions_epochs
+from services.cache.roles_catalog import roles_catalog
 from services.hasher import password_is_verified
-from services.jwt_manager.jwt_manager import create_token_pair, create_temporary_register_token
+from services.jwt_manager.jwt_manager import (
+    create_token_pair,
+    create_opaque_token_pair,
+    create_temporary_register_token,
+    decode_opaque_token_claims,
+    get_opaque_token_digest,
+    get_token_digest,
+    is_opaque_token,
+)
 from services.oauth import get_user_info_oauth
+from services.single_flight import SingleFlight
 
 SERVICE_DIR = Path(__file__).resolve().parent
 SERVICE_NAME = SERVICE_DIR.stem
 
 logger = setup_logger(SERVICE_NAME, SERVICE_DIR)
 
+# lookups coalesced per process, see SingleFlight
+verifications_in_flight = SingleFlight()
+principals_in_flight = SingleFlight()
+users_in_flight = SingleFlight()
+
 
 class AuthManager():
     """
@@ -38,9 +78,145 @@ class AuthManager():
     - verify access_token user by data from request,
     """
 
-    def __init__(self, repo: SqlAlchemyRepositoryAsync, cache: RedisCache):
+    def __init__(self,
+                 repo: SqlAlchemyRepositoryAsync,
+                 cache: RedisCache,
+                 tokens_cache: VerifiedTokensCache = verified_tokens_cache,
+                 invalidation_bus: InvalidationBus | None = None,
+                 permissions_epochs: PermissionsEpochs = permissions_epochs,
+                 revoked_sessions: RevokedSessionsCache = revoked_sessions_cache,
+                 session_factory=SessionLocalAsync):
         self.repo = repo
         self.cache = cache
+        self.tokens_cache = tokens_cache
+        self.invalidation_bus = invalidation_bus
+        self.permissions_epochs = permissions_epochs
+        self.revoked_sessions = revoked_sessions
+        self.session_factory = session_factory
+
+    async def _invalidate_sessions(self, sessions_uuids: list[str]) -> None:
+        """
+        drop ended sessions from local caches of every worker,
+        only from local tokens_cache (and put to local revoked_sessions) if there is no invalidation_bus
+        """
+        if not sessions_uuids:
+            return
+        if self.invalidation_bus is None:
+            self.tokens_cache.invalidate_sessions(sessions_uuids)
+            self.revoked_sessions.revoke_sessions(sessions_uuids)
+        else:
+            await self.invalidation_bus.publish(InvalidationEventsEnum.sessions_ended, sessions_uuids)
+
+    async def _get_permissions_epochs(self, user_uuid: str, roles_uuids) -> tuple[dict[str, int], int]:
+        """
+        current (role_epochs, user_epoch) to put to new tokens of user with roles_uuids,
+        role epochs which aren't in memory are read in the same round trip
+        """
+        missing = self.permissions_epochs.get_missing(roles_uuids)
+        cached = await self.cache.get_many([user_epoch_key(user_uuid), *map(role_epoch_key, missing)])
+        for role_uuid, epoch_cached in zip(missing, cached[1:]):
+            self.permissions_epochs.load_role_epoch(role_uuid, epoch_cached)
+        return self.permissions_epochs.get_role_epochs(roles_uuids), decode_epoch(cached[0])
+
+    async def _get_role_epochs(self, roles_uuids) -> dict[str, int]:
+        """current epochs of roles, the ones which aren't in memory are read with one round trip"""
+        missing = self.permissions_epochs.get_missing(roles_uuids)
+        if missing:
+            cached = await self.cache.get_many([role_epoch_key(role_uuid) for role_uuid in missing])
+            for role_uuid, epoch_cached in zip(missing, cached):
+                self.permissions_epochs.load_role_epoch(role_uuid, epoch_cached)
+        return self.permissions_epochs.get_role_epochs(roles_uuids)
+
+    def _are_epochs_stale(self, token_schema: TokenClaims | UserPrincipalSerializer, user_epoch: int) -> bool:
+        """
+        whether token (or snapshot) epochs are lower than current ones, role epochs are compared only for roles
+        token carries, higher epochs of token minted by worker which got bump earlier are not stale
+        """
+        return token_schema.user_epoch < user_epoch or self.permissions_epochs.are_roles_stale(token_schema.role_epochs)
+
+    async def get_principal(self, user_uuid: str) -> UserPrincipalSerializer | None:
+        """
+        user principal snapshot cached by user uuid,
+        it is built from db if it isn't cached or permissions epochs changed since it was built,
+        None if there is no such user,
+        concurrent lookups of the same user share one lookup, it reads db with its own session,
+        so it doesn't depend on session of request which started it
+        """
+        return await principals_in_flight.do(user_uuid, lambda: self._get_principal(user_uuid))
+
+    async def _get_principal(self, user_uuid: str) -> UserPrincipalSerializer | None:
+        principal_cached, user_epoch_cached, principal_version_cached = await self.cache.get_many(
+            [principal_key(user_uuid), user_epoch_key(user_uuid), principal_version_key(user_uuid)])
+        user_epoch, principal_version = decode_epoch(user_epoch_cached), decode_epoch(principal_version_cached)
+        if principal_cached is not None:
+            principal = UserPrincipalSerializer.parse_raw(principal_cached)
+            await self._get_role_epochs(principal.role_epochs)
+            # snapshot built by worker which got epoch bump earlier is fresh too
+            if not self._are_epochs_stale(principal, user_epoch) and principal.principal_version >= principal_version:
+                return principal
+
+        # epochs (of known roles) and principal version are read before user,
+        # so user / role changed meanwhile makes snapshot stale
+        role_epochs = await self._get_role_epochs(roles_catalog.roles_by_uuid)
+        async with SqlAlchemyRepositoryAsync(self.session_factory()) as repo:
+            user = await repo.get(UserModel, uuid=user_uuid)
+            if user is None:
+                return None
+            principal = UserPrincipalSerializer.from_orm(user)
+        role_epochs.update(await self._get_role_epochs([role_uuid for role_uuid in principal.roles_uuids
+                                                        if role_uuid not in role_epochs]))
+        principal.role_epochs = {role_uuid: role_epochs[role_uuid] for role_uuid in principal.roles_uuids}
+        principal.user_epoch = user_epoch
+        principal.principal_version = principal_version
+        await self.cache.set(principal_key(user_uuid), principal.json(), ex=config.PRINCIPAL_CACHE_TTL_SEC)
+        return principal
+
+    async def get_user(self, user_uuid: str) -> UserModel | None:
+        """
+        user by uuid attached to session of this manager, None if there is no such user,
+        concurrent lookups of the same user share one lookup made with its own session,
+        its result is merged to session of each caller without loading it again
+        """
+        user = await users_in_flight.do(user_uuid, lambda: self._get_user(user_uuid))
+        if user is None:
+            return None
+        return await self.repo.session.merge(user, load=False)
+
+    async def _get_user(self, user_uuid: str) -> UserModel | None:
+        async with SqlAlchemyRepositoryAsync(self.session_factory()) as repo:
+            return await repo.get(UserModel, uuid=user_uuid)
+
+    async def invalidate_principal(self, user_uuid: str) -> None:
+        """
+        make principal snapshot of user stale after changes not covered by permissions epochs (sessions, password)
+        by bumping principal version, unlike delete it also makes stale snapshot rebuilt concurrently from db
+        state before the change, so it should be called after the change is committed
+        """
+        await self.cache.incr(principal_version_key(user_uuid))
+
+    async def _create_token_pair(self, **token_pair_data) -> TokenPairEncodedSerializer:
+        """create jwt or opaque token pair depending on settings.AUTH_TOKEN_MODE"""
+        if settings.AUTH_TOKEN_MODE == TokenModesEnum.opaque:
+            return await create_opaque_token_pair(self.cache, **token_pair_data)
+        return await create_token_pair(**token_pair_data)
+
+    async def _read_token_schemas(self, tokens: list[str]) -> list[TokenClaims | None]:
+        """
+        decode jwt tokens,
+        resolve claims of opaque tokens from cache with one round trip, without decoding anything,
+        so verification of opaque tokens takes two round trips: claims, then sessions
+        """
+        token_schemas: list[TokenClaims | None] = [
+            None if is_opaque_token(token) else TokenClaims.from_jwt(token) for token in tokens]
+        opaque_indexes = [index for index, token in enumerate(tokens) if is_opaque_token(token)]
+        if opaque_indexes:
+            opaque_tokens_cached = await self.cache.get_hashes(
+                [opaque_token_key(get_opaque_token_digest(tokens[index])) for index in opaque_indexes])
+            for index, opaque_token_cached in zip(opaque_indexes, opaque_tokens_cached):
+                claims = decode_opaque_token_claims(opaque_token_cached)
+                if claims is not None:
+                    token_schemas[index] = TokenClaims.from_claims(claims)
+        return token_schemas
 
     async def _create_session(
             self,
@@ -52,9 +228,11 @@ class AuthManager():
         """
         create session in db
         create token pair based on user and session data
-        set refresh token to cache
+        set refresh token to cache, CacheUnavailableException if it wasn't set, tokens couldn't be verified
         return token pair
         """
+        # epochs are read before permissions, so permissions changed meanwhile make new tokens stale
+        role_epochs, user_epoch = await self._get_permissions_epochs(user.uuid, user.roles_uuids)
         session_create_ser = SessionCreateSerializer(user_uuid=user.uuid,
                                                      useragent=session_schema.useragent,
                                                      ip=session_schema.ip,
@@ -62,7 +240,13 @@ class AuthManager():
         session_db: SessionModel = await self.repo.create(SessionModel, session_create_ser)
         session_ser = SessionReadUserSerializer.from_orm(session_db)
 
-        token_pair = await create_token_pair(
+        cached = {}
+        if oauth_type != OAuthTypesEnum.local and config.OAUTH_TOKEN_SERVER_SIDE:
+            # jwt carries only oauth_type, oauth-provider token is cached by session_uuid
+            cached[oauth_token_key(session_ser.uuid)] = oauth_token
+            oauth_token = ''
+
+        token_pair = await self._create_token_pair(
             user_uuid=session_ser.user.uuid,
             email=session_ser.user.email,
             permissions=session_ser.user.permissions_names,
@@ -70,13 +254,23 @@ class AuthManager():
             ip=session_ser.ip,
             useragent=session_ser.useragent,
             oauth_type=oauth_type,
-            oauth_token=oauth_token
+            oauth_token=oauth_token,
+            role_epochs=role_epochs,
+            user_epoch=user_epoch,
         )
 
-        # cache session refresh token
-        await self.cache.set(session_ser.uuid,
-                             token_pair.refresh_token,
-                             ex=dt.timedelta(minutes=config.REFRESH_TOKEN_EXP_MIN))
+        # session refresh token digest (and oauth-provider token), user sessions index
+        # and principal version bump are written in one round trip
+        cached[session_key(session_ser.uuid)] = get_token_digest(token_pair.refresh_token)
+        ex = dt.timedelta(minutes=config.REFRESH_TOKEN_EXP_MIN)
+        try:
+            async with self.cache.pipeline() as pipe:
+                for key, data in cached.items():
+                    pipe.set(key, data, ex=ex)
+                pipe.sadd(user_sessions_key(user.uuid), session_ser.uuid).expire(user_sessions_key(user.uuid), ex)
+                pipe.incr(principal_version_key(user.uuid))
+        except RedisError:
+            raise CacheUnavailableException
 
         return token_pair
 
@@ -94,51 +288,192 @@ class AuthManager():
                                          is_active=True)
         if session_db:
             session_db = await self.repo.update(session_db, {'is_active': False})
+            await self._invalidate_sessions([session_db.uuid])
             # logger.info(f'_deactivate_session_from_request: updated {session_db=:}')
 
-            session_cached = await self.cache.get(session_db.uuid)
-            if session_cached:
-                await self.cache.delete(session_db.uuid)
-                logger.info('_deactivate_session_from_request: deleted from cache')
+            await self._delete_sessions_cached([session_db.uuid])
+            await self.invalidate_principal(session_db.user_uuid)
+            await self.cache.remove_set_members(user_sessions_key(session_db.user_uuid), [session_db.uuid])
+            logger.info('_deactivate_session_from_request: deleted from cache')
+
+    async def _delete_sessions_cached(self, sessions_uuids: list[str]) -> None:
+        """
+        delete sessions refresh tokens digests and oauth-provider tokens from cache in one round trip,
+        claims of opaque refresh tokens are deleted with one more round trip in opaque mode
+        """
+        if not sessions_uuids:
+            return
+        await self.cache.revoke_sessions(
+            [session_key(session_uuid) for session_uuid in sessions_uuids],
+            [key for session_uuid in sessions_uuids
+             for key in (oauth_token_key(session_uuid), rotated_refresh_token_key(session_uuid))],
+            opaque_keys_prefix=opaque_token_key('') if settings.AUTH_TOKEN_MODE == TokenModesEnum.opaque else None)
+
+    def _is_accepted_degraded(self, token_schema: TokenClaims) -> bool:
+        """
+        whether token which session can't be checked (redis is unavailable) is accepted by AUTH_DEGRADED_POLICY,
+        signature and exp of jwt tokens are already verified by decoding
+        """
+        if settings.AUTH_DEGRADED_POLICY != DegradedPoliciesEnum.accept_signed:
+            return False
+        if token_schema.type != TokenTypesEnum.access or self.revoked_sessions.is_revoked(token_schema.session_uuid):
+            return False
+        return not self.permissions_epochs.are_roles_stale(token_schema.role_epochs)
+
+    @staticmethod
+    def _session_matches(token_schema: TokenClaims, session_from_request: SessionFingerprint) -> bool:
+        if session_from_request.ip != token_schema.ip or \
+                session_from_request.useragent != token_schema.useragent:
+            logger.error(f'verify_token: {session_from_request=:} doesnt match {token_schema=:}')
+            return False
+        return True
 
     async def get_verified_token_schema(
             self,
             token: str,
-            session_from_request: SessionFromRequestSchema) -> TokenReadSchema | None:
+            session_from_request: SessionFingerprint) -> TokenClaims | None:
         """
         return provided token schema or
         return None
             -if local service cant decode token
             -if oauth-provider service cant validate token nested inside schema
             -if token session data doesn't match to session_from_request data
-            -if there is no refresh_token cached
-            -if token_provided is refresh_token - and token_provided != refresh_token cached
+            -if there is no refresh_token digest cached
+            -if token_provided is refresh_token - and its digest != refresh_token digest cached
+        concurrent verifications of the same token from the same session which isn't in tokens_cache
+        share one verification
         """
-        token_schema = TokenReadSchema.from_jwt(token)
-        if token_schema is None:
-            return None
-
-        if token_schema.oauth_type != OAuthTypesEnum.local:
-            token = token_schema.oauth_token
-            token_info = await get_user_info_oauth(token_schema.oauth_token, oauth_type=token_schema.oauth_type)
-            if token_info is None:
-                return None
+        token_digest = self.tokens_cache.digest(token)
+        if token_digest in self.tokens_cache:
+            token_schemas = await self.get_verified_token_schemas([(token, session_from_request)], [token_digest])
+            return token_schemas[0]
 
-        if session_from_request.ip != token_schema.ip or \
-                session_from_request.useragent != token_schema.useragent:
-            logger.error(f'verify_token: {session_from_request=:} doesnt match {token_schema=:}')
-            return None
+        async def verify() -> TokenClaims | None:
+            token_schemas = await self.get_verified_token_schemas([(token, session_from_request)], [token_digest])
+            return token_schemas[0]
 
-        refresh_token_cached = await self.cache.get(token_schema.session_uuid)
-        if refresh_token_cached is None:
-            logger.error(f'verify_token: theres no refresh_token by {token_schema.session_uuid=:}')
-            return None
+        return await verifications_in_flight.do(
+            (token_digest, session_from_request.ip, session_from_request.useragent), verify)
 
-        if token_schema.type == TokenTypesEnum.refresh:
-            if refresh_token_cached.decode('utf-8') != token:
-                return None
-
-        return token_schema
+    async def get_verified_token_schemas(
+            self,
+            tokens_with_sessions: list[tuple[str, SessionFingerprint]],
+            tokens_digests: list[bytes] | None = None) -> list[TokenClaims | None]:
+        """
+        verify every (token, session_from_request) pair by the same rules as get_verified_token_schema,
+        return list of token schemas (None for not verified ones) in the same order,
+        tokens_digests (tokens_cache digests of tokens) are computed if caller hasn't computed them already
+
+        - verified access token schemas are taken from tokens_cache, only session data is compared for them
+        - all other jwt tokens are decoded in one pass, opaque tokens are resolved from cache in one round trip
+          (session keys are in their claims, so claims and sessions can't be read with one script call)
+        - sessions are checked (refresh tokens are compared with cached ones) by one redis script call,
+          which also returns oauth-provider tokens cached for sessions and permissions epochs of access tokens users
+        - access tokens with stale permissions epochs (of their user and of roles they carry) are rejected,
+          refresh tokens are not (refresh re-reads permissions)
+        - oauth-provider tokens are validated concurrently
+        - if redis is unavailable, tokens are verified by AUTH_DEGRADED_POLICY and are not put to tokens_cache
+        """
+        token_schemas: list[TokenClaims | None] = [None] * len(tokens_with_sessions)
+        to_read: list[tuple[int, str, bytes]] = []
+        to_verify: list[tuple[int, str, bytes, TokenClaims]] = []
+
+        if tokens_digests is None:
+            tokens_digests = [self.tokens_cache.digest(token) for token, _ in tokens_with_sessions]
+        for index, ((token, session_from_request), token_digest) in enumerate(
+                zip(tokens_with_sessions, tokens_digests)):
+            token_schema = self.tokens_cache.get(token_digest)
+            if token_schema is not None:
+                if self._session_matches(token_schema, session_from_request):
+                    token_schemas[index] = token_schema
+                continue
+            to_read.append((index, token, token_digest))
+
+        tokens_read = await self._read_token_schemas([token for _, token, _ in to_read])
+        for (index, token, token_digest), token_schema in zip(to_read, tokens_read):
+            if token_schema is None or not self._session_matches(token_schema, tokens_with_sessions[index][1]):
+                continue
+            to_verify.append((index, token, token_digest, token_schema))
+
+        if not to_verify:
+            return token_schemas
+
+        # refresh tokens digests are compared with cached ones by redis script,
+        # access tokens only need session to be cached
+        sessions = [(session_key(token_schema.session_uuid),
+                     get_token_digest(token) if token_schema.type == TokenTypesEnum.refresh else '')
+                    for _, token, _, token_schema in to_verify]
+        oauth_sessions_uuids = list({token_schema.session_uuid for _, _, _, token_schema in to_verify
+                                     if token_schema.oauth_type != OAuthTypesEnum.local and not token_schema.oauth_token})
+        users_uuids = list({token_schema.sub for _, _, _, token_schema in to_verify
+                            if token_schema.type == TokenTypesEnum.access})
+        roles_uuids = self.permissions_epochs.get_missing({
+            role_uuid for _, _, _, token_schema in to_verify if token_schema.type == TokenTypesEnum.access
+            for role_uuid in token_schema.role_epochs or ()})
+        keys = [oauth_token_key(session_uuid) for session_uuid in oauth_sessions_uuids]
+        keys.extend(user_epoch_key(user_uuid) for user_uuid in users_uuids)
+        keys.extend(role_epoch_key(role_uuid) for role_uuid in roles_uuids)
+        sessions_verified, cached = await self.cache.verify_sessions(sessions, keys)
+        cached = iter(cached)
+        oauth_tokens_cached = {session_uuid: next(cached) for session_uuid in oauth_sessions_uuids}
+        users_epochs = {user_uuid: decode_epoch(next(cached)) for user_uuid in users_uuids}
+        for role_uuid in roles_uuids:
+            self.permissions_epochs.load_role_epoch(role_uuid, next(cached))
+
+        verified: list[tuple[int, bytes, TokenClaims]] = []
+        oauth_to_verify: list[tuple[int, bytes, TokenClaims, str]] = []
+        for (index, token, token_digest, token_schema), session_verified in zip(to_verify, sessions_verified):
+            if session_verified is None:
+                if self._is_accepted_degraded(token_schema):
+                    logger.info(f'verify_token: {token_schema.session_uuid=:} is accepted by degraded policy')
+                    token_schemas[index] = token_schema
+                continue
+
+            if not session_verified:
+                logger.error(f'verify_token: theres no refresh_token by {token_schema.session_uuid=:} or it doesnt match')
+                continue
+
+            if token_schema.type == TokenTypesEnum.access and \
+                    self._are_epochs_stale(token_schema, users_epochs[token_schema.sub]):
+                logger.info(f'verify_token: permissions epochs of {token_schema=:} are stale')
+                continue
+
+            if token_schema.oauth_type == OAuthTypesEnum.local:
+                verified.append((index, token_digest, token_schema))
+                continue
+
+            # token issued before OAUTH_TOKEN_SERVER_SIDE carries oauth-provider token itself
+            oauth_token = token_schema.oauth_token
+            if not oauth_token:
+                oauth_token_cached = oauth_tokens_cached[token_schema.session_uuid]
+                if oauth_token_cached is None:
+                    logger.error(f'verify_token: theres no oauth_token by {token_schema.session_uuid=:}')
+                    continue
+                oauth_token = oauth_token_cached.decode('utf-8')
+            oauth_to_verify.append((index, token_digest, token_schema, oauth_token))
+
+        if oauth_to_verify:
+            # one failing provider call must not fail verification of the whole batch
+            tokens_info = await asyncio.gather(
+                *(get_user_info_oauth(oauth_token, oauth_type=token_schema.oauth_type)
+                  for _, _, token_schema, oauth_token in oauth_to_verify),
+                return_exceptions=True)
+            for (index, token_digest, token_schema, _), token_info in zip(oauth_to_verify, tokens_info):
+                if isinstance(token_info, Exception):
+                    logger.error(f'verify_token: oauth_token by {token_schema.session_uuid=:} '
+                                 f'wasnt verified, error= {token_info}')
+                    continue
+                if token_info is None:
+                    logger.info(f'verify_token: oauth_token by {token_schema.session_uuid=:} is not valid')
+                    continue
+                verified.append((index, token_digest, token_schema))
+
+        for index, token_digest, token_schema in verified:
+            if token_schema.type == TokenTypesEnum.access:
+                self.tokens_cache.set_token_schema(token_digest, token_schema)
+            token_schemas[index] = token_schema
+
+        return token_schemas
 
     async def login(self,
                     user_login_schema: UserLoginSchema,
@@ -171,7 +506,7 @@ class AuthManager():
 
         return token_pair
 
-    async def logout(self, access_token_schema: TokenReadSchema):
+    async def logout(self, access_token_schema: TokenClaims):
         """
         from token get session_uuid
         if session exists in db - deactivate it
@@ -183,41 +518,115 @@ class AuthManager():
             await self.repo.update(session_db, SessionUpdateSerializer(is_active=False))
             logger.info(f'logout: updated {session_db=:}')
 
-        await self.cache.delete(session_uuid)
+        await self._invalidate_sessions([session_uuid])
+        await self._delete_sessions_cached([session_uuid])
+        await self.invalidate_principal(access_token_schema.sub)
+        await self.cache.remove_set_members(user_sessions_key(access_token_schema.sub), [session_uuid])
         logger.info(f'logout: deleted from cache by {session_uuid=:}')
 
-    async def logout_all(self, access_token_schema: TokenReadSchema):
-        """
-        from token get user and all its active sessions
-        for every session:
-            deactivate in db
-            delete session from cache
-        """
-        user: UserModel = await self.repo.get(UserModel, uuid=access_token_schema.sub)
-        for session in user.active_sessions:
-            await self.repo.update(session, {'is_active': False})
-            await self.cache.delete(session.uuid)
-        logger.info(f'logout_all: for {user=:} deactivated all sessions db, deleted all sessions cached')
-
-    async def refresh(self, refresh_token: str) -> TokenPairEncodedSerializer:
-        """
-        - create new token pair from old refresh_token data
-        - update refresh token in cache
-        """
-        refresh_token_schema = TokenReadSchema.from_jwt(refresh_token)
-        token_pair = await create_token_pair(user_uuid=refresh_token_schema.sub,
-                                             email=refresh_token_schema.email,
-                                             permissions=refresh_token_schema.permissions,
-                                             session_uuid=refresh_token_schema.session_uuid,
-                                             ip=refresh_token_schema.ip,
-                                             useragent=refresh_token_schema.useragent,
-                                             oauth_type=refresh_token_schema.oauth_type,
-                                             oauth_token=refresh_token_schema.oauth_token,
-                                             )
-        await self.cache.set(refresh_token_schema.session_uuid,
-                             token_pair.refresh_token,
-                             ex=dt.timedelta(minutes=config.REFRESH_TOKEN_EXP_MIN))
-        return token_pair
+    async def logout_all(self, access_token_schema: TokenClaims):
+        """
+        deactivate all active sessions of user in db with one update,
+        take sessions of user from cache index with one round trip,
+        delete all of them from cache with one round trip, regardless of their number
+        """
+        user_uuid = access_token_schema.sub
+        sessions_uuids = set(await self.repo.update_all(SessionModel, {'is_active': False},
+                                                        user_uuid=user_uuid, is_active=True))
+        # sessions indexed in cache but not active in db yet / anymore are revoked too
+        sessions_uuids.update(session_uuid.decode('utf-8')
+                              for session_uuid in await self.cache.pop_set_members(user_sessions_key(user_uuid)))
+        sessions_uuids = list(sessions_uuids)
+        await self._invalidate_sessions(sessions_uuids)
+        await self._delete_sessions_cached(sessions_uuids)
+        await self.invalidate_principal(user_uuid)
+        logger.info(f'logout_all: for {user_uuid=:} deactivated {len(sessions_uuids)} sessions in db and cache')
+
+    async def _get_rotated_token_pair(
+            self,
+            refresh_token: str,
+            session_from_request: SessionFingerprint) -> TokenPairEncodedSerializer | None:
+        """token pair refresh_token was rotated to, if it was rotated within grace window"""
+        refresh_token_schema, = await self._read_token_schemas([refresh_token])
+        if refresh_token_schema is None or refresh_token_schema.type != TokenTypesEnum.refresh or \
+                not self._session_matches(refresh_token_schema, session_from_request):
+            return None
+        rotated_cached, = await self.cache.get_hashes([rotated_refresh_token_key(refresh_token_schema.session_uuid)])
+        if rotated_cached.get(b'refresh_token') != get_token_digest(refresh_token):
+            return None
+        logger.info(f'refresh: {refresh_token_schema.session_uuid=:} was refreshed within grace window')
+        return TokenPairEncodedSerializer.parse_raw(rotated_cached[b'token_pair'])
+
+    async def refresh(self, refresh_token: str, session_from_request: SessionFingerprint) -> TokenPairEncodedSerializer:
+        """
+        - verify refresh_token, if it was rotated by concurrent refresh within grace window -
+          return the same token pair it was rotated to
+        - create new token pair from refresh_token data,
+          user permissions are read from db if permissions epochs of refresh_token are stale
+        - rotate refresh token in cache with compare-and-swap, if concurrent refresh rotated it first -
+          return its token pair, oauth-provider token ttl is extended
+        """
+        refresh_token_schema = await self.get_verified_token_schema(refresh_token, session_from_request)
+        if refresh_token_schema is None:
+            token_pair = await self._get_rotated_token_pair(refresh_token, session_from_request)
+            if token_pair is None:
+                raise UnauthorizedException
+            return token_pair
+
+        token_role_epochs = refresh_token_schema.role_epochs
+        role_epochs, user_epoch = await self._get_permissions_epochs(refresh_token_schema.sub, token_role_epochs or ())
+        email, permissions = refresh_token_schema.email, refresh_token_schema.permissions
+        if token_role_epochs is None or self._are_epochs_stale(refresh_token_schema, user_epoch):
+            # epochs of token roles are read before user, epochs of roles user got meanwhile - after it
+            user = await self.repo.get(UserModel, uuid=refresh_token_schema.sub)
+            if user is None:
+                raise UnauthorizedException
+            email, permissions = user.email, user.permissions_names
+            role_epochs.update(await self._get_role_epochs([role_uuid for role_uuid in user.roles_uuids
+                                                            if role_uuid not in role_epochs]))
+            role_epochs = {role_uuid: role_epochs[role_uuid] for role_uuid in user.roles_uuids}
+            logger.info(f'refresh: permissions epochs are stale, read {permissions=:} of {user=:}')
+        # epochs of token minted by worker which got bump earlier are higher than the ones known here, they are kept
+        role_epochs = {role_uuid: max(epoch, (token_role_epochs or {}).get(role_uuid, 0))
+                       for role_uuid, epoch in role_epochs.items()}
+        user_epoch = max(user_epoch, refresh_token_schema.user_epoch)
+        token_pair = await self._create_token_pair(user_uuid=refresh_token_schema.sub,
+                                                   email=email,
+                                                   permissions=permissions,
+                                                   session_uuid=refresh_token_schema.session_uuid,
+                                                   ip=refresh_token_schema.ip,
+                                                   useragent=refresh_token_schema.useragent,
+                                                   oauth_type=refresh_token_schema.oauth_type,
+                                                   oauth_token=refresh_token_schema.oauth_token,
+                                                   role_epochs=role_epochs,
+                                                   user_epoch=user_epoch,
+                                                   )
+        # claims of old opaque refresh token are kept for grace window, so its concurrent refreshes can be verified
+        rotated = await self.cache.rotate_refresh_token(
+            session_key(refresh_token_schema.session_uuid),
+            get_token_digest(refresh_token),
+            get_token_digest(token_pair.refresh_token),
+            ex=dt.timedelta(minutes=config.REFRESH_TOKEN_EXP_MIN),
+            key_to_expire=oauth_token_key(refresh_token_schema.session_uuid),
+            rotated=rotated_refresh_token_key(refresh_token_schema.session_uuid),
+            rotated_data=token_pair.json(),
+            rotated_ex=config.REFRESH_TOKEN_ROTATION_GRACE_SEC,
+            key_to_keep_rotated=opaque_token_key(get_opaque_token_digest(refresh_token))
+            if is_opaque_token(refresh_token) else None)
+        if rotated is True:
+            await self.cache.add_set_members(user_sessions_key(refresh_token_schema.sub),
+                                             [refresh_token_schema.session_uuid],
+                                             ex=dt.timedelta(minutes=config.REFRESH_TOKEN_EXP_MIN))
+            return token_pair
+
+        if is_opaque_token(token_pair.refresh_token):
+            await self.cache.delete_many([opaque_token_key(get_opaque_token_digest(token))
+                                          for token in (token_pair.access_token, token_pair.refresh_token)])
+        if rotated is False:
+            logger.info(f'refresh: {refresh_token_schema.session_uuid=:} was revoked meanwhile')
+            raise UnauthorizedException
+        logger.info(f'refresh: {refresh_token_schema.session_uuid=:} was refreshed concurrently')
+        return TokenPairEncodedSerializer.parse_raw(rotated)
 
     @staticmethod
     async def send_service_request_post(url, url_postfix, headers, body, user):
@@ -263,8 +672,12 @@ class AuthManager():
         try:
             # async with self.repo.session.begin():
             user: UserModel = await self.repo.create_user(user_ser)
-            registered_role = await self.repo.get(RoleModel, name=RolesNamesEnum.registered)
-            user.roles.append(registered_role)
+            registered_role = await roles_catalog.load_role_by_name(RolesNamesEnum.registered)
+            if registered_role is None:
+                logger.error(f'register: role {RolesNamesEnum.registered} was not found')
+                raise RoleWasNotFoundException
+            # role is linked by uuid from catalog, without loading it (and its users) from db
+            self.repo.session.add(UserRoleAssociation(user_uuid=user.uuid, role_uuid=registered_role.uuid))
             await self.repo.session.commit()
             await self.repo.session.refresh(user)
             resp = await self.send_duplicate_user_request_to_notifications_service(user)
@@ -285,6 +698,7 @@ class AuthManager():
         user = await self.repo.get(UserModel, email=token_schema.email)
         if dt.datetime.utcnow() <= token_schema.exp:
             user = await self.repo.update(user, {'is_active': True})
+            await self.invalidate_principal(user.uuid)
             return user
         await self.send_duplicate_user_request_to_notifications_service(user)
         await self.create_and_send_notify_temporary_register_token(user)
@@ -1,12 +1,18 @@
+import asyncio
 import datetime as dt
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator
 
-from redis.asyncio import Redis
-from redis.exceptions import RedisError
+from redis.asyncio import Redis, RedisCluster
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ConnectionError, RedisError, TimeoutError
 
+from core import config
 from core.logger_config import setup_logger
+from services.cache.circuit_breaker import CircuitBreaker, redis_circuit_breaker
+from services.cache.scripts import REVOKE_SESSIONS, ROTATE_REFRESH_TOKEN, VERIFY_SESSIONS
 
 SERVICE_DIR = Path(__file__).resolve().parent
 SERVICE_NAME = SERVICE_DIR.stem
@@ -28,35 +34,300 @@ class Cache(ABC):
     def delete(self, *args, **kwargs):
         pass
 
+    @abstractmethod
+    async def set_many(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def get_many(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def delete_many(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    def pipeline(self, *args, **kwargs):
+        pass
+
 
 class RedisCache(Cache):
+    """
+    - multi-key operations take one round trip
+    - values are logged only if log_values, otherwise only their size is logged
+    - with cluster client multi-key operations take one round trip per slot (in parallel),
+      pipelines are not transactions
+    - calls go through circuit breaker shared by all instances of the process, while it is open they fail
+      right away the same way as on redis errors: reads return None, writes are skipped
+    """
 
-    def __init__(self, redis: Redis):
+    def __init__(self,
+                 redis: Redis | RedisCluster,
+                 log_values: bool = config.CACHE_LOG_VALUES,
+                 breaker: CircuitBreaker = redis_circuit_breaker):
         self.redis = redis
+        self.log_values = log_values
+        self.breaker = breaker
+        self.is_cluster = isinstance(redis, RedisCluster)
+
+    def _get_slots_indexes(self, sessions: list[str], keys: list[str]) -> list[tuple[list[int], list[int]]]:
+        """indexes of sessions and indexes of keys of every cluster slot they are in"""
+        slots_indexes: dict[int, tuple[list[int], list[int]]] = {}
+        for indexes_index, slot_keys in enumerate((sessions, keys)):
+            for index, key in enumerate(slot_keys):
+                slots_indexes.setdefault(self.redis.keyslot(key), ([], []))[indexes_index].append(index)
+        return list(slots_indexes.values())
+
+    def _loggable(self, data: Any) -> Any:
+        if self.log_values or data is None:
+            return data
+        if isinstance(data, (bytes, str)):
+            return f'<{len(data)} bytes>'
+        return f'<{type(data).__name__}>'
 
     async def set(self, key: str, data: Any, ex: int | dt.timedelta) -> None:
         try:
-            await self.redis.set(key, data, ex=ex)
-            logger.info('set: by key= %s, set data= %s, ex= %s', key, data, ex)
+            await self.breaker.call(self.redis.set(key, data, ex=ex))
+            logger.info('set: by key= %s, set data= %s, ex= %s', key, self._loggable(data), ex)
         except RedisError as e:
-            logger.error('set: by key= %s, failed to set data= %s, error= %s', key, data, e)
+            logger.error('set: by key= %s, failed to set data= %s, error= %s', key, self._loggable(data), e)
 
     async def get(self, key: str) -> bytes | None:
         data = None
         try:
-            data = await self.redis.get(key)
+            data = await self.breaker.call(self.redis.get(key))
             if data is not None:
-                logger.info('get: by key= %s, data= %s', key, data)
+                logger.info('get: by key= %s, data= %s', key, self._loggable(data))
         except RedisError as e:
-            logger.error('get: by key= %s, failed to get data= %s, error= %s', key, data, e)
+            logger.error('get: by key= %s, failed to get data, error= %s', key, e)
         return data
 
+    async def set_many(self, mapping: dict[str, Any], ex: int | dt.timedelta) -> None:
+        if not mapping:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, data in mapping.items():
+                    pipe.set(key, data, ex=ex)
+                await self.breaker.call(pipe.execute())
+            logger.info('set_many: by keys= %s, ex= %s', list(mapping), ex)
+        except RedisError as e:
+            logger.error('set_many: by keys= %s, failed to set data, error= %s', list(mapping), e)
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        if not keys:
+            return []
+        data = [None] * len(keys)
+        try:
+            data = await self._get_many(keys)
+            logger.info('get_many: by keys= %s, found= %s', keys, sum(1 for value in data if value is not None))
+        except RedisError as e:
+            logger.error('get_many: by keys= %s, failed to get data, error= %s', keys, e)
+        return data
+
+    async def _get_many(self, keys: list[str]) -> list[bytes | None]:
+        """get_many raising RedisError, for callers telling unavailable redis from missing keys"""
+        return await self.breaker.call(self.redis.mget_nonatomic(keys) if self.is_cluster else self.redis.mget(keys))
+
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False) -> AsyncIterator[Pipeline]:
+        """
+        commands queued to yielded pipeline are sent in one round trip on exit,
+        results are not returned, so it is for writes, it is not a transaction with cluster client,
+        RedisError is logged and raised, so caller doesn't hand out data which wasn't written
+        """
+        async with self.redis.pipeline(transaction=transaction and not self.is_cluster) as pipe:
+            yield pipe
+            try:
+                await self.breaker.call(pipe.execute())
+                logger.info('pipeline: executed')
+            except RedisError as e:
+                logger.error('pipeline: failed to execute, error= %s', e)
+                raise
+
+    async def set_hash(self, key: str, mapping: dict, ex: int | dt.timedelta) -> None:
+        try:
+            async with self.redis.pipeline(transaction=not self.is_cluster) as pipe:
+                await self.breaker.call(pipe.hset(key, mapping=mapping).expire(key, ex).execute())
+            logger.info('set_hash: by key= %s, ex= %s', key, ex)
+        except RedisError as e:
+            logger.error('set_hash: by key= %s, failed to set hash, error= %s', key, e)
+
+    async def add_set_members(self, key: str, members: list[str], ex: int | dt.timedelta) -> None:
+        """add members to set and reset its ttl in one round trip"""
+        try:
+            async with self.redis.pipeline(transaction=not self.is_cluster) as pipe:
+                await self.breaker.call(pipe.sadd(key, *members).expire(key, ex).execute())
+            logger.info('add_set_members: by key= %s, members= %s, ex= %s', key, members, ex)
+        except RedisError as e:
+            logger.error('add_set_members: by key= %s, failed to add members, error= %s', key, e)
+
+    async def remove_set_members(self, key: str, members: list[str]) -> None:
+        try:
+            removed = await self.breaker.call(self.redis.srem(key, *members))
+            logger.info('remove_set_members: by key= %s, removed= %s', key, removed)
+        except RedisError as e:
+            logger.error('remove_set_members: by key= %s, failed to remove members, error= %s', key, e)
+
+    async def pop_set_members(self, key: str) -> list[bytes]:
+        """all members of set, set is deleted in the same round trip"""
+        members = []
+        try:
+            async with self.redis.pipeline(transaction=not self.is_cluster) as pipe:
+                members, _ = await self.breaker.call(pipe.smembers(key).unlink(key).execute())
+            logger.info('pop_set_members: by key= %s, found= %s', key, len(members))
+        except RedisError as e:
+            logger.error('pop_set_members: by key= %s, failed to pop members, error= %s', key, e)
+        return list(members)
+
+    async def get_hashes(self, keys: list[str]) -> list[dict[bytes, bytes]]:
+        """HGETALL of every key in one round trip, empty dict for missing keys"""
+        if not keys:
+            return []
+        data = [{} for _ in keys]
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.hgetall(key)
+                data = await self.breaker.call(pipe.execute())
+            logger.info('get_hashes: by keys= %s, found= %s', keys, sum(1 for value in data if value))
+        except RedisError as e:
+            logger.error('get_hashes: by keys= %s, failed to get data, error= %s', keys, e)
+        return data
+
+    async def incr(self, key: str) -> int | None:
+        try:
+            data = await self.breaker.call(self.redis.incr(key))
+            logger.info('incr: by key= %s, data= %s', key, data)
+            return data
+        except RedisError as e:
+            logger.error('incr: by key= %s, failed to incr, error= %s', key, e)
+            return None
+
+    async def expire(self, key: str, ex: int | dt.timedelta) -> None:
+        try:
+            await self.breaker.call(self.redis.expire(key, ex))
+            logger.info('expire: by key= %s, ex= %s', key, ex)
+        except RedisError as e:
+            logger.error('expire: by key= %s, failed to set ex= %s, error= %s', key, ex, e)
+
     async def delete(self, key: str) -> None:
-        data = None
         try:
-            data = await self.redis.get(key)
-            if data is not None:
-                await self.redis.delete(key)
-                logger.info('delete: by key= %s, deleted data: %s', key, data)
+            deleted = await self.breaker.call(self.redis.unlink(key))
+            logger.info('delete: by key= %s, deleted= %s', key, deleted)
+        except RedisError as e:
+            logger.error('delete: by key= %s, failed to delete, error= %s', key, e)
+
+    async def delete_many(self, keys: list[str]) -> None:
+        if not keys:
+            return
+        try:
+            deleted = await self.breaker.call(self.redis.unlink(*keys))
+            logger.info('delete_many: by keys= %s, deleted= %s', keys, deleted)
         except RedisError as e:
-            logger.error('delete: by key= %s, failed to delete data= %s, error= %s', key, data, e)
+            logger.error('delete_many: by keys= %s, failed to delete, error= %s', keys, e)
+
+    async def verify_sessions(self,
+                              sessions: list[tuple[str, bytes | str]],
+                              keys: list[str]) -> tuple[list[bool | None], list[bytes | None]]:
+        """
+        in one round trip:
+        - for every (session key, refresh token digest) whether session is cached and its refresh token digest
+          is the provided one, empty digest - whether session is cached,
+          None if redis is unavailable (connection error, timeout, open circuit breaker)
+        - values of keys
+        """
+        if not sessions and not keys:
+            return [], []
+        flags, data = [False] * len(sessions), [None] * len(keys)
+        try:
+            if self.is_cluster:
+                flags, data = await self.breaker.call(self._verify_sessions_by_slots(sessions, keys))
+            else:
+                result = await self.breaker.call(VERIFY_SESSIONS(
+                    self.redis, [session for session, _ in sessions] + keys,
+                    [refresh_token_digest for _, refresh_token_digest in sessions]))
+                flags, data = [bool(flag) for flag in result[:len(sessions)]], result[len(sessions):]
+            logger.info('verify_sessions: by sessions= %s, verified= %s', len(sessions), sum(flags))
+        except (ConnectionError, TimeoutError) as e:
+            flags = [None] * len(sessions)
+            logger.error('verify_sessions: by sessions= %s, redis is unavailable, error= %s', len(sessions), e)
+        except RedisError as e:
+            logger.error('verify_sessions: by sessions= %s, failed to verify, error= %s', len(sessions), e)
+        return flags, data
+
+    async def _verify_sessions_by_slots(self,
+                                        sessions: list[tuple[str, bytes | str]],
+                                        keys: list[str]) -> tuple[list[bool], list[bytes | None]]:
+        slots_indexes = self._get_slots_indexes([session for session, _ in sessions], keys)
+        results = await asyncio.gather(*[
+            VERIFY_SESSIONS(self.redis,
+                            [sessions[index][0] for index in sessions_indexes] + [keys[index] for index in keys_indexes],
+                            [sessions[index][1] for index in sessions_indexes])
+            for sessions_indexes, keys_indexes in slots_indexes])
+        flags, data = [False] * len(sessions), [None] * len(keys)
+        for (sessions_indexes, keys_indexes), result in zip(slots_indexes, results):
+            for index, flag in zip(sessions_indexes, result):
+                flags[index] = bool(flag)
+            for index, value in zip(keys_indexes, result[len(sessions_indexes):]):
+                data[index] = value
+        return flags, data
+
+    async def rotate_refresh_token(self, session: str, old_refresh_token_digest: bytes, new_refresh_token_digest: bytes,
+                                   ex: dt.timedelta, key_to_expire: str,
+                                   rotated: str, rotated_data: str, rotated_ex: int,
+                                   key_to_keep_rotated: str | None = None) -> bool | bytes:
+        """
+        in one round trip, if cached refresh token digest of session is still old_refresh_token_digest:
+        - set new_refresh_token_digest, expire key_to_expire with it
+        - keep old_refresh_token_digest with rotated_data by key rotated for rotated_ex sec,
+          expire key_to_keep_rotated with it
+        - return True
+        otherwise return rotated_data kept for old_refresh_token_digest, or False if there is no such
+        - with cluster client key_to_keep_rotated (of another slot) is expired after that
+        """
+        keys = [session, key_to_expire, rotated] if key_to_keep_rotated is None or self.is_cluster else \
+            [session, key_to_expire, rotated, key_to_keep_rotated]
+        try:
+            result = await self.breaker.call(ROTATE_REFRESH_TOKEN(
+                self.redis, keys,
+                [old_refresh_token_digest, new_refresh_token_digest, int(ex.total_seconds()), rotated_data, rotated_ex]))
+            if result == 1 and key_to_keep_rotated is not None and self.is_cluster:
+                await self.breaker.call(self.redis.expire(key_to_keep_rotated, rotated_ex))
+            logger.info('rotate_refresh_token: by key= %s, rotated= %s', session, result == 1)
+            return result if isinstance(result, bytes) else result == 1
+        except RedisError as e:
+            logger.error('rotate_refresh_token: by key= %s, failed to rotate, error= %s', session, e)
+            return False
+
+    async def revoke_sessions(self, sessions: list[str], keys: list[str], opaque_keys_prefix: str | None = None) -> int:
+        """
+        delete sessions and keys with one script call, return number of sessions which were cached
+        - with cluster client sessions with keys of the same slots are deleted with one script call per slot
+        - keys of opaque refresh tokens (opaque_keys_prefix + hex of refresh token digest returned by script)
+          are unlinked after it, with one more round trip only if opaque_keys_prefix is provided
+        """
+        if not sessions:
+            return 0
+        try:
+            if self.is_cluster:
+                refresh_tokens_digests = await self.breaker.call(self._revoke_sessions_by_slots(sessions, keys))
+            else:
+                refresh_tokens_digests = await self.breaker.call(
+                    REVOKE_SESSIONS(self.redis, sessions + keys, [len(sessions)]))
+            if opaque_keys_prefix is not None and refresh_tokens_digests:
+                await self.breaker.call(self.redis.unlink(*[opaque_keys_prefix + refresh_token_digest.hex()
+                                                            for refresh_token_digest in refresh_tokens_digests]))
+            logger.info('revoke_sessions: by keys= %s, revoked= %s', sessions, len(refresh_tokens_digests))
+            return len(refresh_tokens_digests)
+        except RedisError as e:
+            logger.error('revoke_sessions: by keys= %s, failed to revoke, error= %s', sessions, e)
+            return 0
+
+    async def _revoke_sessions_by_slots(self, sessions: list[str], keys: list[str]) -> list[bytes]:
+        results = await asyncio.gather(*[
+            REVOKE_SESSIONS(self.redis,
+                            [sessions[index] for index in sessions_indexes] + [keys[index] for index in keys_indexes],
+                            [len(sessions_indexes)])
+            for sessions_indexes, keys_indexes in self._get_slots_indexes(sessions, keys)])
+        return [refresh_token_digest for result in results for refresh_token_digest in result]
@@ -0,0 +1,114 @@
+import asyncio
+import random
+import time
+from pathlib import Path
+from typing import Awaitable, TypeVar
+
+from redis.exceptions import ConnectionError, TimeoutError
+
+from core import config
+from core.enums import CircuitBreakerStatesEnum
+from core.logger_config import setup_logger
+
+SERVICE_DIR = Path(__file__).resolve().parent
+SERVICE_NAME = SERVICE_DIR.stem
+
+logger = setup_logger(SERVICE_NAME, SERVICE_DIR)
+
+T = TypeVar('T')
+
+
+class CircuitOpenError(ConnectionError):
+    """call wasn't made, because circuit breaker is open"""
+
+
+class CircuitBreaker():
+    """
+    fails redis calls fast while redis is unavailable:
+    - closed: calls go through, failure_threshold consecutive failures (connection errors, timeouts) open it
+    - open: calls fail right away with CircuitOpenError, after open_sec it is half-open
+    - half-open: share of calls let through grows from 0 to all during recovery_sec, so recovering redis
+      isn't hit with the whole load at once, any failure opens it again, after recovery_sec it is closed
+    - every call is limited with call_timeout_sec
+    - state transitions and rejected calls are counted, transitions are logged
+    """
+
+    def __init__(self,
+                 failure_threshold: int = config.REDIS_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 open_sec: float = config.REDIS_CIRCUIT_BREAKER_OPEN_SEC,
+                 recovery_sec: float = config.REDIS_CIRCUIT_BREAKER_RECOVERY_SEC,
+                 call_timeout_sec: float = config.REDIS_CIRCUIT_BREAKER_CALL_TIMEOUT_SEC):
+        self.failure_threshold = failure_threshold
+        self.open_sec = open_sec
+        self.recovery_sec = recovery_sec
+        self.call_timeout_sec = call_timeout_sec
+        self.state = CircuitBreakerStatesEnum.closed
+        self.state_changed_at = time.monotonic()
+        self.failures = 0
+        self.rejected = 0
+        self.transitions: dict[str, int] = {}
+
+    def _set_state(self, state: CircuitBreakerStatesEnum) -> None:
+        transition = f'{self.state}->{state}'
+        logger.info(f'_set_state: {transition=:} after {self.failures=:}')
+        self.transitions[transition] = self.transitions.get(transition, 0) + 1
+        self.state = state
+        self.state_changed_at = time.monotonic()
+        self.failures = 0
+
+    def allow(self) -> bool:
+        if self.state == CircuitBreakerStatesEnum.closed:
+            return True
+        in_state_sec = time.monotonic() - self.state_changed_at
+        if self.state == CircuitBreakerStatesEnum.open:
+            if in_state_sec < self.open_sec:
+                self.rejected += 1
+                return False
+            self._set_state(CircuitBreakerStatesEnum.half_open)
+            in_state_sec = 0
+        if in_state_sec >= self.recovery_sec:
+            self._set_state(CircuitBreakerStatesEnum.closed)
+            return True
+        if random.random() < in_state_sec / self.recovery_sec:
+            return True
+        self.rejected += 1
+        return False
+
+    def on_success(self) -> None:
+        self.failures = 0
+
+    def on_failure(self) -> None:
+        self.failures += 1
+        if self.state == CircuitBreakerStatesEnum.half_open:
+            self._set_state(CircuitBreakerStatesEnum.open)
+        elif self.state == CircuitBreakerStatesEnum.closed and self.failures >= self.failure_threshold:
+            self._set_state(CircuitBreakerStatesEnum.open)
+
+    async def call(self, awaitable: Awaitable[T]) -> T:
+        """await redis call if it is allowed, raise CircuitOpenError otherwise"""
+        if not self.allow():
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise CircuitOpenError(f'circuit breaker is {self.state}')
+        try:
+            result = await asyncio.wait_for(awaitable, self.call_timeout_sec)
+        except asyncio.TimeoutError:
+            self.on_failure()
+            raise TimeoutError(f'redis call timed out after {self.call_timeout_sec} sec')
+        except (ConnectionError, TimeoutError):
+            self.on_failure()
+            raise
+        self.on_success()
+        return result
+
+    def stats(self) -> dict[str, str | int | dict[str, int]]:
+        return {
+            'state': self.state.value,
+            'state_sec': int(time.monotonic() - self.state_changed_at),
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'transitions': dict(self.transitions),
+        }
+
+
+redis_circuit_breaker = CircuitBreaker()
@@ -0,0 +1,116 @@
+import asyncio
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable
+
+import pydantic as pd
+from redis.asyncio import Redis, RedisCluster
+from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError
+
+from auth_client.revocation import REVOCATION_EVENTS, REVOCATION_STREAM
+from core import config
+from core.enums import InvalidationEventsEnum
+from core.logger_config import setup_logger
+from db.serializers.invalidation_event import InvalidationEventSchema
+
+SERVICE_DIR = Path(__file__).resolve().parent
+SERVICE_NAME = SERVICE_DIR.stem
+
+logger = setup_logger(SERVICE_NAME, SERVICE_DIR)
+
+InvalidationHandler = Callable[[list[str]], None]
+
+
+class InvalidationBus():
+    """
+    propagates invalidation of per-process caches between workers over redis pub/sub
+    - local caches subscribe handlers for event types
+    - mutating paths publish typed events, publisher applies them to its local caches right away
+    - every other worker applies them when they are received from channel
+    - after (re)subscribing 'reset' event is applied, because events published meanwhile were missed
+    - revocation events are also appended to revocation stream followed by auth_client of other services
+    - pubsub_redis is used for the channel if redis has no pub/sub (cluster), redis - for the stream
+    """
+
+    def __init__(self, redis: Redis | RedisCluster, channel: str = config.INVALIDATION_BUS_CHANNEL,
+                 pubsub_redis: Redis | None = None):
+        self.redis = redis
+        self.pubsub_redis = pubsub_redis or redis
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex
+        self.handlers: dict[InvalidationEventsEnum, list[InvalidationHandler]] = defaultdict(list)
+        self._pubsub: PubSub | None = None
+        self._listener_task: asyncio.Task | None = None
+
+    def subscribe(self, event_type: InvalidationEventsEnum, handler: InvalidationHandler) -> None:
+        self.handlers[event_type].append(handler)
+
+    def apply(self, event: InvalidationEventSchema) -> None:
+        for handler in self.handlers[event.type]:
+            try:
+                handler(event.keys)
+            except Exception as e:
+                logger.error(f'apply: {handler=:} failed for {event=:}: {e}')
+
+    async def publish(self, event_type: InvalidationEventsEnum, keys: list[str]) -> None:
+        event = InvalidationEventSchema(type=event_type, keys=keys, origin=self.worker_id)
+        self.apply(event)
+        stream_entry = {'type': event_type.value, 'keys': ','.join(keys)}
+        try:
+            if self.pubsub_redis is not self.redis:
+                await self.pubsub_redis.publish(self.channel, event.json())
+                if event_type in REVOCATION_EVENTS:
+                    await self.redis.xadd(REVOCATION_STREAM, stream_entry,
+                                          maxlen=config.REVOCATION_STREAM_MAX_LEN, approximate=True)
+                return
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.publish(self.channel, event.json())
+                if event_type in REVOCATION_EVENTS:
+                    pipe.xadd(REVOCATION_STREAM, stream_entry, maxlen=config.REVOCATION_STREAM_MAX_LEN, approximate=True)
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f'publish: failed to publish {event=:}: {e}')
+
+    async def start(self) -> None:
+        self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+            self._pubsub = None
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                self._pubsub = self.pubsub_redis.pubsub(ignore_subscribe_messages=True)
+                await self._pubsub.subscribe(self.channel)
+                self.apply(InvalidationEventSchema(type=InvalidationEventsEnum.reset))
+                logger.info(f'_listen: {self.worker_id=:} subscribed to {self.channel=:}')
+                while True:
+                    # blocking read would time out by socket timeout of idle channel
+                    message = await self._pubsub.get_message(ignore_subscribe_messages=True,
+                                                             timeout=config.INVALIDATION_BUS_READ_TIMEOUT_SEC)
+                    if message is not None:
+                        self._on_message(message)
+            except RedisError as e:
+                logger.error(f'_listen: {self.channel=:} connection failed: {e}, resubscribing')
+                await self._pubsub.close()
+                await asyncio.sleep(1)
+
+    def _on_message(self, message: dict) -> None:
+        try:
+            event = InvalidationEventSchema.parse_raw(message['data'])
+        except pd.ValidationError as e:
+            logger.error(f'_on_message: invalid {message=:}: {e}')
+            return
+        if event.origin != self.worker_id:
+            self.apply(event)
@@ -0,0 +1,49 @@
+"""
+redis keys of cached data,
+keys related to one session share '{session_uuid}' hash tag, so they are placed to the same cluster slot
+"""
+
+
+def session_key(session_uuid: str) -> str:
+    # value: digest of session refresh token
+    return f'session:{{{session_uuid}}}'
+
+
+def oauth_token_key(session_uuid: str) -> str:
+    # value: oauth-provider token of session
+    return f'oauth_token:{{{session_uuid}}}'
+
+
+def rotated_refresh_token_key(session_uuid: str) -> str:
+    # value: hash of last rotated refresh token of session and token pair it was rotated to
+    return f'rotated_refresh_token:{{{session_uuid}}}'
+
+
+def opaque_token_key(token_digest: str) -> str:
+    # value: hash of opaque token claims
+    return f'opaque_token:{token_digest}'
+
+
+def user_sessions_key(user_uuid: str) -> str:
+    # value: set of uuids of user sessions cached (some of them could be expired already)
+    return f'user_sessions:{user_uuid}'
+
+
+def principal_key(user_uuid: str) -> str:
+    # value: json of user principal snapshot read by /me endpoints
+    return f'principal:{user_uuid}'
+
+
+def principal_version_key(user_uuid: str) -> str:
+    # value: version of user principal, bumped on changes of user not covered by permissions epochs
+    return f'principal_version:{user_uuid}'
+
+
+def role_epoch_key(role_uuid: str) -> str:
+    # value: permissions epoch of role
+    return f'permissions_epoch:role:{role_uuid}'
+
+
+def user_epoch_key(user_uuid: str) -> str:
+    # value: permissions epoch of user
+    return f'permissions_epoch:{user_uuid}'
@@ -0,0 +1,81 @@
+import hashlib
+import time
+
+from auth_client.ttl_cache import LocalTTLCache
+from core import config
+from db.serializers.token import TokenClaims
+
+
+class VerifiedTokensCache(LocalTTLCache):
+    """
+    verified access token claims by token digest
+    - entry lives no longer than token exp
+    - entries are indexed by session_uuid to be dropped on logout / logout_all,
+      and by user (sub) to be dropped on user update
+    """
+
+    def __init__(self, max_size: int, max_ttl_sec: float):
+        super().__init__(max_size, max_ttl_sec)
+        self._digests_by_session: dict[str, set[bytes]] = {}
+        self._digests_by_user: dict[str, set[bytes]] = {}
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    @staticmethod
+    def _discard(index: dict[str, set[bytes]], index_key: str, token_digest: bytes) -> None:
+        digests = index.get(index_key)
+        if digests is not None:
+            digests.discard(token_digest)
+            if not digests:
+                del index[index_key]
+
+    def _on_remove(self, key: bytes, value: TokenClaims) -> None:
+        self._discard(self._digests_by_session, value.session_uuid, key)
+        self._discard(self._digests_by_user, value.sub, key)
+
+    def set_token_schema(self, token_digest: bytes, token_schema: TokenClaims) -> bool:
+        ttl_sec = token_schema.exp - time.time()
+        is_set = self.set(token_digest, token_schema, ttl_sec)
+        if is_set:
+            self._digests_by_session.setdefault(token_schema.session_uuid, set()).add(token_digest)
+            self._digests_by_user.setdefault(token_schema.sub, set()).add(token_digest)
+        return is_set
+
+    def _invalidate(self, index: dict[str, set[bytes]], index_key: str) -> int:
+        digests = index.pop(index_key, set())
+        for token_digest in digests:
+            self._pop(token_digest)
+        return len(digests)
+
+    def invalidate_session(self, session_uuid: str) -> int:
+        return self._invalidate(self._digests_by_session, session_uuid)
+
+    def invalidate_sessions(self, sessions_uuids: list[str]) -> None:
+        for session_uuid in sessions_uuids:
+            self.invalidate_session(session_uuid)
+
+    def invalidate_users(self, users_uuids: list[str]) -> None:
+        for user_uuid in users_uuids:
+            self._invalidate(self._digests_by_user, user_uuid)
+
+
+class RevokedSessionsCache(LocalTTLCache):
+    """
+    snapshot of sessions ended recently, kept as long as their access tokens live,
+    it is what degraded verification relies on while redis is unavailable
+    """
+
+    def revoke_sessions(self, sessions_uuids: list[str]) -> None:
+        for session_uuid in sessions_uuids:
+            self.set(session_uuid, True)
+
+    def is_revoked(self, session_uuid: str) -> bool:
+        return self.get(session_uuid) is not None
+
+
+verified_tokens_cache = VerifiedTokensCache(max_size=config.VERIFIED_TOKENS_CACHE_MAX_SIZE,
+                                            max_ttl_sec=config.VERIFIED_TOKENS_CACHE_TTL_SEC)
+revoked_sessions_cache = RevokedSessionsCache(max_size=config.REVOKED_SESSIONS_CACHE_MAX_SIZE,
+                                              max_ttl_sec=config.ACCESS_TOKEN_EXP_MIN * 60)
@@ -0,0 +1,268 @@
+import asyncio
+import datetime as dt
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.asyncio.connection import Connection
+from redis.exceptions import ConnectionError, RedisError, TimeoutError
+
+from auth_client.ttl_cache import LocalTTLCache
+from core import config
+from core.logger_config import setup_logger
+from services.cache.cache import RedisCache
+
+SERVICE_DIR = Path(__file__).resolve().parent
+SERVICE_NAME = SERVICE_DIR.stem
+
+logger = setup_logger(SERVICE_NAME, SERVICE_DIR)
+
+INVALIDATE_CHANNEL = '__redis__:invalidate'
+
+
+class NearCachePolicy():
+    """near cache tier of keys starting with prefix"""
+    __slots__ = ('prefix', 'max_size', 'max_bytes', 'max_ttl_sec')
+
+    def __init__(self, prefix: str, max_size: int, max_bytes: int, max_ttl_sec: float):
+        self.prefix = prefix
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.max_ttl_sec = max_ttl_sec
+
+    def __repr__(self) -> str:
+        return f'NearCachePolicy(prefix={self.prefix!r}, max_size={self.max_size}, max_bytes={self.max_bytes})'
+
+
+class NearCacheTier(LocalTTLCache):
+    """
+    values of one policy keys, missing keys are cached as (None,) too,
+    least recently used entries are evicted also when size of values exceeds max_bytes
+    """
+
+    def __init__(self, policy: NearCachePolicy):
+        super().__init__(policy.max_size, policy.max_ttl_sec)
+        self.max_bytes = policy.max_bytes
+        self.bytes = 0
+
+    def _on_remove(self, key: str, value: tuple[bytes | None]) -> None:
+        self.bytes -= len(key) + len(value[0] or b'')
+
+    def set(self, key: str, value: tuple[bytes | None], ttl_sec: float | None = None) -> bool:
+        is_set = super().set(key, value, ttl_sec)
+        if is_set:
+            self.bytes += len(key) + len(value[0] or b'')
+            while self.bytes > self.max_bytes:
+                evicted_key, (_, evicted_value) = self._data.popitem(last=False)
+                self._on_remove(evicted_key, evicted_value)
+                self.evictions += 1
+        return is_set
+
+    def stats(self) -> dict[str, int]:
+        return {**super().stats(), 'bytes': self.bytes, 'max_bytes': self.max_bytes}
+
+
+class NearCache(RedisCache):
+    """
+    RedisCache with in-process tier of hot keys in front of redis:
+    - get / get_many / verify_sessions are served from tiers of keys with policies,
+      keys without policy always go to redis
+    - tiers are kept fresh with redis server-assisted client-side caching: one connection enables
+      CLIENT TRACKING in broadcast mode for policies prefixes, redirected to itself, and is subscribed
+      to invalidation channel (RESP2), every key changed by any client is dropped from tiers
+    - tiers are not used while tracking connection is down, and are cleared on (re)connect
+    - own writes drop keys from tiers right away
+    - value read while its invalidation arrived is not put to tier
+    """
+
+    def __init__(self, redis: Redis, policies: list[NearCachePolicy], log_values: bool = config.CACHE_LOG_VALUES):
+        super().__init__(redis, log_values=log_values)
+        # the longest prefix wins
+        self.policies = sorted(policies, key=lambda policy: len(policy.prefix), reverse=True)
+        self.tiers = {policy.prefix: NearCacheTier(policy) for policy in self.policies}
+        self.is_tracking = False
+        self._reads_in_flight: dict[str, int] = {}
+        self._invalidated_in_flight: set[str] = set()
+        self._tracking_task: asyncio.Task | None = None
+
+    def _get_tier(self, key: str) -> NearCacheTier | None:
+        for policy in self.policies:
+            if key.startswith(policy.prefix):
+                return self.tiers[policy.prefix]
+        return None
+
+    def _invalidate(self, keys: list[str]) -> None:
+        for key in keys:
+            tier = self._get_tier(key)
+            if tier is not None:
+                tier.delete(key)
+            if key in self._reads_in_flight:
+                self._invalidated_in_flight.add(key)
+
+    def clear(self) -> None:
+        for tier in self.tiers.values():
+            tier.clear()
+        self._invalidated_in_flight.update(self._reads_in_flight)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {prefix: tier.stats() for prefix, tier in self.tiers.items()}
+
+    async def _get_many(self, keys: list[str]) -> list[bytes | None]:
+        if not self.is_tracking:
+            return await super()._get_many(keys)
+        data: list[bytes | None] = [None] * len(keys)
+        to_read: list[tuple[int, str, NearCacheTier | None]] = []
+        for index, key in enumerate(keys):
+            tier = self._get_tier(key)
+            entry = None if tier is None else tier.get(key)
+            if entry is None:
+                to_read.append((index, key, tier))
+            else:
+                data[index], = entry
+        if not to_read:
+            return data
+
+        keys_to_read = [key for _, key, tier in to_read if tier is not None]
+        for key in keys_to_read:
+            self._reads_in_flight[key] = self._reads_in_flight.get(key, 0) + 1
+        try:
+            data_read = await super()._get_many([key for _, key, _ in to_read])
+        finally:
+            for key in keys_to_read:
+                self._reads_in_flight[key] -= 1
+                if not self._reads_in_flight[key]:
+                    del self._reads_in_flight[key]
+        for (index, key, tier), value in zip(to_read, data_read):
+            data[index] = value
+            if tier is not None and key not in self._invalidated_in_flight and self.is_tracking:
+                tier.set(key, (value,))
+        self._invalidated_in_flight.intersection_update(self._reads_in_flight)
+        return data
+
+    async def get(self, key: str) -> bytes | None:
+        data, = await self.get_many([key])
+        return data
+
+    async def verify_sessions(self,
+                              sessions: list[tuple[str, bytes | str]],
+                              keys: list[str]) -> tuple[list[bool | None], list[bytes | None]]:
+        """
+        the same as RedisCache.verify_sessions, compared here with values of near cache, misses are read with one mget,
+        flags are None if redis is unavailable
+        """
+        if not self.is_tracking:
+            return await super().verify_sessions(sessions, keys)
+        try:
+            data = await self._get_many([session for session, _ in sessions] + keys)
+        except (ConnectionError, TimeoutError) as e:
+            logger.error('verify_sessions: by sessions= %s, redis is unavailable, error= %s', len(sessions), e)
+            return [None] * len(sessions), [None] * len(keys)
+        except RedisError as e:
+            logger.error('verify_sessions: by sessions= %s, failed to verify, error= %s', len(sessions), e)
+            return [False] * len(sessions), [None] * len(keys)
+        flags = [cached is not None and (not refresh_token_digest or cached == refresh_token_digest)
+                 for (_, refresh_token_digest), cached in zip(sessions, data)]
+        return flags, data[len(sessions):]
+
+    async def set(self, key: str, data: Any, ex: int | dt.timedelta) -> None:
+        self._invalidate([key])
+        await super().set(key, data, ex)
+
+    async def set_many(self, mapping: dict[str, Any], ex: int | dt.timedelta) -> None:
+        self._invalidate(list(mapping))
+        await super().set_many(mapping, ex)
+
+    async def incr(self, key: str) -> int | None:
+        self._invalidate([key])
+        return await super().incr(key)
+
+    async def delete(self, key: str) -> None:
+        self._invalidate([key])
+        await super().delete(key)
+
+    async def delete_many(self, keys: list[str]) -> None:
+        self._invalidate(keys)
+        await super().delete_many(keys)
+
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False) -> AsyncIterator[Pipeline]:
+        """the same as RedisCache.pipeline, keys of queued commands are dropped from tiers before they are sent"""
+        async with super().pipeline(transaction) as pipe:
+            yield pipe
+            self._invalidate([key.decode('utf-8') if isinstance(key, bytes) else key
+                              for key in (args[1] for args, _ in pipe.command_stack if len(args) > 1)])
+
+    async def rotate_refresh_token(self, session: str, *args, **kwargs) -> bool | bytes:
+        self._invalidate([session])
+        return await super().rotate_refresh_token(session, *args, **kwargs)
+
+    async def revoke_sessions(self, sessions: list[str], keys: list[str], opaque_keys_prefix: str | None = None) -> int:
+        self._invalidate(sessions + keys)
+        return await super().revoke_sessions(sessions, keys, opaque_keys_prefix)
+
+    async def start(self) -> None:
+        self._tracking_task = asyncio.create_task(self._track())
+
+    async def stop(self) -> None:
+        if self._tracking_task is not None:
+            self._tracking_task.cancel()
+            try:
+                await self._tracking_task
+            except asyncio.CancelledError:
+                pass
+            self._tracking_task = None
+
+    async def _connect(self) -> Connection:
+        connection: Connection = self.redis.connection_pool.make_connection()
+        await connection.connect()
+        await connection.send_command('CLIENT', 'ID')
+        client_id = await connection.read_response()
+        prefixes = [policy.prefix for policy in self.policies]
+        # prefixes can't overlap, without prefixes every key is tracked
+        prefixes_args = [] if '' in prefixes else [arg for prefix in prefixes for arg in ('PREFIX', prefix)]
+        await connection.send_command('CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id, 'BCAST', *prefixes_args)
+        await connection.read_response()
+        await connection.send_command('SUBSCRIBE', INVALIDATE_CHANNEL)
+        await connection.read_response()
+        return connection
+
+    async def _track(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = await self._connect()
+                self.clear()
+                self.is_tracking = True
+                logger.info(f'_track: tracking {self.policies=:}')
+                is_pinged = False
+                while True:
+                    message = await connection.read_response(timeout=config.NEAR_CACHE_PING_INTERVAL_SEC)
+                    if message is None:
+                        # silently dropped connection doesn't deliver invalidations, it is checked with ping
+                        if is_pinged:
+                            raise ConnectionError('tracking connection ping timeout')
+                        await connection.send_command('PING')
+                        is_pinged = True
+                        continue
+                    is_pinged = False
+                    self._on_message(message)
+            except (RedisError, OSError) as e:
+                logger.error(f'_track: tracking connection failed: {e}, reconnecting')
+            finally:
+                self.is_tracking = False
+                self.clear()
+                if connection is not None:
+                    await connection.disconnect()
+            await asyncio.sleep(1)
+
+    def _on_message(self, message: list) -> None:
+        if message[0] != b'message':
+            return
+        keys = message[2]
+        if keys is None:
+            # FLUSHDB / FLUSHALL
+            self.clear()
+            return
+        self._invalidate([key.decode('utf-8') for key in keys])
@@ -0,0 +1,68 @@
+from core.enums import InvalidationEventsEnum
+from services.cache.cache import RedisCache
+from services.cache.invalidation_bus import InvalidationBus
+from services.cache.keys import role_epoch_key, user_epoch_key
+
+
+def decode_epoch(epoch_cached: bytes | str | None) -> int:
+    return 0 if epoch_cached is None else int(epoch_cached)
+
+
+class PermissionsEpochs():
+    """
+    permissions epochs put to tokens ('role_epochs', 'user_epoch' claims), so permissions changes reach
+    tokens before they expire:
+    - role epoch is bumped on every change of one role, tokens carry epochs of roles of their user,
+      so role change makes stale only tokens of users of this role,
+      every worker keeps role epochs in memory updated over invalidation bus, after bus reset they are read
+      from cache again
+    - user epoch is bumped on changes of one user, it is read from cache together with sessions,
+      bumps are put to revocation stream as well as role epoch bumps, so auth_client rejects stale tokens too
+    - access tokens with epochs lower than current ones are rejected (token minted by worker which got bump
+      earlier is not), refresh re-reads permissions from db only if epochs of refresh token are stale
+    - tokens issued before role epochs have no 'role_epochs' claim (None), they are refreshed from db
+    """
+
+    def __init__(self):
+        self.role_epochs: dict[str, int] = {}
+
+    def load_role_epoch(self, role_uuid: str, epoch_cached: bytes | str | None) -> int:
+        # epochs only grow, value read from cache could be older than the one received from bus meanwhile
+        epoch = max(decode_epoch(epoch_cached), self.role_epochs.get(role_uuid, 0))
+        # missing value isn't kept, it could be failed read as well as role which epoch was never bumped
+        if epoch_cached is not None:
+            self.role_epochs[role_uuid] = epoch
+        return epoch
+
+    def get_missing(self, roles_uuids) -> list[str]:
+        """roles which epochs aren't in memory, they are read from cache with role_epoch_key"""
+        return [role_uuid for role_uuid in roles_uuids if role_uuid not in self.role_epochs]
+
+    def get_role_epochs(self, roles_uuids) -> dict[str, int]:
+        return {role_uuid: self.role_epochs.get(role_uuid, 0) for role_uuid in roles_uuids}
+
+    def are_roles_stale(self, role_epochs: dict[str, int] | None) -> bool:
+        """whether some of role_epochs (of token / snapshot) is lower than current epoch of its role in memory"""
+        return any(epoch < self.role_epochs.get(role_uuid, 0) for role_uuid, epoch in (role_epochs or {}).items())
+
+    def set_role_epoch(self, keys: list[str]) -> None:
+        role_uuid, epoch = keys
+        self.load_role_epoch(role_uuid, epoch)
+
+    def reset(self) -> None:
+        self.role_epochs = {}
+
+    @staticmethod
+    async def bump_role_epoch(cache: RedisCache, invalidation_bus: InvalidationBus, role_uuid: str) -> None:
+        epoch = await cache.incr(role_epoch_key(role_uuid))
+        if epoch is not None:
+            await invalidation_bus.publish(InvalidationEventsEnum.role_epoch_bumped, [role_uuid, str(epoch)])
+
+    @staticmethod
+    async def bump_user_epoch(cache: RedisCache, invalidation_bus: InvalidationBus, user_uuid: str) -> None:
+        epoch = await cache.incr(user_epoch_key(user_uuid))
+        if epoch is not None:
+            await invalidation_bus.publish(InvalidationEventsEnum.user_epoch_bumped, [user_uuid, str(epoch)])
+
+
+permissions_epochs = PermissionsEpochs()
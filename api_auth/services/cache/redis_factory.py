@@ -0,0 +1,63 @@
+from redis.asyncio import Redis, RedisCluster
+from redis.asyncio.retry import Retry
+from redis.asyncio.sentinel import Sentinel
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+
+from core import config
+from core.config import settings
+from core.enums import RedisModesEnum
+
+
+def get_connection_kwargs() -> dict:
+    """pool size, timeouts, health checks and retry policy of every redis connection"""
+    return {
+        'max_connections': settings.REDIS_MAX_CONNECTIONS,
+        'socket_timeout': settings.REDIS_SOCKET_TIMEOUT_SEC,
+        'socket_connect_timeout': settings.REDIS_SOCKET_CONNECT_TIMEOUT_SEC,
+        'socket_keepalive': True,
+        'health_check_interval': settings.REDIS_HEALTH_CHECK_INTERVAL_SEC,
+        'retry': Retry(ExponentialBackoff(cap=config.REDIS_RETRY_BACKOFF_CAP_SEC,
+                                          base=config.REDIS_RETRY_BACKOFF_BASE_SEC),
+                       settings.REDIS_RETRIES),
+        'retry_on_error': [ConnectionError, TimeoutError],
+    }
+
+
+def parse_sentinels(sentinels: str) -> list[tuple[str, int]]:
+    """'host:port,host:port' -> [(host, port), (host, port)]"""
+    addresses = []
+    for address in sentinels.split(','):
+        host, _, port = address.strip().rpartition(':')
+        addresses.append((host, int(port)))
+    return addresses
+
+
+def create_redis() -> Redis | RedisCluster:
+    """
+    redis client of settings.REDIS_MODE:
+    - standalone: pool of connections to REDIS_HOST:REDIS_PORT
+    - sentinel: pool of connections to current master of REDIS_SENTINEL_MASTER, rediscovered on failover
+    - cluster: pool per node, discovered from REDIS_HOST:REDIS_PORT, commands are routed by key slots
+    """
+    connection_kwargs = get_connection_kwargs()
+    if settings.REDIS_MODE == RedisModesEnum.sentinel:
+        if not settings.REDIS_SENTINELS:
+            raise ValueError('REDIS_SENTINELS is required in sentinel mode')
+        sentinel = Sentinel(parse_sentinels(settings.REDIS_SENTINELS),
+                            sentinel_kwargs={'socket_timeout': settings.REDIS_SOCKET_TIMEOUT_SEC,
+                                             'socket_connect_timeout': settings.REDIS_SOCKET_CONNECT_TIMEOUT_SEC})
+        return sentinel.master_for(settings.REDIS_SENTINEL_MASTER, **connection_kwargs)
+    if settings.REDIS_MODE == RedisModesEnum.cluster:
+        return RedisCluster(host=settings.REDIS_HOST, port=settings.REDIS_PORT, **connection_kwargs)
+    return Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, **connection_kwargs)
+
+
+def create_pubsub_redis(redis: Redis | RedisCluster) -> Redis:
+    """
+    client for pub/sub: cluster client has no pub/sub, messages published to any node of cluster
+    are delivered to subscribers of every node, so one node at REDIS_HOST:REDIS_PORT is used
+    """
+    if isinstance(redis, RedisCluster):
+        return Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, **get_connection_kwargs())
+    return redis
@@ -0,0 +1,114 @@
+import time
+from pathlib import Path
+
+from sqlalchemy.orm import noload, selectinload
+
+from core import config
+from core.enums import InvalidationEventsEnum
+from core.logger_config import setup_logger
+from db import SessionLocalAsync
+from db.models.permission import PermissionModel
+from db.models.role import RoleModel
+from db.repository import SqlAlchemyRepositoryAsync
+from db.serializers.permission import PermissionReadSerializer
+from db.serializers.role import RoleReadSerializer
+from services.cache.invalidation_bus import InvalidationBus
+from services.single_flight import SingleFlight
+
+SERVICE_DIR = Path(__file__).resolve().parent
+SERVICE_NAME = SERVICE_DIR.stem
+
+logger = setup_logger(SERVICE_NAME, SERVICE_DIR)
+
+
+class RolesCatalog():
+    """
+    per-process snapshot of roles, permissions and their mapping, so hot paths don't query these tables:
+    - it is loaded at startup with one query per table (users of roles are not loaded)
+    - it is stale after INVALIDATION_EVENTS of invalidation bus (the only invalidation path of role changes
+      made by api, publisher applies them to its own catalog right away)
+      and after max_age_sec (changes made bypassing api, e.g. by scripts)
+    - stale snapshot is reloaded on next ensure_fresh, concurrent reloads share one
+    - lookups by uuid / name return serializers, they are never changed in place, reload replaces them
+    """
+
+    INVALIDATION_EVENTS = (InvalidationEventsEnum.roles_updated,
+                           InvalidationEventsEnum.roles_deleted,
+                           InvalidationEventsEnum.reset)
+
+    def __init__(self,
+                 session_factory=SessionLocalAsync,
+                 max_age_sec: float = config.ROLES_CATALOG_MAX_AGE_SEC):
+        self.session_factory = session_factory
+        self.max_age_sec = max_age_sec
+        self.roles_by_uuid: dict[str, RoleReadSerializer] = {}
+        self.roles_by_name: dict[str, RoleReadSerializer] = {}
+        self.permissions_by_uuid: dict[str, PermissionReadSerializer] = {}
+        self.permissions_by_name: dict[str, PermissionReadSerializer] = {}
+        self.loaded_at: float | None = None
+        self.loads = 0
+        self._loads_in_flight = SingleFlight()
+
+    def is_fresh(self) -> bool:
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.max_age_sec
+
+    def subscribe(self, invalidation_bus: InvalidationBus) -> None:
+        for event_type in self.INVALIDATION_EVENTS:
+            invalidation_bus.subscribe(event_type, self.invalidate)
+
+    def invalidate(self, *args) -> None:
+        """invalidation bus handler, events keys are not used, the whole catalog is reloaded"""
+        self.loaded_at = None
+
+    async def load(self) -> None:
+        async with SqlAlchemyRepositoryAsync(self.session_factory()) as repo:
+            roles = await repo.get_all(RoleModel,
+                                       noload(RoleModel.users),
+                                       selectinload(RoleModel.permissions).noload(PermissionModel.roles))
+            permissions = await repo.get_all(PermissionModel, noload(PermissionModel.roles))
+            roles_sers = [RoleReadSerializer.from_orm(role) for role in roles]
+            permissions_sers = [PermissionReadSerializer.from_orm(permission) for permission in permissions]
+        self.roles_by_uuid = {role.uuid: role for role in roles_sers}
+        self.roles_by_name = {role.name: role for role in roles_sers}
+        self.permissions_by_uuid = {permission.uuid: permission for permission in permissions_sers}
+        self.permissions_by_name = {permission.name: permission for permission in permissions_sers}
+        self.loaded_at = time.monotonic()
+        self.loads += 1
+        logger.info(f'load: loaded {len(roles_sers)} roles, {len(permissions_sers)} permissions')
+
+    async def ensure_fresh(self) -> None:
+        if not self.is_fresh():
+            await self._loads_in_flight.do('load', self.load)
+
+    async def load_role_by_name(self, name: str) -> RoleReadSerializer | None:
+        """role by name from fresh catalog, on miss catalog is reloaded once, role could be created after load"""
+        await self.ensure_fresh()
+        role = self.get_role_by_name(name)
+        if role is None:
+            self.invalidate()
+            await self.ensure_fresh()
+            role = self.get_role_by_name(name)
+        return role
+
+    def get_role(self, uuid: str) -> RoleReadSerializer | None:
+        return self.roles_by_uuid.get(uuid)
+
+    def get_role_by_name(self, name: str) -> RoleReadSerializer | None:
+        return self.roles_by_name.get(name)
+
+    def get_permission(self, uuid: str) -> PermissionReadSerializer | None:
+        return self.permissions_by_uuid.get(uuid)
+
+    def get_permission_by_name(self, name: str) -> PermissionReadSerializer | None:
+        return self.permissions_by_name.get(name)
+
+    def stats(self) -> dict[str, int | bool | None]:
+        return {
+            'roles': len(self.roles_by_uuid),
+            'permissions': len(self.permissions_by_uuid),
+            'is_fresh': self.is_fresh(),
+            'loads': self.loads,
+        }
+
+
+roles_catalog = RolesCatalog()
@@ -0,0 +1,86 @@
+"""
+lua scripts of multi-step session operations, each one is atomic and takes one round trip
+"""
+import hashlib
+
+from redis.asyncio import Redis
+from redis.exceptions import NoScriptError
+
+
+class RedisScript():
+    """
+    lua script called by sha with EVALSHA,
+    script is loaded to redis on first NOSCRIPT reply (first call, redis restart, SCRIPT FLUSH)
+    """
+
+    def __init__(self, script: str):
+        self.script = script
+        self.sha = hashlib.sha1(script.encode('utf-8')).hexdigest()
+
+    async def __call__(self, redis: Redis, keys: list[str], args: list) -> list | int:
+        try:
+            return await redis.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await redis.script_load(self.script)
+            return await redis.evalsha(self.sha, len(keys), *keys, *args)
+
+
+# KEYS[1..n]: session keys, ARGV[1..n]: refresh token digests to compare with cached ones ('' - only session is checked)
+# KEYS[n+1..]: keys which values are returned as they are
+# returns: n flags (1 - session is cached and its refresh token digest matches), then values of the other keys
+VERIFY_SESSIONS = RedisScript("""
+local result = {}
+for i = 1, #ARGV do
+    local refresh_token_digest = redis.call('GET', KEYS[i])
+    if refresh_token_digest and (ARGV[i] == '' or refresh_token_digest == ARGV[i]) then
+        result[i] = 1
+    else
+        result[i] = 0
+    end
+end
+for i = #ARGV + 1, #KEYS do
+    result[i] = redis.call('GET', KEYS[i])
+end
+return result
+""")
+
+# KEYS[1]: session key, KEYS[2]: oauth-provider token key of session, KEYS[3]: rotated refresh token key of session,
+# KEYS[4] (optional): old opaque refresh token key, it is kept for grace window too
+# ARGV[1]: old refresh token digest, ARGV[2]: new refresh token digest, ARGV[3]: ttl sec, ARGV[4]: new token pair,
+# ARGV[5]: grace sec
+# returns: 1 if rotated,
+# new token pair if old refresh token was already rotated within grace window, 0 otherwise (session revoked)
+ROTATE_REFRESH_TOKEN = RedisScript("""
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    local rotated = redis.call('HMGET', KEYS[3], 'refresh_token', 'token_pair')
+    if rotated[1] == ARGV[1] then
+        return rotated[2]
+    end
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('HSET', KEYS[3], 'refresh_token', ARGV[1], 'token_pair', ARGV[4])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+if KEYS[4] then
+    redis.call('EXPIRE', KEYS[4], ARGV[5])
+end
+return 1
+""")
+
+# KEYS: session keys and other keys of the same sessions, ARGV[1]: number of session keys
+# returns: refresh token digests of revoked sessions, only declared keys are touched, so keys of opaque refresh tokens
+# (in other slots) are deleted by caller
+REVOKE_SESSIONS = RedisScript("""
+local revoked = {}
+for i = 1, tonumber(ARGV[1]) do
+    local refresh_token_digest = redis.call('GET', KEYS[i])
+    if refresh_token_digest then
+        revoked[#revoked + 1] = refresh_token_digest
+    end
+end
+for i = 1, #KEYS do
+    redis.call('DEL', KEYS[i])
+end
+return revoked
+""")
@@ -0,0 +1,102 @@
+import base64
+import binascii
+import time
+from typing import Any
+
+import orjson
+from jwt.algorithms import Algorithm, get_default_algorithms
+
+from core import config
+from core.keyring import KeyRing, keyring
+
+
+def b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+class TokenCodec():
+    """
+    encode / decode own jwt tokens
+    - signing key and header segment are prepared once
+    - claims are serialized with orjson
+    - header segments of all verification keys are prepared once, so decoding
+      of own tokens doesn't parse headers
+    - decode checks signature and exp only (own tokens have no nbf, iat, aud, iss claims)
+    - tokens without kid are decoded only while keyring accepts AUTH_SECRET, it is checked on every decode
+    """
+
+    def __init__(self, keyring: KeyRing):
+        self.keyring = keyring
+        algorithms = get_default_algorithms()
+
+        algorithm_name, signing_key, headers = keyring.get_signing_key()
+        self._signing_algorithm: Algorithm = algorithms[algorithm_name]
+        self._signing_key = self._signing_algorithm.prepare_key(signing_key)
+        self._header_segment = self._get_header_segment({'alg': algorithm_name, 'typ': 'JWT', **headers})
+
+        self._verification_keys: dict[str | None, tuple[str, Algorithm, Any]] = {}
+        secret_verification_key = (config.TOKEN_ENCODE_ALGORITHM, keyring.secret)
+        for kid, (algorithm_name, key) in [(None, secret_verification_key), *keyring.verification_keys.items()]:
+            algorithm = algorithms[algorithm_name]
+            self._verification_keys[kid] = (algorithm_name, algorithm, algorithm.prepare_key(key))
+
+        self._verification_keys_by_header_segment: dict[bytes, tuple[Algorithm, Any]] = {}
+        for kid, (algorithm_name, algorithm, key) in self._verification_keys.items():
+            headers = {'alg': algorithm_name, 'typ': 'JWT'} if kid is None else \
+                {'alg': algorithm_name, 'kid': kid, 'typ': 'JWT'}
+            self._verification_keys_by_header_segment[self._get_header_segment(headers)] = (algorithm, key)
+        self._secret_header_segment = self._get_header_segment({'alg': config.TOKEN_ENCODE_ALGORITHM, 'typ': 'JWT'})
+
+    @staticmethod
+    def _get_header_segment(headers: dict) -> bytes:
+        # the same as PyJWT header: sorted keys, no spaces
+        return b64encode(orjson.dumps(headers, option=orjson.OPT_SORT_KEYS))
+
+    def encode(self, claims: dict) -> str:
+        signing_input = self._header_segment + b'.' + b64encode(orjson.dumps(claims))
+        signature = self._signing_algorithm.sign(signing_input, self._signing_key)
+        return (signing_input + b'.' + b64encode(signature)).decode('ascii')
+
+    def _get_verification_key(self, header_segment: bytes) -> tuple[Algorithm, Any] | None:
+        if header_segment == self._secret_header_segment and not self.keyring.is_secret_accepted():
+            return None
+        verification_key = self._verification_keys_by_header_segment.get(header_segment)
+        if verification_key is not None:
+            return verification_key
+
+        # header encoded not by this service
+        header = orjson.loads(b64decode(header_segment))
+        if header.get('kid') is None and not self.keyring.is_secret_accepted():
+            return None
+        kid_verification_key = self._verification_keys.get(header.get('kid'))
+        if kid_verification_key is None:
+            return None
+        algorithm_name, algorithm, key = kid_verification_key
+        if header.get('alg') != algorithm_name:
+            return None
+        return algorithm, key
+
+    def decode(self, token: str) -> dict | None:
+        """return token claims, or None if token is malformed, has invalid signature or expired"""
+        try:
+            signing_input, signature_segment = token.encode('ascii').rsplit(b'.', 1)
+            header_segment, payload_segment = signing_input.split(b'.')
+            verification_key = self._get_verification_key(header_segment)
+            if verification_key is None:
+                return None
+            algorithm, key = verification_key
+            if not algorithm.verify(signing_input, key, b64decode(signature_segment)):
+                return None
+            claims = orjson.loads(b64decode(payload_segment))
+            if claims['exp'] <= time.time():
+                return None
+            return claims
+        except (ValueError, TypeError, KeyError, binascii.Error, orjson.JSONDecodeError):
+            return None
+
+
+token_codec = TokenCodec(keyring)
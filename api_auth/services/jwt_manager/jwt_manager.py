@@ -1,16 +1,23 @@
-import datetime as dt
+import hashlib
+import secrets
+import time
 import uuid
 from pathlib import Path
 
-import jwt
+import orjson
 import pydantic as pd
+from redis.exceptions import RedisError
 
 from core import config
-from core.config import settings
 from core.enums import TokenTypesEnum, PermissionsNamesEnum, OAuthTypesEnum
+from core.exceptions import CacheUnavailableException
 from core.logger_config import setup_logger
+from core.security import permissions_to_mask
 from db.models.user import UserModel
-from db.serializers.token import TokenPairEncodedSerializer, TokenCreateSchema, TokenReadSchema
+from db.serializers.token import TokenPairEncodedSerializer
+from services.cache.cache import RedisCache
+from services.cache.keys import opaque_token_key
+from services.jwt_manager.codec import token_codec
 
 SERVICE_DIR = Path(__file__).resolve().parent
 SERVICE_NAME = SERVICE_DIR.stem
@@ -18,21 +25,24 @@ SERVICE_NAME = SERVICE_DIR.stem
 logger = setup_logger(SERVICE_NAME, SERVICE_DIR)
 
 
+TOKEN_EXP_SEC = {
+    TokenTypesEnum.access: config.ACCESS_TOKEN_EXP_MIN * 60,
+    TokenTypesEnum.refresh: config.REFRESH_TOKEN_EXP_MIN * 60,
+    TokenTypesEnum.register: config.TEMPORARY_REGISTER_TOKEN_EXP_MIN * 60,
+}
+
+
 async def create_temporary_register_token(user: UserModel) -> str:
-    token_schema = TokenCreateSchema(
-        type=TokenTypesEnum.register,
-        sub=user.uuid,
-        email=user.email,
-        jti=str(uuid.uuid4()),
-        exp=dt.datetime.utcnow() + dt.timedelta(minutes=config.TEMPORARY_REGISTER_TOKEN_EXP_MIN),
-    )
-    token_schema_encoded = jwt.encode(token_schema.dict(), settings.AUTH_SECRET,
-                                      algorithm=config.TOKEN_ENCODE_ALGORITHM)
-    return token_schema_encoded
-
-
-async def create_token(
-        token_type: TokenTypesEnum,
+    return token_codec.encode({
+        'type': TokenTypesEnum.register,
+        'sub': user.uuid,
+        'email': user.email,
+        'jti': str(uuid.uuid4()),
+        'exp': int(time.time()) + TOKEN_EXP_SEC[TokenTypesEnum.register],
+    })
+
+
+def get_base_claims(
         user_uuid: str,
         email: pd.EmailStr,
         permissions: list[PermissionsNamesEnum],
@@ -40,28 +50,34 @@ async def create_token(
         ip: str,
         useragent: str,
         oauth_type: OAuthTypesEnum,
-        oauth_token: str
-) -> str:
-    jti = str(uuid.uuid4())
-    if token_type == TokenTypesEnum.access:
-        exp = dt.datetime.utcnow() + dt.timedelta(minutes=config.ACCESS_TOKEN_EXP_MIN)
-    else:
-        exp = dt.datetime.utcnow() + dt.timedelta(minutes=config.REFRESH_TOKEN_EXP_MIN)
-
-    token_schema = TokenCreateSchema(
-        type=token_type,
-        sub=user_uuid,
-        email=email,
-        permissions=permissions,
-        session_uuid=session_uuid,
-        ip=ip,
-        useragent=useragent,
-        oauth_type=oauth_type,
-        oauth_token=oauth_token,
-        jti=jti,
-        exp=exp,
-    )
-    return jwt.encode(token_schema.dict(), settings.AUTH_SECRET, algorithm=config.TOKEN_ENCODE_ALGORITHM)
+        oauth_token: str,
+        role_epochs: dict[str, int] | None = None,
+        user_epoch: int = 0,
+) -> dict:
+    """
+    claims shared by access and refresh tokens of one session, in TokenCreateSchema fields order,
+    permissions are encoded as permissions mask ('pmask'),
+    empty oauth_token (local session or oauth-provider token kept in cache) is not put to token,
+    permissions epochs are put to token, see services.cache.permissions_epochs
+    """
+    claims = {
+        'sub': user_uuid,
+        'email': email,
+        'pmask': permissions_to_mask(permissions),
+        'session_uuid': session_uuid,
+        'ip': ip,
+        'useragent': useragent,
+        'oauth_type': oauth_type,
+        'role_epochs': role_epochs or {},
+        'user_epoch': user_epoch,
+    }
+    if oauth_token:
+        claims['oauth_token'] = oauth_token
+    return claims
+
+
+def encode_token(token_type: TokenTypesEnum, base_claims: dict, now: int) -> str:
+    return token_codec.encode({'type': token_type, **base_claims, 'exp': now + TOKEN_EXP_SEC[token_type]})
 
 
 async def create_token_pair(
@@ -73,25 +89,87 @@ async def create_token_pair(
         useragent: str,
         oauth_type: OAuthTypesEnum = OAuthTypesEnum.local,
         oauth_token='',
+        role_epochs: dict[str, int] | None = None,
+        user_epoch: int = 0,
 ) -> TokenPairEncodedSerializer:
-    access_token = await create_token(token_type=TokenTypesEnum.access,
-                                      user_uuid=user_uuid,
-                                      email=email,
-                                      permissions=permissions,
-                                      session_uuid=session_uuid,
-                                      ip=ip,
-                                      useragent=useragent,
-                                      oauth_type=oauth_type,
-                                      oauth_token=oauth_token)
-    refresh_token = await create_token(token_type=TokenTypesEnum.refresh,
-                                       user_uuid=user_uuid,
-                                       email=email,
-                                       permissions=permissions,
-                                       session_uuid=session_uuid,
-                                       ip=ip,
-                                       useragent=useragent,
-                                       oauth_type=oauth_type,
-                                       oauth_token=oauth_token)
-    token_pair = TokenPairEncodedSerializer(access_token=access_token, refresh_token=refresh_token)
+    base_claims = get_base_claims(user_uuid, email, permissions, session_uuid, ip, useragent, oauth_type, oauth_token,
+                                  role_epochs, user_epoch)
+    now = int(time.time())
+    token_pair = TokenPairEncodedSerializer.construct(access_token=encode_token(TokenTypesEnum.access, base_claims, now),
+                                                      refresh_token=encode_token(TokenTypesEnum.refresh, base_claims, now),
+                                                      token_type='bearer')
     logger.info(f'create_token_pair: created {token_pair=:}')
     return token_pair
+
+
+def is_opaque_token(token: str) -> bool:
+    # jwt is always 'header.payload.signature', opaque token is urlsafe base64 without dots
+    return token.count('.') != 2
+
+
+def get_token_digest(token: str) -> bytes:
+    # refresh tokens of sessions are not kept in cache as is, only by 32-byte digest
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+def get_opaque_token_digest(token: str) -> str:
+    # opaque tokens are not kept in cache as is, only by digest
+    return get_token_digest(token).hex()
+
+
+def decode_opaque_token_claims(data: dict[bytes, bytes]) -> dict | None:
+    """return claims from cached opaque token hash, or None if there is no such token or it is expired"""
+    if not data:
+        return None
+    claims = {key.decode('utf-8'): value.decode('utf-8') for key, value in data.items()}
+    claims['pmask'] = int(claims['pmask'])
+    claims['exp'] = int(claims['exp'])
+    # token issued before role epochs has none
+    if 'role_epochs' in claims:
+        claims['role_epochs'] = orjson.loads(claims['role_epochs'])
+    claims['user_epoch'] = int(claims['user_epoch'])
+    if claims['exp'] <= time.time():
+        return None
+    return claims
+
+
+async def create_opaque_token_pair(
+        cache: RedisCache,
+        user_uuid: str,
+        email: pd.EmailStr,
+        permissions: list[PermissionsNamesEnum],
+        session_uuid: str,
+        ip: str,
+        useragent: str,
+        oauth_type: OAuthTypesEnum = OAuthTypesEnum.local,
+        oauth_token='',
+        role_epochs: dict[str, int] | None = None,
+        user_epoch: int = 0,
+) -> TokenPairEncodedSerializer:
+    """
+    create pair of random opaque tokens,
+    claims of every token are set to cache hash by token digest with token exp as ttl, both in one round trip,
+    CacheUnavailableException if they weren't set, tokens without claims can't be verified
+    """
+    base_claims = get_base_claims(user_uuid, email, permissions, session_uuid, ip, useragent, oauth_type, oauth_token,
+                                  role_epochs, user_epoch)
+    # hash values are flat, role epochs are kept as json
+    base_claims['role_epochs'] = orjson.dumps(base_claims['role_epochs'])
+    now = int(time.time())
+    tokens = {}
+    try:
+        async with cache.pipeline(transaction=True) as pipe:
+            for token_type in (TokenTypesEnum.access, TokenTypesEnum.refresh):
+                token = secrets.token_urlsafe(config.OPAQUE_TOKEN_BYTES)
+                claims = {'type': token_type, **base_claims, 'exp': now + TOKEN_EXP_SEC[token_type]}
+                token_key = opaque_token_key(get_opaque_token_digest(token))
+                pipe.hset(token_key, mapping={key: value for key, value in claims.items() if value is not None})
+                pipe.expire(token_key, TOKEN_EXP_SEC[token_type])
+                tokens[token_type] = token
+    except RedisError:
+        raise CacheUnavailableException
+    token_pair = TokenPairEncodedSerializer.construct(access_token=tokens[TokenTypesEnum.access],
+                                                      refresh_token=tokens[TokenTypesEnum.refresh],
+                                                      token_type='bearer')
+    logger.info(f'create_opaque_token_pair: created {token_pair=:}')
+    return token_pair
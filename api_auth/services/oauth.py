@@ -3,10 +3,13 @@ import httpx
 from core.config import settings
 from core.enums import OAuthTypesEnum
 from core.exceptions import BadRequestException
+from services.single_flight import SingleFlight
 
 redirect_uri_google = f'http://{settings.API_AUTH_HOST}:{settings.API_AUTH_PORT}/api/v1/auth/oauth-redirect/google'
 redirect_uri_yandex = f'http://{settings.API_AUTH_HOST}:{settings.API_AUTH_PORT}/api/v1/auth/oauth-redirect/yandex'
 
+user_info_in_flight = SingleFlight()
+
 
 async def get_redirect_uri_with_state(oauth_type: OAuthTypesEnum, stored_state):
     if oauth_type == OAuthTypesEnum.google:
@@ -62,6 +65,12 @@ async def get_oauth_token(request, stored_state, oauth_type: OAuthTypesEnum):
 
 
 async def get_user_info_oauth(encoded_jwt: str, oauth_type: OAuthTypesEnum) -> dict | None:
+    # concurrent validations of the same oauth-provider token share one request to provider
+    return await user_info_in_flight.do((oauth_type, encoded_jwt),
+                                        lambda: _get_user_info_oauth(encoded_jwt, oauth_type))
+
+
+async def _get_user_info_oauth(encoded_jwt: str, oauth_type: OAuthTypesEnum) -> dict | None:
     if oauth_type == OAuthTypesEnum.google:
         user_info_uri = 'https://www.googleapis.com/oauth2/v1/userinfo'
     elif oauth_type == OAuthTypesEnum.yandex:
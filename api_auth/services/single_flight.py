@@ -0,0 +1,31 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar('T')
+
+
+class SingleFlight():
+    """
+    coalesces concurrent identical lookups of one operation:
+    - the first call with a key starts the lookup, calls with the same key made while it is in flight
+      await the same task and get its result or exception
+    - nothing is kept after the lookup completes, the next call starts a new one
+    - caller cancellation doesn't cancel the lookup awaited by other callers
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, key: Hashable, lookup: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(lookup())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import socket
+import struct
+from pathlib import Path
+
+import msgpack
+
+from core import config
+from core.enums import TokenTypesEnum
+from core.logger_config import setup_logger
+from db.serializers.session import SessionFingerprint
+from db.serializers.token import TokenClaims
+from services.auth_manager.auth_manager import AuthManager
+
+SERVICE_DIR = Path(__file__).resolve().parent
+SERVICE_NAME = SERVICE_DIR.stem
+
+logger = setup_logger(SERVICE_NAME, SERVICE_DIR)
+
+FRAME_HEADER = struct.Struct('>I')
+
+
+def encode_frame(message) -> bytes:
+    payload = msgpack.packb(message)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def get_claims_message(token_schema: TokenClaims | None) -> dict | None:
+    """claims of verified access token, None for not verified or refresh token"""
+    if token_schema is None or token_schema.type != TokenTypesEnum.access:
+        return None
+    return {
+        'sub': token_schema.sub,
+        'email': token_schema.email,
+        'pmask': token_schema.permissions_mask,
+        'session_uuid': token_schema.session_uuid,
+        'exp': token_schema.exp,
+    }
+
+
+class VerifyProtocol(asyncio.Protocol):
+    """
+    length-prefixed msgpack verification protocol, one connection:
+    - request frame: [request_id, access_token, ip, useragent]
+    - response frame: [request_id, claims or None], claims: {sub, email, pmask, session_uuid, exp}
+    - requests are pipelined, all frames received in one read are verified as one batch,
+      responses are written as soon as their batch is verified, client matches them by request_id
+    - reading is paused while too many batches are being verified
+    - refresh tokens are answered with None
+    """
+
+    def __init__(self, auth_manager: AuthManager):
+        self.auth_manager = auth_manager
+        self.transport: asyncio.Transport | None = None
+        self._buffer = bytearray()
+        self._batches_in_flight = 0
+        # event loop keeps only weak references to tasks
+        self._tasks: set[asyncio.Task] = set()
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        self._buffer += data
+        requests = []
+        while len(self._buffer) >= FRAME_HEADER.size:
+            length, = FRAME_HEADER.unpack_from(self._buffer)
+            if length > config.VERIFY_SERVER_MAX_FRAME_BYTES:
+                logger.error(f'data_received: {length=:} exceeds max frame size, closing connection')
+                self.transport.close()
+                return
+            if len(self._buffer) < FRAME_HEADER.size + length:
+                break
+            payload = bytes(self._buffer[FRAME_HEADER.size:FRAME_HEADER.size + length])
+            del self._buffer[:FRAME_HEADER.size + length]
+            try:
+                request_id, access_token, ip, useragent = msgpack.unpackb(payload)
+            except (ValueError, TypeError, msgpack.UnpackException) as e:
+                logger.error(f'data_received: malformed request, closing connection: {e}')
+                self.transport.close()
+                return
+            requests.append((request_id, access_token, SessionFingerprint(useragent, ip)))
+        if requests:
+            self._batches_in_flight += 1
+            if self._batches_in_flight >= config.VERIFY_SERVER_MAX_BATCHES_IN_FLIGHT:
+                self.transport.pause_reading()
+            task = asyncio.create_task(self._verify(requests))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _verify(self, requests: list[tuple[int, str, SessionFingerprint]]) -> None:
+        try:
+            token_schemas = await self.auth_manager.get_verified_token_schemas(
+                [(access_token, session_from_request) for _, access_token, session_from_request in requests])
+            if not self.transport.is_closing():
+                self.transport.write(b''.join(encode_frame([request_id, get_claims_message(token_schema)])
+                                              for (request_id, _, _), token_schema in zip(requests, token_schemas)))
+        except Exception as e:
+            logger.error(f'_verify: failed to verify {len(requests)=:}: {e}')
+            self.transport.close()
+        finally:
+            self._batches_in_flight -= 1
+            if self._batches_in_flight < config.VERIFY_SERVER_MAX_BATCHES_IN_FLIGHT and not self.transport.is_closing():
+                self.transport.resume_reading()
+
+
+class VerifyServer():
+    """
+    optional unix socket server of VerifyProtocol for sidecars on the same host,
+    only one worker of host serves socket, the others find it is already served and skip
+    """
+
+    def __init__(self, auth_manager: AuthManager, path: str):
+        self.auth_manager = auth_manager
+        self.path = path
+        self._server: asyncio.AbstractServer | None = None
+        self._inode: int | None = None
+
+    def _is_served(self) -> bool:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.path)
+                return True
+            except OSError:
+                return False
+
+    async def start(self) -> None:
+        if os.path.exists(self.path) and not self._is_served():
+            # left by stopped worker
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # bound explicitly, create_unix_server(path) would replace socket of another worker
+            sock.bind(self.path)
+        except OSError as e:
+            sock.close()
+            logger.info(f'start: {self.path=:} is served by another worker: {e}')
+            return
+        self._inode = os.stat(self.path).st_ino
+        self._server = await asyncio.get_running_loop().create_unix_server(
+            lambda: VerifyProtocol(self.auth_manager), sock=sock)
+        logger.info(f'start: serving {self.path=:}')
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        if os.path.exists(self.path) and os.stat(self.path).st_ino == self._inode:
+            os.unlink(self.path)
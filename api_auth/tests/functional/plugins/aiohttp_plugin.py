@@ -29,5 +29,10 @@ async def body_status():
                     body = await response.json()
                     status = response.status
                     return body, status
+            elif method == MethodsEnum.put:
+                async with session.put(url, headers=headers, data=data) as response:
+                    body = await response.json()
+                    status = response.status
+                    return body, status
 
     return inner
@@ -1,13 +1,33 @@
+import asyncio
+import json
+import time
+import uuid
 from http import HTTPStatus
 
+import aiohttp
 import pytest
 
-from core.enums import RolesNamesEnum, MethodsEnum
+from auth_client.revocation import REVOCATION_STREAM
+from core.enums import InvalidationEventsEnum, PermissionsNamesEnum, RolesNamesEnum, MethodsEnum
+from core.exceptions import UnauthorizedException
+from core.security import get_token_data, mask_to_permissions, permissions_to_mask
 from db import SessionLocalAsync
+from db.models.role import RoleModel
 from db.models.session import SessionModel
 from db.repository import SqlAlchemyRepositoryAsync
-from db.serializers.token import TokenReadSchema
+from db.serializers.session import SessionFingerprint
+from db.serializers.token import TokenClaims, TokenReadSchema
+from db.serializers.user import UserPrincipalSerializer
+from services.auth_manager.auth_manager import AuthManager
 from services.cache.cache import RedisCache
+from services.cache.invalidation_bus import InvalidationBus
+from services.cache.keys import oauth_token_key, principal_key, role_epoch_key, rotated_refresh_token_key, \
+    session_key, user_sessions_key
+from services.cache.local_cache import RevokedSessionsCache, VerifiedTokensCache
+from services.cache.permissions_epochs import PermissionsEpochs, permissions_epochs
+from services.jwt_manager.codec import token_codec
+from services.jwt_manager.jwt_manager import create_token_pair, get_token_digest
+from services.single_flight import SingleFlight
 from tests.functional.settings import test_settings
 from tests.functional.src.helpers_users import user_data, create_test_registered_user, delete_user_by_email, \
     get_json_headers, get_login_headers, get_login_form_data
@@ -20,6 +40,21 @@ REGISTER_URL = f'{AUTH_URL}/register'
 LOGIN_URL = f'{AUTH_URL}/login'
 LOGOUT_URL = f'{AUTH_URL}/logout'
 REFRESH_URL = f'{AUTH_URL}/refresh-access-token'
+VERIFY_BATCH_URL = f'{AUTH_URL}/verify-access-tokens'
+VERIFY_URL = f'{AUTH_URL}/verify'
+VERIFY_ACCESS_TOKEN_URL = f'{AUTH_URL}/verify-access-token'
+LOGOUT_ALL_URL = f'{AUTH_URL}/logout-all'
+ME_URL = f'http://{test_settings.API_AUTH_HOST}:{test_settings.API_AUTH_PORT}/api/v1/me/'
+UPDATE_PASSWORD_URL = f'{ME_URL}update-password'
+ROLES_URL = f'http://{test_settings.API_AUTH_HOST}:{test_settings.API_AUTH_PORT}/api/v1/roles/'
+JWKS_URL = f'http://{test_settings.API_AUTH_HOST}:{test_settings.API_AUTH_PORT}/.well-known/jwks.json'
+
+
+async def set_principal_name(redis_cache: RedisCache, user_uuid: str, name: str) -> None:
+    """change name in cached principal snapshot keeping its versions, so it is seen whether snapshot is served"""
+    principal = UserPrincipalSerializer.parse_raw(await redis_cache.get(principal_key(user_uuid)))
+    principal.name = name
+    await redis_cache.set(principal_key(user_uuid), principal.json(), ex=60)
 
 
 async def test_post_api_v1_auth_register(body_status):
@@ -44,7 +79,7 @@ async def test_post_api_v1_auth_login(body_status, redis_cache: RedisCache):
      - encoded access_token in body.access_token
      - user.email can be accessed in from encoded access_token
      - session was created in db
-     - session was created in cache and encoded refresh_token can be accessed by session_id in access_token
+     - session was created in cache and digest of encoded refresh_token can be accessed by session_id in access_token
      """
     await create_test_registered_user(user_data)
     try:
@@ -55,13 +90,13 @@ async def test_post_api_v1_auth_login(body_status, redis_cache: RedisCache):
         session_id = access_token_schema.session_id
         async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
             session_db = await repo.get(SessionModel, id=session_id)
-        refresh_token_cached = await redis_cache.get(session_id)
+        refresh_token_cached = await redis_cache.get(session_key(session_id))
 
         assert status == HTTPStatus.OK
         assert access_token_schema.email == user_data['email']
         assert isinstance(body['access_token'], str)
         assert session_db is not None
-        assert refresh_token_cached is not None
+        assert refresh_token_cached == get_token_digest(body['refresh_token'])
 
     finally:
         await delete_user_by_email(email=user_data['email'])
@@ -88,7 +123,7 @@ async def test_post_api_v1_auth_logout_authorized(body_status, redis_cache: Redi
         body, status = await body_status(LOGOUT_URL, method=MethodsEnum.post, headers=auth_headers)
         async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
             session_db = await repo.get(SessionModel, id=session_id)
-        refresh_token_cached = await redis_cache.get(session_id)
+        refresh_token_cached = await redis_cache.get(session_key(session_id))
 
         assert status == HTTPStatus.OK
         assert session_db.is_active is False
@@ -133,7 +168,7 @@ async def test_post_api_v1_auth_refresh_access_token_authorized(body_status, red
         old_refresh_token = login_body['refresh_token']
         old_access_token_schema = TokenReadSchema.from_jwt(old_access_token)
         old_session_id = old_access_token_schema.session_id
-        old_refresh_token_cached = await redis_cache.get(old_session_id)
+        old_refresh_token_cached = await redis_cache.get(session_key(old_session_id))
         from time import sleep
         sleep(2)
         # refresh
@@ -143,7 +178,7 @@ async def test_post_api_v1_auth_refresh_access_token_authorized(body_status, red
         new_session_id = new_access_token_schema.session_id
         async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
             session_db = await repo.get(SessionModel, id=new_session_id)
-        new_refresh_token_cached = await redis_cache.get(new_session_id)
+        new_refresh_token_cached = await redis_cache.get(session_key(new_session_id))
 
         assert refresh_status == HTTPStatus.OK
         assert old_access_token != new_access_token
@@ -152,3 +187,503 @@ async def test_post_api_v1_auth_refresh_access_token_authorized(body_status, red
         assert old_refresh_token_cached != new_refresh_token_cached
     finally:
         await delete_user_by_email(email=user_data['email'])
+
+
+async def test_post_api_v1_auth_refresh_access_token_concurrent(body_status):
+    """Test that route will return:
+     - status 200 for every concurrent refresh with the same refresh_token
+     - the same token pair for all of them
+     - the same token pair for repeated refresh within grace window
+     """
+    await create_test_registered_user(user_data)
+    try:
+        headers = await get_login_headers()
+        form_data = await get_login_form_data(user_data)
+        login_body, _ = await body_status(LOGIN_URL, method=MethodsEnum.post, data=form_data, headers=headers)
+        old_refresh_token = login_body['refresh_token']
+        await asyncio.sleep(1)
+
+        results = await asyncio.gather(*[body_status(REFRESH_URL, method=MethodsEnum.post, data=old_refresh_token)
+                                         for _ in range(3)])
+        repeated_body, repeated_status = await body_status(REFRESH_URL, method=MethodsEnum.post,
+                                                           data=old_refresh_token)
+
+        assert all(status == HTTPStatus.OK for _, status in results)
+        assert len({body['refresh_token'] for body, _ in results}) == 1
+        assert repeated_status == HTTPStatus.OK
+        assert repeated_body['refresh_token'] == results[0][0]['refresh_token']
+    finally:
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_post_api_v1_auth_verify_access_tokens(body_status):
+    """Test that route will return:
+     - status 200
+     - result for every provided token in the same order
+     - is_valid and token schema for valid access_token, not is_valid for invalid one
+     """
+    await create_test_registered_user(user_data)
+    try:
+        headers = await get_login_headers()
+        headers.update({'User-Agent': 'test-useragent', 'X-Forwarded-For': '127.0.0.1'})
+        form_data = await get_login_form_data(user_data)
+        login_body, login_status = await body_status(LOGIN_URL, method=MethodsEnum.post, data=form_data,
+                                                     headers=headers)
+        access_token = login_body['access_token']
+        tokens = [
+            {'access_token': access_token, 'ip': '127.0.0.1', 'useragent': 'test-useragent'},
+            {'access_token': 'invalid_access_token', 'ip': '127.0.0.1', 'useragent': 'test-useragent'},
+            {'access_token': access_token, 'ip': '127.0.0.2', 'useragent': 'test-useragent'},
+        ]
+        body, status = await body_status(VERIFY_BATCH_URL, method=MethodsEnum.post, data=tokens)
+
+        assert status == HTTPStatus.OK
+        assert [result['is_valid'] for result in body] == [True, False, False]
+        assert body[0]['token']['email'] == user_data['email']
+        assert body[1]['token'] is None
+    finally:
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_get_well_known_jwks(body_status):
+    """Test that route will return:
+     - status 200
+     - public key with kid and alg for every verification key
+     """
+    body, status = await body_status(JWKS_URL)
+
+    assert status == HTTPStatus.OK
+    assert isinstance(body['keys'], list)
+    for jwk in body['keys']:
+        assert jwk['kid'] and jwk['alg'] in ('RS256', 'EdDSA')
+
+
+async def test_post_api_v1_auth_logout_revocation_stream(body_status, redis_cache: RedisCache):
+    """Test that route will:
+     - append ended session to revocation stream followed by auth_client
+     """
+    await create_test_registered_user(user_data)
+    try:
+        headers = await get_login_headers()
+        form_data = await get_login_form_data(user_data)
+        body, status = await body_status(LOGIN_URL, method=MethodsEnum.post, data=form_data, headers=headers)
+        access_token = body['access_token']
+        session_uuid = TokenReadSchema.from_jwt(access_token).session_uuid
+        auth_headers = await get_json_headers()
+        auth_headers.update({'Authorization': f'Bearer {access_token}'})
+        body, status = await body_status(LOGOUT_URL, method=MethodsEnum.post, headers=auth_headers)
+        entries = await redis_cache.redis.xrevrange(REVOCATION_STREAM, count=10)
+
+        assert status == HTTPStatus.OK
+        assert any(fields[b'type'] == b'sessions_ended' and session_uuid in fields[b'keys'].decode('utf-8').split(',')
+                   for _, fields in entries)
+    finally:
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_get_api_v1_auth_verify(body_status):
+    """Test that route will return:
+     - status 204 with user headers and Cache-Control max-age for valid access_token
+     - status 401 for access_token used with another ip
+     - status 401 for refresh_token
+     """
+    await create_test_registered_user(user_data)
+    try:
+        headers = await get_login_headers()
+        headers.update({'User-Agent': 'test-useragent', 'X-Forwarded-For': '127.0.0.1'})
+        form_data = await get_login_form_data(user_data)
+        login_body, login_status = await body_status(LOGIN_URL, method=MethodsEnum.post, data=form_data,
+                                                     headers=headers)
+        verify_headers = {'Authorization': f'Bearer {login_body["access_token"]}',
+                          'User-Agent': 'test-useragent', 'X-Forwarded-For': '127.0.0.1'}
+        async with aiohttp.ClientSession() as session:
+            async with session.get(VERIFY_URL, headers=verify_headers) as response:
+                status, response_headers = response.status, response.headers
+            async with session.get(VERIFY_URL, headers={**verify_headers, 'X-Forwarded-For': '127.0.0.2'}) as response:
+                other_ip_status = response.status
+            async with session.get(VERIFY_URL, headers={**verify_headers,
+                                                        'Authorization': f'Bearer {login_body["refresh_token"]}'}
+                                   ) as response:
+                refresh_token_status = response.status
+
+        assert status == HTTPStatus.NO_CONTENT
+        assert response_headers['X-User-Email'] == user_data['email']
+        assert response_headers['Cache-Control'].startswith('max-age=')
+        assert other_ip_status == HTTPStatus.UNAUTHORIZED
+        assert refresh_token_status == HTTPStatus.UNAUTHORIZED
+    finally:
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_get_api_v1_auth_verify_stale_role_epoch(body_status, redis_cache: RedisCache):
+    """Test that route will return:
+     - status 401 for access_token issued before epoch of its role was bumped
+     - status 200 for refresh, new access_token carries new epoch of role and permissions of role from db
+     - status 204 for new access_token
+     """
+    await create_test_registered_user(user_data)
+    try:
+        headers = await get_login_headers()
+        headers.update({'User-Agent': 'test-useragent', 'X-Forwarded-For': '127.0.0.1'})
+        form_data = await get_login_form_data(user_data)
+        login_body, login_status = await body_status(LOGIN_URL, method=MethodsEnum.post, data=form_data,
+                                                     headers=headers)
+        async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
+            registered_role = await repo.get(RoleModel, name=RolesNamesEnum.registered)
+            registered_permissions = {permission.name for permission in registered_role.permissions}
+        await permissions_epochs.bump_role_epoch(redis_cache, InvalidationBus(redis_cache.redis), registered_role.uuid)
+        role_epoch = int(await redis_cache.get(role_epoch_key(registered_role.uuid)))
+        verify_headers = {'User-Agent': 'test-useragent', 'X-Forwarded-For': '127.0.0.1'}
+        async with aiohttp.ClientSession() as session:
+            async with session.get(VERIFY_URL, headers={**verify_headers,
+                                                        'Authorization': f'Bearer {login_body["access_token"]}'}
+                                   ) as response:
+                stale_status = response.status
+        refresh_body, refresh_status = await body_status(REFRESH_URL, method=MethodsEnum.post,
+                                                         data=login_body['refresh_token'])
+        new_access_token_claims = TokenClaims.from_jwt(refresh_body['access_token'])
+        async with aiohttp.ClientSession() as session:
+            async with session.get(VERIFY_URL, headers={**verify_headers,
+                                                        'Authorization': f'Bearer {refresh_body["access_token"]}'}
+                                   ) as response:
+                new_status = response.status
+
+        assert stale_status == HTTPStatus.UNAUTHORIZED
+        assert refresh_status == HTTPStatus.OK
+        assert new_access_token_claims.role_epochs[registered_role.uuid] == role_epoch
+        assert registered_permissions <= set(new_access_token_claims.permissions)
+        assert new_status == HTTPStatus.NO_CONTENT
+    finally:
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_single_flight_coalesced_lookups_share_result():
+    """Test that concurrent lookups with the same key will:
+     - make one lookup and get the same result
+     - not be kept after lookup completes
+     """
+    single_flight = SingleFlight()
+    lookups = []
+
+    async def lookup():
+        lookups.append(1)
+        await asyncio.sleep(0.01)
+        return object()
+
+    results = await asyncio.gather(*[single_flight.do('key', lookup) for _ in range(5)])
+
+    assert len(lookups) == 1
+    assert all(result is results[0] for result in results)
+    assert single_flight.coalesced == 4
+    assert len(single_flight) == 0
+
+
+async def test_single_flight_coalesced_lookups_share_exception():
+    """Test that concurrent lookups with the same key will:
+     - make one lookup and get the same exception
+     - start new lookup after it failed
+     """
+    single_flight = SingleFlight()
+    lookups = []
+
+    async def lookup():
+        lookups.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError(len(lookups))
+
+    results = await asyncio.gather(*[single_flight.do('key', lookup) for _ in range(5)], return_exceptions=True)
+    with pytest.raises(ValueError):
+        await single_flight.do('key', lookup)
+
+    assert all(isinstance(result, ValueError) and result is results[0] for result in results)
+    assert len(lookups) == 2
+
+
+async def test_get_api_v1_roles_compiled_policy_forbidden(body_status):
+    """Test that routes will return:
+     - status 403 for authorized user which token has not all permissions required by compiled policy of route
+     - status 200 for route available for any authorized user
+     """
+    await create_test_registered_user(user_data)
+    try:
+        headers = await get_login_headers()
+        form_data = await get_login_form_data(user_data)
+        login_body, login_status = await body_status(LOGIN_URL, method=MethodsEnum.post, data=form_data,
+                                                     headers=headers)
+        auth_headers = await get_json_headers()
+        auth_headers.update({'Authorization': f'Bearer {login_body["access_token"]}'})
+        roles_body, roles_status = await body_status(ROLES_URL, headers=auth_headers)
+        me_body, me_status = await body_status(ME_URL, headers=auth_headers)
+
+        assert roles_status == HTTPStatus.FORBIDDEN
+        assert me_status == HTTPStatus.OK
+        assert me_body['email'] == user_data['email']
+    finally:
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_verified_tokens_cache_hit_and_logout_invalidation(redis_cache: RedisCache):
+    """Test that verification will:
+     - put verified access token to tokens_cache and serve it from there without reading session from redis
+     - not find access token in tokens_cache after its session was ended, and reject it
+     """
+    tokens_cache = VerifiedTokensCache(max_size=100, max_ttl_sec=60)
+    auth_manager = AuthManager(None, redis_cache, tokens_cache=tokens_cache, permissions_epochs=PermissionsEpochs(),
+                               revoked_sessions=RevokedSessionsCache(max_size=100, max_ttl_sec=60))
+    session_uuid = str(uuid.uuid4())
+    session_from_request = SessionFingerprint('test-useragent', '127.0.0.1')
+    token_pair = await create_token_pair(str(uuid.uuid4()), user_data['email'], [], session_uuid,
+                                         session_from_request.ip, session_from_request.useragent)
+    await redis_cache.set(session_key(session_uuid), get_token_digest(token_pair.refresh_token), ex=60)
+    try:
+        verified = await auth_manager.get_verified_token_schema(token_pair.access_token, session_from_request)
+        # session is removed from redis behind tokens_cache back, cached token doesn't read it
+        await redis_cache.delete(session_key(session_uuid))
+        verified_cached = await auth_manager.get_verified_token_schema(token_pair.access_token, session_from_request)
+        hits = tokens_cache.hits
+        # the same way as on logout
+        await auth_manager._invalidate_sessions([session_uuid])
+        verified_after_logout = await auth_manager.get_verified_token_schema(token_pair.access_token,
+                                                                             session_from_request)
+
+        assert verified is not None and verified.session_uuid == session_uuid
+        assert verified_cached is verified
+        assert hits >= 1
+        assert tokens_cache.digest(token_pair.access_token) not in tokens_cache
+        assert verified_after_logout is None
+    finally:
+        await redis_cache.delete(session_key(session_uuid))
+
+
+async def test_invalidation_bus_cross_worker_invalidation(redis_cache: RedisCache):
+    """Test that session ended on one worker will:
+     - be dropped from tokens_cache of this worker right away
+     - be dropped from tokens_cache of another worker subscribed to the same channel
+     """
+    channel = f'test_invalidation_bus:{uuid.uuid4()}'
+    buses = [InvalidationBus(redis_cache.redis, channel=channel) for _ in range(2)]
+    tokens_caches = [VerifiedTokensCache(max_size=100, max_ttl_sec=60) for _ in range(2)]
+    session_uuid = str(uuid.uuid4())
+    token_schema = TokenClaims('access', str(uuid.uuid4()), user_data['email'], 0, session_uuid, '127.0.0.1',
+                               'test-useragent', int(time.time()) + 60)
+    for bus, tokens_cache in zip(buses, tokens_caches):
+        bus.subscribe(InvalidationEventsEnum.sessions_ended, tokens_cache.invalidate_sessions)
+        tokens_cache.set_token_schema(b'token_digest', token_schema)
+        await bus.start()
+    try:
+        await asyncio.sleep(0.5)
+        await buses[0].publish(InvalidationEventsEnum.sessions_ended, [session_uuid])
+        is_invalidated_locally = b'token_digest' not in tokens_caches[0]
+        for _ in range(50):
+            if b'token_digest' not in tokens_caches[1]:
+                break
+            await asyncio.sleep(0.1)
+
+        assert is_invalidated_locally
+        assert b'token_digest' not in tokens_caches[1]
+    finally:
+        for bus in buses:
+            await bus.stop()
+
+
+async def test_post_api_v1_auth_logout_all_indexed_and_db_only_sessions(body_status, redis_cache: RedisCache):
+    """Test that route will:
+     - return status 200
+     - revoke in cache and deactivate in db both session indexed in cache and session missing from index
+     - drop user sessions index
+     """
+    user = await create_test_registered_user(user_data)
+    try:
+        form_data = await get_login_form_data(user_data)
+        sessions_uuids = []
+        access_tokens = []
+        for useragent in ('test-useragent-indexed', 'test-useragent-db-only'):
+            headers = await get_login_headers()
+            headers.update({'User-Agent': useragent})
+            body, _ = await body_status(LOGIN_URL, method=MethodsEnum.post, data=form_data, headers=headers)
+            access_tokens.append(body['access_token'])
+            sessions_uuids.append(TokenReadSchema.from_jwt(body['access_token']).session_uuid)
+        # session is active in db and cached, but missing from index
+        await redis_cache.remove_set_members(user_sessions_key(user.uuid), [sessions_uuids[1]])
+        auth_headers = await get_json_headers()
+        auth_headers.update({'Authorization': f'Bearer {access_tokens[0]}', 'User-Agent': 'test-useragent-indexed'})
+        body, status = await body_status(LOGOUT_ALL_URL, method=MethodsEnum.post, headers=auth_headers)
+        sessions_cached = [await redis_cache.get(session_key(session_uuid)) for session_uuid in sessions_uuids]
+        async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
+            sessions_db = [await repo.get(SessionModel, uuid=session_uuid) for session_uuid in sessions_uuids]
+
+        assert status == HTTPStatus.OK
+        assert sessions_cached == [None, None]
+        assert all(session_db.is_active is False for session_db in sessions_db)
+        assert not await redis_cache.redis.exists(user_sessions_key(user.uuid))
+    finally:
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_post_api_v1_auth_login_token_permissions_mask(body_status):
+    """Test that route will return:
+     - access_token with permissions of user roles as pmask claim and without list of permissions names
+     - names of these permissions from /verify-access-token
+     """
+    await create_test_registered_user(user_data)
+    try:
+        headers = await get_login_headers()
+        headers.update({'User-Agent': 'test-useragent', 'X-Forwarded-For': '127.0.0.1'})
+        form_data = await get_login_form_data(user_data)
+        login_body, _ = await body_status(LOGIN_URL, method=MethodsEnum.post, data=form_data, headers=headers)
+        access_token = login_body['access_token']
+        claims = get_token_data(access_token)
+        async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
+            registered_role = await repo.get(RoleModel, name=RolesNamesEnum.registered)
+            permissions_names = [permission.name for permission in registered_role.permissions]
+        verify_data = {'access_token': access_token, 'ip': '127.0.0.1', 'useragent': 'test-useragent'}
+        body, status = await body_status(VERIFY_ACCESS_TOKEN_URL, method=MethodsEnum.post, data=verify_data)
+
+        assert claims['pmask'] == permissions_to_mask(permissions_names)
+        assert 'permissions' not in claims
+        assert status == HTTPStatus.OK
+        assert sorted(body['permissions']) == sorted(permissions_names)
+        assert body['permissions'] == mask_to_permissions(claims['pmask'])
+        assert body['permissions_mask'] == claims['pmask']
+    finally:
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_legacy_token_permissions_names_decoded_to_mask():
+    """Test that token issued before permissions mask, with list of permissions names, will be decoded:
+     - to the same permissions mask as token with pmask claim
+     - to the same permissions names by TokenReadSchema and TokenClaims
+     """
+    permissions_names = [PermissionsNamesEnum.all_of_users, PermissionsNamesEnum.all_of_all]
+    token_pair = await create_token_pair(str(uuid.uuid4()), user_data['email'], permissions_names, str(uuid.uuid4()),
+                                         '127.0.0.1', 'test-useragent')
+    claims = get_token_data(token_pair.access_token)
+    legacy_claims = {key: value for key, value in claims.items() if key != 'pmask'}
+    legacy_claims['permissions'] = [permission_name.value for permission_name in permissions_names]
+
+    token_claims = TokenClaims.from_jwt(token_codec.encode(claims))
+    legacy_token_claims = TokenClaims.from_jwt(token_codec.encode(legacy_claims))
+    legacy_token_schema = TokenReadSchema.from_jwt(token_codec.encode(legacy_claims))
+
+    assert claims['pmask'] == permissions_to_mask(permissions_names)
+    assert legacy_token_claims.permissions_mask == token_claims.permissions_mask == claims['pmask']
+    assert legacy_token_schema.permissions_mask == claims['pmask']
+    assert legacy_token_schema.permissions == legacy_token_claims.permissions == mask_to_permissions(claims['pmask'])
+
+
+async def test_get_api_v1_me_principal_snapshot(body_status, redis_cache: RedisCache):
+    """Test that route will return:
+     - user from principal snapshot cached by the first request
+     - user from db after logout of another session of user and after password change, they drop snapshot
+     """
+    user = await create_test_registered_user(user_data)
+    try:
+        form_data = await get_login_form_data(user_data)
+        access_tokens = []
+        for useragent in ('test-useragent-me', 'test-useragent-logout'):
+            headers = await get_login_headers()
+            headers.update({'User-Agent': useragent})
+            body, _ = await body_status(LOGIN_URL, method=MethodsEnum.post, data=form_data, headers=headers)
+            access_tokens.append(body['access_token'])
+        auth_headers = await get_json_headers()
+        auth_headers.update({'Authorization': f'Bearer {access_tokens[0]}', 'User-Agent': 'test-useragent-me',
+                             'Content-Type': 'application/json'})
+        logout_headers = await get_json_headers()
+        logout_headers.update({'Authorization': f'Bearer {access_tokens[1]}', 'User-Agent': 'test-useragent-logout'})
+
+        await body_status(ME_URL, headers=auth_headers)
+        await set_principal_name(redis_cache, user.uuid, 'Snapshot Name')
+        me_body_snapshot, me_status = await body_status(ME_URL, headers=auth_headers)
+        await body_status(LOGOUT_URL, method=MethodsEnum.post, headers=logout_headers)
+        me_body_after_logout, _ = await body_status(ME_URL, headers=auth_headers)
+        await set_principal_name(redis_cache, user.uuid, 'Snapshot Name')
+        _, password_status = await body_status(UPDATE_PASSWORD_URL, method=MethodsEnum.put,
+                                               data=json.dumps({'password': user_data['password']}),
+                                               headers=auth_headers)
+        me_body_after_password_change, _ = await body_status(ME_URL, headers=auth_headers)
+
+        assert me_status == HTTPStatus.OK
+        assert me_body_snapshot['name'] == 'Snapshot Name'
+        assert me_body_after_logout['name'] == user_data['name']
+        assert password_status == HTTPStatus.OK
+        assert me_body_after_password_change['name'] == user_data['name']
+    finally:
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_principal_snapshot_rebuilt_after_epochs_bump_and_version_race(redis_cache: RedisCache):
+    """Test that principal snapshot will:
+     - be served from cache while it is current
+     - be rebuilt from db after user epoch bump and after epoch bump of role of user
+     - be rebuilt if snapshot built before principal version bump is stored after it (concurrent rebuild)
+     """
+    user = await create_test_registered_user(user_data)
+    epochs = PermissionsEpochs()
+    invalidation_bus = InvalidationBus(redis_cache.redis, channel=f'test_invalidation_{uuid.uuid4().hex}')
+    invalidation_bus.subscribe(InvalidationEventsEnum.role_epoch_bumped, epochs.set_role_epoch)
+    auth_manager = AuthManager(None, redis_cache, permissions_epochs=epochs)
+    try:
+        await redis_cache.delete(principal_key(user.uuid))
+        principal = await auth_manager.get_principal(user.uuid)
+        await set_principal_name(redis_cache, user.uuid, 'Snapshot Name')
+        principal_cached = await auth_manager.get_principal(user.uuid)
+        await epochs.bump_user_epoch(redis_cache, invalidation_bus, user.uuid)
+        principal_after_user_epoch = await auth_manager.get_principal(user.uuid)
+        await set_principal_name(redis_cache, user.uuid, 'Snapshot Name')
+        await epochs.bump_role_epoch(redis_cache, invalidation_bus, principal.roles_uuids[0])
+        principal_after_role_epoch = await auth_manager.get_principal(user.uuid)
+        # snapshot built from state before change is stored by concurrent rebuild after principal version bump
+        await auth_manager.invalidate_principal(user.uuid)
+        await set_principal_name(redis_cache, user.uuid, 'Snapshot Name')
+        principal_after_race = await auth_manager.get_principal(user.uuid)
+
+        assert principal.name == user_data['name']
+        assert principal_cached.name == 'Snapshot Name'
+        assert principal_after_user_epoch.name == user_data['name']
+        assert principal_after_user_epoch.user_epoch > principal.user_epoch
+        assert principal_after_role_epoch.name == user_data['name']
+        assert principal_after_role_epoch.role_epochs[principal.roles_uuids[0]] > \
+            principal.role_epochs[principal.roles_uuids[0]]
+        assert principal_after_race.name == user_data['name']
+        assert principal_after_race.principal_version > principal_after_role_epoch.principal_version
+    finally:
+        await redis_cache.delete(principal_key(user.uuid))
+        await delete_user_by_email(email=user_data['email'])
+
+
+async def test_refresh_losing_rotation_to_concurrent_revoke(redis_cache: RedisCache, monkeypatch):
+    """Test that refresh will:
+     - raise 401 if refresh token was verified, but session was revoked before its rotation (rotation lost)
+     - raise 401 for refresh token rotated before grace window
+     """
+    auth_manager = AuthManager(None, redis_cache, tokens_cache=VerifiedTokensCache(max_size=100, max_ttl_sec=60),
+                               permissions_epochs=PermissionsEpochs(),
+                               revoked_sessions=RevokedSessionsCache(max_size=100, max_ttl_sec=60))
+    session_uuid = str(uuid.uuid4())
+    session_keys = [session_key(session_uuid), oauth_token_key(session_uuid), rotated_refresh_token_key(session_uuid)]
+    session_from_request = SessionFingerprint('test-useragent', '127.0.0.1')
+    token_pair = await create_token_pair(str(uuid.uuid4()), user_data['email'], [], session_uuid,
+                                         session_from_request.ip, session_from_request.useragent, role_epochs={})
+    await redis_cache.set(session_key(session_uuid), get_token_digest(token_pair.refresh_token), ex=60)
+    rotate_refresh_token = redis_cache.rotate_refresh_token
+
+    async def rotate_refresh_token_after_revoke(*args, **kwargs):
+        # concurrent logout ends session between verification and rotation
+        await redis_cache.revoke_sessions(session_keys[:1], session_keys[1:])
+        return await rotate_refresh_token(*args, **kwargs)
+
+    try:
+        # tokens created within the same second are the same
+        await asyncio.sleep(1)
+        new_token_pair = await auth_manager.refresh(token_pair.refresh_token, session_from_request)
+        # grace window of rotated refresh token is over
+        await redis_cache.delete(rotated_refresh_token_key(session_uuid))
+        with pytest.raises(UnauthorizedException):
+            await auth_manager.refresh(token_pair.refresh_token, session_from_request)
+        monkeypatch.setattr(redis_cache, 'rotate_refresh_token', rotate_refresh_token_after_revoke)
+        with pytest.raises(UnauthorizedException):
+            await auth_manager.refresh(new_token_pair.refresh_token, session_from_request)
+
+        assert await redis_cache.get(session_key(session_uuid)) is None
+    finally:
+        await redis_cache.delete_many(session_keys)
@@ -0,0 +1,137 @@
+import asyncio
+import datetime as dt
+import uuid
+
+import pytest
+from redis.asyncio import Redis, RedisCluster
+from redis.asyncio.sentinel import SentinelConnectionPool
+from redis.exceptions import RedisError
+
+from core.config import settings
+from core.enums import RedisModesEnum
+from services.cache.cache import RedisCache
+from services.cache.keys import oauth_token_key, opaque_token_key, rotated_refresh_token_key, session_key
+from services.cache.redis_factory import create_pubsub_redis, create_redis, parse_sentinels
+from services.jwt_manager.jwt_manager import get_token_digest
+
+pytestmark = pytest.mark.asyncio
+
+EX = dt.timedelta(minutes=1)
+GRACE_SEC = 10
+
+
+async def rotate(redis_cache: RedisCache, session_uuid: str, old_refresh_token: str, new_refresh_token: str):
+    return await redis_cache.rotate_refresh_token(session_key(session_uuid), get_token_digest(old_refresh_token),
+                                                  get_token_digest(new_refresh_token), EX,
+                                                  oauth_token_key(session_uuid),
+                                                  rotated_refresh_token_key(session_uuid), new_refresh_token, GRACE_SEC)
+
+
+async def test_rotate_refresh_token_concurrent_rotation(redis_cache: RedisCache):
+    """Test that rotation script will:
+     - rotate refresh token of session only once for concurrent rotations of the same refresh token
+     - return token pair of the winner to the loser within grace window
+     - not rotate (False) refresh token which was rotated before grace window or of revoked session
+     """
+    session_uuid = str(uuid.uuid4())
+    keys = [session_key(session_uuid), oauth_token_key(session_uuid), rotated_refresh_token_key(session_uuid)]
+    await redis_cache.set(session_key(session_uuid), get_token_digest('refresh_token'), ex=EX)
+    try:
+        results = await asyncio.gather(rotate(redis_cache, session_uuid, 'refresh_token', 'refresh_token_1'),
+                                       rotate(redis_cache, session_uuid, 'refresh_token', 'refresh_token_2'))
+        winner = 'refresh_token_1' if results[0] is True else 'refresh_token_2'
+        refresh_token_digest_cached = await redis_cache.get(session_key(session_uuid))
+        # grace window of rotated refresh token is over
+        await redis_cache.delete(rotated_refresh_token_key(session_uuid))
+        rotated_after_grace = await rotate(redis_cache, session_uuid, 'refresh_token', 'refresh_token_3')
+        await redis_cache.revoke_sessions([session_key(session_uuid)], keys[1:])
+        rotated_after_revoke = await rotate(redis_cache, session_uuid, winner, 'refresh_token_4')
+
+        assert sorted(results, key=lambda result: result is True) == [winner.encode('utf-8'), True]
+        assert refresh_token_digest_cached == get_token_digest(winner)
+        assert rotated_after_grace is False
+        assert rotated_after_revoke is False
+    finally:
+        await redis_cache.delete_many(keys)
+
+
+async def test_revoke_sessions(redis_cache: RedisCache):
+    """Test that revoke script will:
+     - delete cached sessions and other keys of sessions with one call, return number of cached sessions
+     - unlink keys of opaque refresh tokens of revoked sessions by their digests
+     - not touch keys of other sessions
+     """
+    sessions_uuids = [str(uuid.uuid4()) for _ in range(3)]
+    refresh_tokens_digests = [get_token_digest(session_uuid) for session_uuid in sessions_uuids]
+    # the last session isn't cached
+    for session_uuid, refresh_token_digest in zip(sessions_uuids[:2], refresh_tokens_digests):
+        await redis_cache.set_many({session_key(session_uuid): refresh_token_digest,
+                                    oauth_token_key(session_uuid): 'oauth_token',
+                                    opaque_token_key(refresh_token_digest.hex()): 'claims'}, ex=EX)
+    other_session_uuid = str(uuid.uuid4())
+    await redis_cache.set(session_key(other_session_uuid), get_token_digest(other_session_uuid), ex=EX)
+    keys = [*map(session_key, sessions_uuids), *map(oauth_token_key, sessions_uuids),
+            *[opaque_token_key(refresh_token_digest.hex()) for refresh_token_digest in refresh_tokens_digests]]
+    try:
+        revoked = await redis_cache.revoke_sessions(list(map(session_key, sessions_uuids)),
+                                                    list(map(oauth_token_key, sessions_uuids)),
+                                                    opaque_keys_prefix=opaque_token_key(''))
+
+        assert revoked == 2
+        assert await redis_cache.get_many(keys) == [None] * len(keys)
+        assert await redis_cache.get(session_key(other_session_uuid)) == get_token_digest(other_session_uuid)
+    finally:
+        await redis_cache.delete_many([*keys, session_key(other_session_uuid)])
+
+
+async def test_set_many_delete_many_pipeline(redis_cache: RedisCache):
+    """Test that cache will:
+     - set many keys with ttl and delete many keys with one round trip each
+     - execute commands queued to pipeline on exit, and raise if they failed
+     """
+    keys = [f'test_cache:{uuid.uuid4().hex}' for _ in range(3)]
+    try:
+        await redis_cache.set_many({key: key for key in keys[:2]}, ex=EX)
+        values = await redis_cache.get_many(keys)
+        ttls = [await redis_cache.redis.ttl(key) for key in keys[:2]]
+        await redis_cache.delete_many(keys[:2])
+        values_deleted = await redis_cache.get_many(keys)
+        async with redis_cache.pipeline(transaction=True) as pipe:
+            pipe.set(keys[2], 'value')
+            pipe.expire(keys[2], EX)
+        value_piped = await redis_cache.get(keys[2])
+        with pytest.raises(RedisError):
+            async with redis_cache.pipeline() as pipe:
+                pipe.incr(keys[2])
+
+        assert values == [key.encode('utf-8') for key in keys[:2]] + [None]
+        assert all(0 < ttl <= EX.total_seconds() for ttl in ttls)
+        assert values_deleted == [None] * len(keys)
+        assert value_piped == b'value'
+    finally:
+        await redis_cache.delete_many(keys)
+
+
+async def test_create_redis_mode_selection(monkeypatch):
+    """Test that redis factory will create client of REDIS_MODE:
+     - standalone: Redis, also used for pub/sub
+     - cluster: RedisCluster, pub/sub goes to separate Redis of one node
+     - sentinel: Redis of sentinel master pool, REDIS_SENTINELS is required
+     """
+    monkeypatch.setattr(settings, 'REDIS_MODE', RedisModesEnum.standalone)
+    standalone = create_redis()
+    monkeypatch.setattr(settings, 'REDIS_MODE', RedisModesEnum.cluster)
+    cluster = create_redis()
+    monkeypatch.setattr(settings, 'REDIS_MODE', RedisModesEnum.sentinel)
+    monkeypatch.setattr(settings, 'REDIS_SENTINELS', 'sentinel-1:26379, sentinel-2:26380')
+    sentinel = create_redis()
+    monkeypatch.setattr(settings, 'REDIS_SENTINELS', None)
+
+    assert type(standalone) is Redis
+    assert create_pubsub_redis(standalone) is standalone
+    assert isinstance(cluster, RedisCluster)
+    assert type(create_pubsub_redis(cluster)) is Redis
+    assert isinstance(sentinel.connection_pool, SentinelConnectionPool)
+    assert parse_sentinels('sentinel-1:26379, sentinel-2:26380') == [('sentinel-1', 26379), ('sentinel-2', 26380)]
+    with pytest.raises(ValueError):
+        create_redis()
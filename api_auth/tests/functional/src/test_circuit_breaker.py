@@ -0,0 +1,116 @@
+import random
+
+import pytest
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError
+
+from core.enums import CircuitBreakerStatesEnum
+from services.cache.circuit_breaker import CircuitBreaker, CircuitOpenError
+from services.cache.keys import session_key
+from services.cache.near_cache import NearCache, NearCachePolicy
+
+pytestmark = pytest.mark.asyncio
+
+FAILURE_THRESHOLD = 3
+OPEN_SEC = 5
+RECOVERY_SEC = 10
+
+
+async def ok():
+    return 'ok'
+
+
+async def fail():
+    raise ConnectionError('redis is unavailable')
+
+
+def get_breaker() -> CircuitBreaker:
+    return CircuitBreaker(failure_threshold=FAILURE_THRESHOLD, open_sec=OPEN_SEC, recovery_sec=RECOVERY_SEC,
+                          call_timeout_sec=1)
+
+
+def get_allowed_share(breaker: CircuitBreaker, in_state_sec: float, calls: int = 10_000) -> float:
+    breaker.state = CircuitBreakerStatesEnum.half_open
+    breaker.state_changed_at -= in_state_sec
+    allowed = 0
+    for _ in range(calls):
+        allowed += breaker.allow()
+    return allowed / calls
+
+
+async def test_circuit_breaker_opens_after_failure_threshold():
+    """Test that circuit breaker will:
+     - stay closed before failure_threshold consecutive failures, success resets failures
+     - open after failure_threshold consecutive failures and reject calls without making them
+     """
+    breaker = get_breaker()
+    for _ in range(FAILURE_THRESHOLD - 1):
+        with pytest.raises(ConnectionError):
+            await breaker.call(fail())
+    assert await breaker.call(ok()) == 'ok'
+    for _ in range(FAILURE_THRESHOLD - 1):
+        with pytest.raises(ConnectionError):
+            await breaker.call(fail())
+    assert breaker.state == CircuitBreakerStatesEnum.closed
+
+    with pytest.raises(ConnectionError):
+        await breaker.call(fail())
+    coroutine = ok()
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(coroutine)
+
+    assert breaker.state == CircuitBreakerStatesEnum.open
+    assert breaker.rejected == 1
+    assert coroutine.cr_frame is None
+    assert breaker.transitions == {'closed->open': 1}
+
+
+async def test_circuit_breaker_half_open_failure_opens_it_again(monkeypatch):
+    """Test that circuit breaker will:
+     - be half-open after open_sec
+     - open again on the first failure of half-open state
+     """
+    breaker = get_breaker()
+    breaker._set_state(CircuitBreakerStatesEnum.open)
+    breaker.state_changed_at -= OPEN_SEC
+    breaker.allow()
+    assert breaker.state == CircuitBreakerStatesEnum.half_open
+    breaker.state_changed_at -= RECOVERY_SEC / 2
+    monkeypatch.setattr(random, 'random', lambda: 0.0)
+
+    with pytest.raises(ConnectionError):
+        await breaker.call(fail())
+
+    assert breaker.state == CircuitBreakerStatesEnum.open
+    assert breaker.transitions == {'closed->open': 1, 'open->half_open': 1, 'half_open->open': 1}
+
+
+async def test_circuit_breaker_half_open_recovers_gradually():
+    """Test that circuit breaker will:
+     - let through share of calls growing with time spent half-open
+     - be closed after recovery_sec and let through every call
+     """
+    random.seed(0)
+    early_share = get_allowed_share(get_breaker(), RECOVERY_SEC * 0.2)
+    late_share = get_allowed_share(get_breaker(), RECOVERY_SEC * 0.8)
+    breaker = get_breaker()
+    closed_share = get_allowed_share(breaker, RECOVERY_SEC)
+
+    assert 0.15 < early_share < 0.25
+    assert 0.75 < late_share < 0.85
+    assert closed_share == 1
+    assert breaker.state == CircuitBreakerStatesEnum.closed
+
+
+async def test_near_cache_verify_sessions_redis_unavailable():
+    """Test that near cache will:
+     - return None flags (not False) for sessions which can't be checked while redis is unavailable
+     """
+    near_cache = NearCache(Redis(host='localhost', port=1), [NearCachePolicy('session:', 100, 2 ** 20, 60)])
+    near_cache.breaker = get_breaker()
+    near_cache.is_tracking = True
+
+    flags, data = await near_cache.verify_sessions([(session_key('session_uuid'), '')], ['key'])
+
+    assert flags == [None]
+    assert data == [None]
@@ -0,0 +1,55 @@
+import asyncio
+import uuid
+
+import pytest
+
+from services.cache.cache import RedisCache
+from services.cache.near_cache import NearCache, NearCachePolicy
+
+pytestmark = pytest.mark.asyncio
+
+PREFIX = 'test_near_cache:'
+WAIT_SEC = 2
+
+
+async def wait_for(condition) -> bool:
+    for _ in range(int(WAIT_SEC / 0.05)):
+        if condition():
+            return True
+        await asyncio.sleep(0.05)
+    return condition()
+
+
+async def test_near_cache_evicted_by_writes_of_other_clients(redis_cache: RedisCache):
+    """Test that near cache will:
+     - serve tracked key from its tier after the first read
+     - drop key from its tier when it is changed or deleted in redis by another client (CLIENT TRACKING),
+       and read new value from redis
+     """
+    near_cache = NearCache(redis_cache.redis, [NearCachePolicy(PREFIX, 100, 2 ** 20, 60)])
+    key = f'{PREFIX}{uuid.uuid4().hex}'
+    tier = near_cache.tiers[PREFIX]
+    await near_cache.start()
+    try:
+        assert await wait_for(lambda: near_cache.is_tracking)
+        await redis_cache.set(key, 'value', ex=60)
+        value = await near_cache.get(key)
+        is_cached = tier.get(key) == (b'value',)
+
+        await redis_cache.set(key, 'value_changed', ex=60)
+        is_evicted_after_set = await wait_for(lambda: tier.get(key) is None)
+        value_changed = await near_cache.get(key)
+
+        await redis_cache.delete(key)
+        is_evicted_after_delete = await wait_for(lambda: tier.get(key) is None)
+        value_deleted = await near_cache.get(key)
+
+        assert value == b'value'
+        assert is_cached
+        assert is_evicted_after_set
+        assert value_changed == b'value_changed'
+        assert is_evicted_after_delete
+        assert value_deleted is None
+    finally:
+        await near_cache.stop()
+        await redis_cache.delete(key)
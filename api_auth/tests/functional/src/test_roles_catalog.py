@@ -0,0 +1,104 @@
+import uuid
+
+import pytest
+
+from core.enums import InvalidationEventsEnum, RolesNamesEnum
+from db import SessionLocalAsync
+from db.models.role import RoleModel
+from db.repository import SqlAlchemyRepositoryAsync
+from services.cache.invalidation_bus import InvalidationBus
+from services.cache.roles_catalog import RolesCatalog
+
+pytestmark = pytest.mark.asyncio
+
+MAX_AGE_SEC = 60
+
+
+async def create_role(name: str) -> RoleModel:
+    async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
+        role = RoleModel(name=name)
+        repo.session.add(role)
+        await repo.session.commit()
+        await repo.session.refresh(role)
+        return role
+
+
+async def delete_role(name: str) -> None:
+    async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
+        role = await repo.get(RoleModel, name=name)
+        if role is not None:
+            await repo.remove(RoleModel, role.uuid)
+
+
+async def test_roles_catalog_load():
+    """Test that roles catalog will:
+     - have roles and permissions of db by uuid and by name after load
+     - be fresh after load, ensure_fresh of fresh catalog doesn't reload it
+     """
+    catalog = RolesCatalog(max_age_sec=MAX_AGE_SEC)
+    assert not catalog.is_fresh()
+
+    await catalog.ensure_fresh()
+    await catalog.ensure_fresh()
+
+    async with SqlAlchemyRepositoryAsync(SessionLocalAsync()) as repo:
+        registered_role = await repo.get(RoleModel, name=RolesNamesEnum.registered)
+        permissions_uuids = {permission.uuid for permission in registered_role.permissions}
+    role = catalog.get_role_by_name(RolesNamesEnum.registered)
+    assert role.uuid == registered_role.uuid
+    assert catalog.get_role(registered_role.uuid) is role
+    assert set(role.permissions_uuids) == permissions_uuids
+    assert all(catalog.get_permission(permission_uuid) is not None for permission_uuid in permissions_uuids)
+    assert catalog.is_fresh()
+    assert catalog.loads == 1
+
+
+async def test_roles_catalog_reloads_on_role_miss():
+    """Test that roles catalog will:
+     - reload once when role by name is missing (role could be created after load), e.g. on register
+     - return None without further reloads if role is missing after reload
+     """
+    role_name = f'test_{uuid.uuid4().hex[:10]}'
+    catalog = RolesCatalog(max_age_sec=MAX_AGE_SEC)
+    await catalog.load()
+    assert catalog.get_role_by_name(role_name) is None
+
+    role = await create_role(role_name)
+    try:
+        loaded_role = await catalog.load_role_by_name(role_name)
+        assert loaded_role.uuid == role.uuid
+        assert catalog.loads == 2
+
+        assert await catalog.load_role_by_name(role_name) is loaded_role
+        assert catalog.loads == 2
+    finally:
+        await delete_role(role_name)
+
+    catalog.invalidate()
+    assert await catalog.load_role_by_name(role_name) is None
+    assert catalog.loads == 4
+
+
+async def test_roles_catalog_stale_after_max_age_and_events(redis_cache):
+    """Test that roles catalog will:
+     - be stale after max_age_sec (roles changed bypassing api) and reload on ensure_fresh
+     - be stale after roles_updated / roles_deleted / reset events, not after role_epoch_bumped
+     """
+    catalog = RolesCatalog(max_age_sec=MAX_AGE_SEC)
+    await catalog.load()
+    catalog.loaded_at -= MAX_AGE_SEC
+    assert not catalog.is_fresh()
+    await catalog.ensure_fresh()
+    assert catalog.is_fresh()
+    assert catalog.loads == 2
+
+    invalidation_bus = InvalidationBus(redis_cache.redis, channel=f'test_invalidation_{uuid.uuid4().hex}')
+    catalog.subscribe(invalidation_bus)
+    await invalidation_bus.publish(InvalidationEventsEnum.role_epoch_bumped, ['role_uuid', '1'])
+    assert catalog.is_fresh()
+    for event_type in (InvalidationEventsEnum.roles_updated,
+                       InvalidationEventsEnum.roles_deleted,
+                       InvalidationEventsEnum.reset):
+        await catalog.ensure_fresh()
+        await invalidation_bus.publish(event_type, ['role_uuid'])
+        assert not catalog.is_fresh()
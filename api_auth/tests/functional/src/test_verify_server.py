@@ -0,0 +1,117 @@
+import asyncio
+import os
+import tempfile
+import uuid
+
+import msgpack
+import pytest
+
+from core import config
+from db.serializers.session import SessionFingerprint
+from services.auth_manager.auth_manager import AuthManager
+from services.cache.cache import RedisCache
+from services.cache.keys import session_key
+from services.cache.local_cache import RevokedSessionsCache, VerifiedTokensCache
+from services.cache.permissions_epochs import PermissionsEpochs
+from services.jwt_manager.jwt_manager import create_token_pair, get_token_digest
+from services.verify_server.verify_server import FRAME_HEADER, VerifyServer, encode_frame
+from tests.functional.src.helpers_users import user_data
+
+pytestmark = pytest.mark.asyncio
+
+SESSION_FROM_REQUEST = SessionFingerprint('test-useragent', '127.0.0.1')
+
+
+def get_auth_manager(redis_cache: RedisCache) -> AuthManager:
+    return AuthManager(None, redis_cache, tokens_cache=VerifiedTokensCache(max_size=100, max_ttl_sec=60),
+                       permissions_epochs=PermissionsEpochs(),
+                       revoked_sessions=RevokedSessionsCache(max_size=100, max_ttl_sec=60))
+
+
+def get_socket_path() -> str:
+    # unix socket path length is limited
+    return os.path.join(tempfile.gettempdir(), f'test_verify_{uuid.uuid4().hex[:8]}.sock')
+
+
+async def read_frame(reader: asyncio.StreamReader):
+    length, = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return msgpack.unpackb(await reader.readexactly(length))
+
+
+async def test_verify_server_pipelined_batches(redis_cache: RedisCache):
+    """Test that verify server will:
+     - answer every length-prefixed msgpack request with the same request_id
+     - answer verified access token with its claims, refresh and invalid token with None
+     - verify requests sent in one write as one batch and requests sent in separate writes
+     - not be served by another worker while socket is served, socket is removed on stop
+     """
+    session_uuid = str(uuid.uuid4())
+    token_pair = await create_token_pair(str(uuid.uuid4()), user_data['email'], [], session_uuid,
+                                         SESSION_FROM_REQUEST.ip, SESSION_FROM_REQUEST.useragent)
+    await redis_cache.set(session_key(session_uuid), get_token_digest(token_pair.refresh_token), ex=60)
+    path = get_socket_path()
+    server = VerifyServer(get_auth_manager(redis_cache), path)
+    other_worker_server = VerifyServer(get_auth_manager(redis_cache), path)
+    await server.start()
+    await other_worker_server.start()
+    writer = None
+    try:
+        reader, writer = await asyncio.open_unix_connection(path)
+        tokens = [token_pair.access_token, token_pair.refresh_token, 'invalid_access_token']
+        # the first batch in one write, the second one frame by frame
+        writer.write(b''.join(encode_frame([request_id, token, SESSION_FROM_REQUEST.ip,
+                                            SESSION_FROM_REQUEST.useragent])
+                              for request_id, token in enumerate(tokens)))
+        await writer.drain()
+        responses = dict([await read_frame(reader) for _ in tokens])
+        for request_id, token in enumerate(tokens, start=len(tokens)):
+            writer.write(encode_frame([request_id, token, SESSION_FROM_REQUEST.ip, SESSION_FROM_REQUEST.useragent]))
+            await writer.drain()
+            responses.update([await read_frame(reader)])
+
+        assert other_worker_server._server is None
+        assert sorted(responses) == list(range(2 * len(tokens)))
+        for request_id in (0, len(tokens)):
+            assert responses[request_id]['session_uuid'] == session_uuid
+            assert responses[request_id]['email'] == user_data['email']
+            assert responses[request_id]['pmask'] == 0
+        assert [responses[request_id] for request_id in (1, 2, len(tokens) + 1, len(tokens) + 2)] == [None] * 4
+    finally:
+        if writer is not None:
+            writer.close()
+        await other_worker_server.stop()
+        await server.stop()
+        await redis_cache.delete(session_key(session_uuid))
+    assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize('frame', [
+    FRAME_HEADER.pack(config.VERIFY_SERVER_MAX_FRAME_BYTES + 1),
+    encode_frame([0, 'access_token']),
+    FRAME_HEADER.pack(3) + b'\xc1\xc1\xc1',
+])
+async def test_verify_server_closes_connection_on_bad_frame(redis_cache: RedisCache, frame: bytes):
+    """Test that verify server will:
+     - close connection on frame exceeding max frame size, on request of wrong shape and on malformed msgpack
+     - keep serving other connections
+     """
+    path = get_socket_path()
+    server = VerifyServer(get_auth_manager(redis_cache), path)
+    await server.start()
+    try:
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(frame)
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), timeout=1)
+        writer.close()
+        other_reader, other_writer = await asyncio.open_unix_connection(path)
+        other_writer.write(encode_frame([0, 'invalid_access_token', SESSION_FROM_REQUEST.ip,
+                                         SESSION_FROM_REQUEST.useragent]))
+        await other_writer.drain()
+        other_response = await asyncio.wait_for(read_frame(other_reader), timeout=1)
+        other_writer.close()
+
+        assert data == b''
+        assert other_response == [0, None]
+    finally:
+        await server.stop()